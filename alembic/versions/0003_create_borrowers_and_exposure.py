@@ -0,0 +1,58 @@
+"""create borrowers and borrower_exposure tables
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+payment_status = postgresql.ENUM('pending', 'paid', 'failed', 'overdue', name='paymentstatus')
+
+
+def upgrade() -> None:
+    op.create_table(
+        'borrowers',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('phone', sa.String(), nullable=True),
+        sa.Column('address', sa.String(), nullable=True),
+        sa.Column('credit_score', sa.Integer(), nullable=True),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+    op.create_index('ix_borrowers_email', 'borrowers', ['email'], unique=True)
+
+    payment_status.create(op.get_bind(), checkfirst=True)
+    op.create_table(
+        'borrower_exposure',
+        sa.Column(
+            'borrower_id',
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey('borrowers.id', ondelete='CASCADE'),
+            primary_key=True,
+        ),
+        sa.Column('outstanding_amount', sa.Numeric(14, 2), nullable=False, server_default='0'),
+        sa.Column('active_loan_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column(
+            'worst_payment_status',
+            postgresql.ENUM(name='paymentstatus', create_type=False),
+            nullable=True,
+        ),
+        sa.Column('updated_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('borrower_exposure')
+    op.drop_index('ix_borrowers_email', table_name='borrowers')
+    op.drop_table('borrowers')
+    payment_status.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,39 @@
+"""create origination_rollups table and BRIN index on loans.created_at
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_loans_created_at_brin', 'loans', ['created_at'], postgresql_using='brin'
+    )
+    op.create_table(
+        'origination_rollups',
+        sa.Column('granularity', sa.String(8), primary_key=True),
+        sa.Column('period_start', postgresql.TIMESTAMP(timezone=True), primary_key=True),
+        sa.Column('status', sa.String(16), primary_key=True),
+        sa.Column('currency', sa.String(3), primary_key=True),
+        sa.Column('loan_count', sa.Integer(), nullable=False),
+        sa.Column('total_amount', sa.Numeric(16, 2), nullable=False),
+        sa.Column('p50_amount', sa.Numeric(12, 2), nullable=True),
+        sa.Column('p90_amount', sa.Numeric(12, 2), nullable=True),
+        sa.Column('p99_amount', sa.Numeric(12, 2), nullable=True),
+        sa.Column('computed_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('origination_rollups')
+    op.drop_index('ix_loans_created_at_brin', table_name='loans')
@@ -0,0 +1,143 @@
+"""range partition loans and payments by month of created_at
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 00:00:00
+
+``loans`` is rebuilt as a partitioned table: the existing table is renamed,
+monthly partitions are created from the month of its oldest row up to three
+months ahead, rows are copied over and the old table is dropped. The copy holds
+an exclusive lock on ``loans`` for its duration, so run it in a maintenance
+window. ``payments`` is created partitioned from the start. Afterwards
+``scripts/create_partitions.py`` keeps creating partitions ahead of time.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+LOAN_COLUMNS = (
+    'id, borrower_id, amount, currency, status, term_months, interest_rate_apr, created_at, updated_at'
+)
+
+# Creates <table>_pYYYYMM partitions from the month of ``start`` (a timestamptz
+# expression) to three months after the current one.
+CREATE_MONTHLY_PARTITIONS = """
+DO $$
+DECLARE
+    month timestamp := date_trunc('month', coalesce(({start}), now()) AT TIME ZONE 'UTC');
+    last timestamp := date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months';
+BEGIN
+    WHILE month <= last LOOP
+        EXECUTE 'CREATE TABLE IF NOT EXISTS '
+            || quote_ident('{table}_p' || to_char(month, 'YYYYMM'))
+            || ' PARTITION OF {table} FOR VALUES FROM ('
+            || quote_literal(month::text || '+00') || ') TO ('
+            || quote_literal((month + interval '1 month')::text || '+00') || ')';
+        month := month + interval '1 month';
+    END LOOP;
+END $$
+"""
+
+
+def _create_partitions(table: str, start: str = 'NULL') -> None:
+    op.execute(CREATE_MONTHLY_PARTITIONS.format(table=table, start=start))
+    op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+
+def upgrade() -> None:
+    op.drop_index('ix_loans_created_at_brin', table_name='loans')
+    op.rename_table('loans', 'loans_unpartitioned')
+    op.execute('ALTER TABLE loans_unpartitioned RENAME CONSTRAINT loans_pkey TO loans_unpartitioned_pkey')
+
+    op.create_table(
+        'loans',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('borrower_id', sa.String(), nullable=False),
+        sa.Column('amount', sa.Numeric(12, 2), nullable=False),
+        sa.Column('currency', sa.String(3), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('term_months', sa.Integer(), nullable=True),
+        sa.Column('interest_rate_apr', sa.Numeric(5, 2), nullable=True),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id', 'created_at', name='loans_pkey'),
+        sa.CheckConstraint("amount > 0 AND amount <= 50000", name="chk_amount_range"),
+        sa.CheckConstraint("status IN ('pending','approved','rejected','disbursed','repaid','defaulted')", name="chk_status_enum"),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+    _create_partitions('loans', start='SELECT min(created_at) FROM loans_unpartitioned')
+    op.execute(f'INSERT INTO loans ({LOAN_COLUMNS}) SELECT {LOAN_COLUMNS} FROM loans_unpartitioned')
+    op.drop_table('loans_unpartitioned')
+    op.create_index(
+        'ix_loans_created_at_brin', 'loans', ['created_at'], postgresql_using='brin'
+    )
+
+    op.create_table(
+        'payments',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        # No foreign key: loans can only be referenced by (id, created_at).
+        sa.Column('loan_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('amount', sa.Numeric(12, 2), nullable=False),
+        sa.Column(
+            'status',
+            postgresql.ENUM(name='paymentstatus', create_type=False),
+            nullable=False,
+        ),
+        sa.Column('due_date', postgresql.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('paid_amount', sa.Numeric(12, 2), nullable=True),
+        sa.Column('paid_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('transaction_reference', sa.String(), nullable=True),
+        sa.Column('notes', sa.String(), nullable=True),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id', 'created_at', name='payments_pkey'),
+        sa.CheckConstraint("amount > 0", name="chk_payment_amount_positive"),
+        sa.CheckConstraint(
+            "(status = 'paid' AND paid_amount IS NOT NULL AND paid_at IS NOT NULL) OR "
+            "(status != 'paid' AND paid_amount IS NULL AND paid_at IS NULL)",
+            name="chk_payment_status_consistency",
+        ),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+    _create_partitions('payments')
+    op.create_index('ix_payments_loan_id', 'payments', ['loan_id'])
+    op.create_index(
+        'uq_payments_transaction_reference',
+        'payments',
+        ['transaction_reference', 'created_at'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('payments')
+
+    op.drop_index('ix_loans_created_at_brin', table_name='loans')
+    op.rename_table('loans', 'loans_partitioned')
+    op.execute('ALTER TABLE loans_partitioned RENAME CONSTRAINT loans_pkey TO loans_partitioned_pkey')
+    op.create_table(
+        'loans',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('borrower_id', sa.String(), nullable=False),
+        sa.Column('amount', sa.Numeric(12, 2), nullable=False),
+        sa.Column('currency', sa.String(3), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('term_months', sa.Integer(), nullable=True),
+        sa.Column('interest_rate_apr', sa.Numeric(5, 2), nullable=True),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.CheckConstraint("amount > 0 AND amount <= 50000", name="chk_amount_range"),
+        sa.CheckConstraint("status IN ('pending','approved','rejected','disbursed','repaid','defaulted')", name="chk_status_enum"),
+    )
+    op.execute(f'INSERT INTO loans ({LOAN_COLUMNS}) SELECT {LOAN_COLUMNS} FROM loans_partitioned')
+    # Dropping the parent drops its partitions
+    op.drop_table('loans_partitioned')
+    op.create_index(
+        'ix_loans_created_at_brin', 'loans', ['created_at'], postgresql_using='brin'
+    )
@@ -0,0 +1,40 @@
+"""create payment_references table for repayment import deduplication
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 00:00:00
+
+``payments`` is partitioned by ``created_at``, so its unique index on
+``transaction_reference`` includes the partition key and cannot reject a
+reference imported in another month. This table holds every imported
+reference once.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'payment_references',
+        sa.Column('transaction_reference', sa.String(), primary_key=True),
+        sa.Column('payment_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('imported_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+    # Backfill references of payments that already exist
+    op.execute(
+        "INSERT INTO payment_references (transaction_reference, payment_id, imported_at) "
+        "SELECT DISTINCT ON (transaction_reference) transaction_reference, id, created_at "
+        "FROM payments WHERE transaction_reference IS NOT NULL "
+        "ORDER BY transaction_reference, created_at"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('payment_references')
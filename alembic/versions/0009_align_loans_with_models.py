@@ -0,0 +1,124 @@
+"""align loans with the models, online
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 00:00:00
+
+Brings ``loans`` in line with ``app.models.Loan`` without blocking writes for
+longer than metadata changes take (see app.migrations):
+
+- adds ``purpose``, ``disbursement_date`` and ``due_date``;
+- converts ``borrower_id`` from varchar to uuid, indexed and referencing
+  ``borrowers``, and ``status`` from varchar plus ``chk_status_enum`` to the
+  ``loanstatus`` enum. Each is written to a new column kept in sync by a
+  trigger, backfilled in resumable batches, and swapped in by renaming;
+- adds the ``chk_term_positive`` and ``chk_interest_non_negative`` checks.
+
+The migration commits step by step and can be re-run after an interruption.
+Row-level triggers on partitioned tables need PostgreSQL 13 or later. Every
+``borrower_id`` must be the id of an existing borrower, otherwise validating
+the foreign key fails. The downgrade rewrites the table and is not online.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app import migrations
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+LOAN_STATUSES = ('pending', 'approved', 'rejected', 'disbursed', 'repaid', 'defaulted')
+
+SYNC_FUNCTION = """
+CREATE OR REPLACE FUNCTION loans_sync_converted_columns() RETURNS trigger AS $$
+BEGIN
+    NEW.borrower_uuid := NEW.borrower_id::uuid;
+    NEW.status_enum := NEW.status::loanstatus;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    migrations.execute(
+        'ALTER TABLE loans ADD COLUMN IF NOT EXISTS purpose VARCHAR',
+        'ALTER TABLE loans ADD COLUMN IF NOT EXISTS disbursement_date TIMESTAMP WITH TIME ZONE',
+        'ALTER TABLE loans ADD COLUMN IF NOT EXISTS due_date TIMESTAMP WITH TIME ZONE',
+    )
+
+    if _column_type('loans', 'borrower_id') != 'uuid':
+        _convert_columns()
+    migrations.add_check_constraint('loans', 'chk_term_positive', 'term_months > 0')
+    migrations.add_check_constraint('loans', 'chk_interest_non_negative', 'interest_rate_apr >= 0')
+
+
+def _column_type(table: str, column: str) -> str:
+    return op.get_bind().execute(
+        sa.text(
+            'SELECT data_type FROM information_schema.columns '
+            'WHERE table_name = :table AND column_name = :column'
+        ),
+        {'table': table, 'column': column},
+    ).scalar()
+
+
+def _convert_columns() -> None:
+    postgresql.ENUM(*LOAN_STATUSES, name='loanstatus').create(op.get_bind(), checkfirst=True)
+    migrations.execute(
+        'ALTER TABLE loans ADD COLUMN IF NOT EXISTS borrower_uuid UUID',
+        'ALTER TABLE loans ADD COLUMN IF NOT EXISTS status_enum loanstatus',
+        SYNC_FUNCTION,
+        'DROP TRIGGER IF EXISTS loans_sync_converted_columns ON loans',
+        'CREATE TRIGGER loans_sync_converted_columns BEFORE INSERT OR UPDATE OF borrower_id, status '
+        'ON loans FOR EACH ROW EXECUTE FUNCTION loans_sync_converted_columns()',
+    )
+    migrations.backfill(
+        '0009_loans_borrower_uuid_status_enum',
+        'loans',
+        'borrower_uuid = borrower_id::uuid, status_enum = status::loanstatus',
+        where='borrower_uuid IS NULL OR status_enum IS NULL',
+    )
+
+    migrations.set_not_null('loans', 'borrower_uuid')
+    migrations.set_not_null('loans', 'status_enum')
+    migrations.create_index_concurrently('ix_loans_borrower_id', 'loans', ['borrower_uuid'])
+    migrations.add_foreign_key('loans', 'fk_loans_borrower_id', 'borrower_uuid', 'borrowers')
+
+    # Swap the converted columns in; dropping columns only changes the catalog.
+    migrations.execute(
+        'DROP TRIGGER loans_sync_converted_columns ON loans',
+        'DROP FUNCTION loans_sync_converted_columns()',
+        'ALTER TABLE loans DROP CONSTRAINT chk_status_enum',
+        'ALTER TABLE loans DROP COLUMN borrower_id',
+        'ALTER TABLE loans DROP COLUMN status',
+        'ALTER TABLE loans RENAME COLUMN borrower_uuid TO borrower_id',
+        'ALTER TABLE loans RENAME COLUMN status_enum TO status',
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('chk_interest_non_negative', 'loans', type_='check')
+    op.drop_constraint('chk_term_positive', 'loans', type_='check')
+    op.drop_constraint('fk_loans_borrower_id', 'loans', type_='foreignkey')
+    op.drop_index('ix_loans_borrower_id', table_name='loans')
+    op.alter_column(
+        'loans', 'status', type_=sa.String(), postgresql_using='status::text'
+    )
+    op.alter_column(
+        'loans', 'borrower_id', type_=sa.String(), postgresql_using='borrower_id::text'
+    )
+    op.create_check_constraint(
+        'chk_status_enum',
+        'loans',
+        "status IN ('pending','approved','rejected','disbursed','repaid','defaulted')",
+    )
+    postgresql.ENUM(name='loanstatus').drop(op.get_bind(), checkfirst=True)
+    op.drop_column('loans', 'due_date')
+    op.drop_column('loans', 'disbursement_date')
+    op.drop_column('loans', 'purpose')
+    op.execute('DROP TABLE IF EXISTS migration_backfills')
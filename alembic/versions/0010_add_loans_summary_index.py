@@ -0,0 +1,33 @@
+"""add covering index for sparse loan listings
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 00:00:00
+
+``GET /api/loans/?fields=id,amount,status`` selects only those columns in
+``created_at`` order; with them stored in the index PostgreSQL can answer
+from the index alone on partitions whose visibility map is current. Built
+concurrently, partition by partition (see app.migrations).
+"""
+from alembic import op
+
+from app import migrations
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    migrations.create_index_concurrently(
+        'ix_loans_created_at_summary',
+        'loans',
+        ['created_at'],
+        include=['id', 'amount', 'status', 'currency'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_loans_created_at_summary', table_name='loans')
@@ -0,0 +1,39 @@
+"""add text search indexes on borrowers and loan purpose
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 00:00:00
+
+Trigram GIN indexes serve substring lookups of borrowers by name, email or
+phone, and a GIN index on ``to_tsvector('simple', purpose)`` serves word
+lookups of loans (see app.search). Built concurrently, partition by
+partition for ``loans`` (see app.migrations).
+"""
+from alembic import op
+
+from app import migrations
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+BORROWER_COLUMNS = ('name', 'email', 'phone')
+
+
+def upgrade() -> None:
+    migrations.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in BORROWER_COLUMNS:
+        migrations.create_index_concurrently(
+            f'ix_borrowers_{column}_trgm', 'borrowers', [f'{column} gin_trgm_ops'], using='gin'
+        )
+    migrations.create_index_concurrently(
+        'ix_loans_purpose_fts', 'loans', ["to_tsvector('simple', purpose)"], using='gin'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_loans_purpose_fts', table_name='loans')
+    for column in BORROWER_COLUMNS:
+        op.drop_index(f'ix_borrowers_{column}_trgm', table_name='borrowers')
@@ -0,0 +1,30 @@
+"""add partial index on pending loans
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19 00:00:00
+
+app.decisioning reads pending loans in ``id`` order, a chunk at a time. The
+partial index holds only loans awaiting a decision, so it stays small however
+many loans have been decided. Built concurrently, partition by partition (see
+app.migrations).
+"""
+from alembic import op
+
+from app import migrations
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    migrations.create_index_concurrently(
+        'ix_loans_pending', 'loans', ['id'], where="status = 'pending'"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_loans_pending', table_name='loans')
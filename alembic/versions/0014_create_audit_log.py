@@ -0,0 +1,57 @@
+"""create append-only audit_log partitioned by month
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-19 00:00:00
+
+Change history of loans and payments (see app.audit). Like ``loans`` and
+``payments`` it is range partitioned by month of ``created_at``; partitions
+for the coming months are created here and then kept ahead by
+``scripts/create_partitions.py``. A row trigger rejects ``UPDATE`` and
+``DELETE``, so history can only be appended to (or dropped a partition at a
+time).
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.config import settings
+from app.partitions import ensure_partitions
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'audit_log',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('entity_type', sa.String(length=16), nullable=False),
+        sa.Column('entity_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('loan_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('action', sa.String(length=8), nullable=False),
+        sa.Column('changes', postgresql.JSONB(), nullable=False),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id', 'created_at', name='audit_log_pkey'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+    op.execute('CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT')
+    ensure_partitions(op.get_bind(), months_ahead=settings.PARTITION_MONTHS_AHEAD, tables=['audit_log'])
+    op.create_index('ix_audit_log_loan_id', 'audit_log', ['loan_id', 'id'])
+
+    op.execute(
+        "CREATE OR REPLACE FUNCTION audit_log_append_only() RETURNS trigger LANGUAGE plpgsql AS $$ "
+        "BEGIN RAISE EXCEPTION 'audit_log is append-only'; END $$"
+    )
+    op.execute(
+        'CREATE TRIGGER audit_log_append_only BEFORE UPDATE OR DELETE ON audit_log '
+        'FOR EACH ROW EXECUTE FUNCTION audit_log_append_only()'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('audit_log')
+    op.execute('DROP FUNCTION IF EXISTS audit_log_append_only()')
@@ -0,0 +1,30 @@
+"""add runner leases to jobs
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-19 00:00:00
+
+A runner claiming a job records itself and the end of its lease, which it
+renews while the job runs; only jobs with an expired lease are recovered by
+other runners (see app.jobs). Nullable columns are added without rewriting
+the table.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('jobs', sa.Column('runner_id', sa.String(128), nullable=True))
+    op.add_column('jobs', sa.Column('lease_expires_at', postgresql.TIMESTAMP(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('jobs', 'lease_expires_at')
+    op.drop_column('jobs', 'runner_id')
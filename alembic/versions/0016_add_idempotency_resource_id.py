@@ -0,0 +1,26 @@
+"""add the reserved resource id to idempotency_keys
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-19 00:00:00
+
+The first attempt for a key records the id of the loan it is about to create;
+an attempt taking the key over creates the loan under the same id, so a slow
+or crashed first attempt cannot lead to a second loan (see app.idempotency).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('idempotency_keys', sa.Column('resource_id', sa.String(64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('idempotency_keys', 'resource_id')
@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -17,9 +19,57 @@ def create_app() -> FastAPI:
     from .routes.health import router as health_router
     from .routes.loans import router as loans_router
     from .routes.stats import router as stats_router
+    from .routes.jobs import router as jobs_router
+    from .routes.borrowers import router as borrowers_router
+    from .routes.payments import router as payments_router
     
     app.include_router(health_router)
     app.include_router(loans_router, prefix="/api", tags=["loans"])
     app.include_router(stats_router, prefix="/api", tags=["stats"])
+    app.include_router(jobs_router, prefix="/api", tags=["jobs"])
+    app.include_router(borrowers_router, prefix="/api", tags=["borrowers"])
+    app.include_router(payments_router, prefix="/api", tags=["payments"])
+
+    @app.on_event("startup")
+    async def start_outbox_dispatcher() -> None:
+        from .config import settings
+        if settings.OUTBOX_DISPATCHER_ENABLED:
+            from .outbox import get_outbox_dispatchers
+            for dispatcher in get_outbox_dispatchers():
+                await dispatcher.start()
+
+    @app.on_event("startup")
+    async def start_job_runner() -> None:
+        # Picks up jobs left queued or running by a previous process
+        from .jobs import get_job_runner
+        await get_job_runner().start()
+
+    @app.on_event("shutdown")
+    async def stop_job_runner() -> None:
+        from . import jobs
+        if jobs._runner is not None:
+            await jobs._runner.stop()
+
+    @app.on_event("shutdown")
+    async def drain_loan_coalescer() -> None:
+        # Loan creates still waiting for their batch to commit
+        from .config import settings
+        if settings.LOAN_WRITE_COALESCING_ENABLED:
+            from . import batching
+            if batching._coalescer is not None:
+                await batching._coalescer.drain()
+
+    @app.on_event("shutdown")
+    async def flush_audit_buffer() -> None:
+        from .audit import stop_audit_buffer
+        await asyncio.to_thread(stop_audit_buffer)
+
+    @app.on_event("shutdown")
+    async def stop_outbox_dispatcher() -> None:
+        from .config import settings
+        if settings.OUTBOX_DISPATCHER_ENABLED:
+            from .outbox import get_outbox_dispatchers
+            for dispatcher in get_outbox_dispatchers():
+                await dispatcher.stop()
     
     return app
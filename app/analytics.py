@@ -0,0 +1,179 @@
+"""Vectorized portfolio-at-risk (PAR) and delinquency aging analytics.
+
+Loans and payments are streamed from the database in chunks of plain column
+values and folded into fixed-size per-loan NumPy arrays, so memory grows with
+the number of loans only, never with the number of payments.
+
+For every loan the module computes:
+
+* outstanding principal: ``amount`` minus paid amounts, for loans still on the
+  book (disbursed or defaulted);
+* days past due: age of the oldest unpaid instalment past its due date.
+
+These are then aggregated per ``(currency, status)`` into outstanding
+principal, PAR30/PAR90 (share of outstanding principal more than 30/90 days
+past due) and aging buckets.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import Float, case, cast, extract, func, select
+
+from .models import Loan, LoanStatus, Payment, PaymentStatus
+
+SECONDS_PER_DAY = 86400
+
+# Loans whose principal is still outstanding
+ON_BOOK_STATUSES = (LoanStatus.DISBURSED, LoanStatus.DEFAULTED)
+
+STATUSES = list(LoanStatus)
+
+# (label, lower bound in days past due, inclusive)
+AGING_BUCKETS = [
+    ("current", 0),
+    ("1-30", 1),
+    ("31-60", 31),
+    ("61-90", 61),
+    ("91-180", 91),
+    ("180+", 181),
+]
+
+
+def _loan_index():
+    """Dense 0-based index of each loan, shared by the loan and payment queries."""
+    return (func.row_number().over(order_by=Loan.id) - 1).label("idx")
+
+
+def _load_loans(db, chunk_size: int):
+    numbered = select(
+        _loan_index(),
+        cast(Loan.amount, Float).label("amount"),
+        Loan.currency,
+        case(*((Loan.status == status, code) for code, status in enumerate(STATUSES))).label("status"),
+    )
+    result = db.execute(numbered.execution_options(yield_per=chunk_size))
+
+    amounts: List[np.ndarray] = []
+    currency_codes: List[np.ndarray] = []
+    status_codes: List[np.ndarray] = []
+    currencies: Dict[str, int] = {}
+    for partition in result.partitions():
+        _, amount, currency, status = zip(*partition)
+        amounts.append(np.fromiter(amount, dtype=np.float64, count=len(partition)))
+        status_codes.append(np.fromiter(status, dtype=np.int8, count=len(partition)))
+        currency_codes.append(
+            np.fromiter(
+                (currencies.setdefault(c, len(currencies)) for c in currency),
+                dtype=np.int16,
+                count=len(partition),
+            )
+        )
+
+    if not amounts:
+        return np.empty(0), np.empty(0, np.int16), np.empty(0, np.int8), []
+    labels = sorted(currencies, key=currencies.get)
+    return np.concatenate(amounts), np.concatenate(currency_codes), np.concatenate(status_codes), labels
+
+
+def _fold_payments(db, n_loans: int, as_of: datetime, chunk_size: int):
+    paid = np.zeros(n_loans, dtype=np.float64)
+    days_past_due = np.zeros(n_loans, dtype=np.int32)
+    as_of_epoch = as_of.timestamp()
+
+    loan_index = select(Loan.id, _loan_index()).subquery()
+    stmt = select(
+        loan_index.c.idx,
+        case((Payment.status == PaymentStatus.PAID, 1), else_=0).label("is_paid"),
+        cast(func.coalesce(Payment.paid_amount, 0), Float).label("paid_amount"),
+        cast(extract("epoch", Payment.due_date), Float).label("due_epoch"),
+    ).join(loan_index, loan_index.c.id == Payment.loan_id)
+    result = db.execute(stmt.execution_options(yield_per=chunk_size))
+
+    for partition in result.partitions():
+        count = len(partition)
+        idx, is_paid, paid_amount, due_epoch = zip(*partition)
+        idx = np.fromiter(idx, dtype=np.int64, count=count)
+        is_paid = np.fromiter(is_paid, dtype=bool, count=count)
+        paid_amount = np.fromiter(paid_amount, dtype=np.float64, count=count)
+        due_epoch = np.fromiter(due_epoch, dtype=np.float64, count=count)
+
+        np.add.at(paid, idx[is_paid], paid_amount[is_paid])
+        late = ~is_paid & (due_epoch < as_of_epoch)
+        overdue_days = ((as_of_epoch - due_epoch[late]) // SECONDS_PER_DAY).astype(np.int32)
+        np.maximum.at(days_past_due, idx[late], overdue_days)
+
+    return paid, days_past_due
+
+
+def portfolio_summary(
+    db, as_of: Optional[datetime] = None, chunk_size: int = 50000
+) -> Dict[str, Any]:
+    """Compute PAR and aging figures grouped by currency and loan status.
+
+    Args:
+        db: SQLAlchemy session.
+        as_of: Reference time for days past due; defaults to now.
+        chunk_size: Rows fetched per round trip while streaming.
+
+    Returns:
+        dict: ``groups`` per (currency, status) and ``currencies`` totals.
+    """
+    as_of = as_of or datetime.now(timezone.utc)
+    if as_of.tzinfo is None:
+        as_of = as_of.replace(tzinfo=timezone.utc)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Both queries must number loans identically.
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+    amount, currency, status, currency_labels = _load_loans(db, chunk_size)
+    paid, days_past_due = _fold_payments(db, len(amount), as_of, chunk_size)
+
+    on_book = np.isin(status, [STATUSES.index(s) for s in ON_BOOK_STATUSES])
+    outstanding = np.where(on_book, np.clip(amount - paid, 0, None), 0.0)
+    bucket_bounds = np.array([lower for _, lower in AGING_BUCKETS[1:]])
+    bucket = np.searchsorted(bucket_bounds, days_past_due, side="right")
+
+    n_status = len(STATUSES)
+    n_groups = max(len(currency_labels), 1) * n_status
+    group = currency.astype(np.int64) * n_status + status
+
+    def by_group(weights=None, mask=None):
+        g = group if mask is None else group[mask]
+        w = weights if weights is None or mask is None else weights[mask]
+        return np.bincount(g, weights=w, minlength=n_groups)
+
+    loan_count = by_group()
+    outstanding_total = by_group(outstanding)
+    par30 = by_group(outstanding, days_past_due > 30)
+    par90 = by_group(outstanding, days_past_due > 90)
+    aging = [by_group(outstanding, bucket == i) for i in range(len(AGING_BUCKETS))]
+
+    groups = []
+    for g in np.flatnonzero(loan_count):
+        total = float(outstanding_total[g])
+        groups.append({
+            "currency": currency_labels[g // n_status],
+            "status": STATUSES[g % n_status].value,
+            "loan_count": int(loan_count[g]),
+            "outstanding_principal": round(total, 2),
+            "par30": round(float(par30[g]), 2),
+            "par90": round(float(par90[g]), 2),
+            "par30_ratio": round(float(par30[g]) / total, 4) if total else 0.0,
+            "par90_ratio": round(float(par90[g]) / total, 4) if total else 0.0,
+            "aging": {label: round(float(aging[i][g]), 2) for i, (label, _) in enumerate(AGING_BUCKETS)},
+        })
+
+    currencies = {}
+    for code, label in enumerate(currency_labels):
+        rows = slice(code * n_status, (code + 1) * n_status)
+        total = float(outstanding_total[rows].sum())
+        currencies[label] = {
+            "loan_count": int(loan_count[rows].sum()),
+            "outstanding_principal": round(total, 2),
+            "par30_ratio": round(float(par30[rows].sum()) / total, 4) if total else 0.0,
+            "par90_ratio": round(float(par90[rows].sum()) / total, 4) if total else 0.0,
+        }
+
+    return {"as_of": as_of.isoformat(), "groups": groups, "currencies": currencies}
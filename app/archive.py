@@ -0,0 +1,407 @@
+"""Cold storage for loans in a terminal state.
+
+Repaid and rejected loans are rarely read but keep the hot ``loans`` indexes
+large. Defaulted loans are not archived: they can still be repaid and count
+towards portfolio-at-risk in app.analytics, which only reads the database. :func:`archive_loans` moves them, in chunks, into
+immutable columnar segments on local disk and deletes them from the database.
+
+A segment is a directory holding one ``.npy`` file per column, with rows sorted
+by loan id, and a ``manifest.json``. Fixed-width columns (ids as 16 raw bytes,
+amounts in cents, timestamps as ``datetime64[us]``) are opened with
+``np.load(mmap_mode="r")``, so a lookup is a binary search over pages the OS
+maps in on demand. Free-text ``purpose`` values are stored as one UTF-8 blob
+plus offsets. The manifest also holds the segment's loan count and amount per
+status, currency and ``created_at`` month, from which :meth:`LoanArchive.aggregates`
+answers without reading the columns, except for months cut by the requested
+range.
+
+:class:`LoanArchive` serves point lookups (used by ``get_loan`` and
+``batch-get`` when a loan is no longer in the database) and aggregates merged
+into ``get_stats``. Payments of archived loans stay in the ``payments`` table.
+With ``DATABASE_SHARDS`` set, every shard is archived into the same directory.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import delete, select
+
+from .audit import DELETE, audit_entry, record_changes
+from .config import settings
+from .db import SessionFactory
+from .exposure import refresh_borrower_exposure
+from .models import Loan, LoanStatus
+from .partitions import add_months
+from .rollups import invalidate_loan_buckets
+from .sharding import get_shard_router
+
+logger = logging.getLogger(__name__)
+
+ARCHIVABLE_STATUSES = (LoanStatus.REPAID, LoanStatus.REJECTED)
+STATUSES = list(LoanStatus)
+
+_NULL_INT = np.iinfo(np.int64).min
+_DATETIME_COLUMNS = ("disbursement_date", "due_date", "created_at", "updated_at")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _cents(value: Optional[Decimal]) -> int:
+    return _NULL_INT if value is None else int(Decimal(value).scaleb(2).to_integral_value())
+
+
+def _from_cents(value: int) -> Optional[Decimal]:
+    return None if value == _NULL_INT else Decimal(int(value)).scaleb(-2)
+
+
+def _datetime64(value: Optional[datetime]) -> np.datetime64:
+    if value is None:
+        return np.datetime64("NaT", "us")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return np.datetime64(int((value - _EPOCH) // timedelta(microseconds=1)), "us")
+
+
+def _from_datetime64(value: np.datetime64) -> Optional[datetime]:
+    if np.isnat(value):
+        return None
+    return _EPOCH + timedelta(microseconds=int(value.astype(np.int64)))
+
+
+def _month(value: datetime) -> str:
+    return f"{value:%Y-%m}"
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _id_bytes(value: Any) -> bytes:
+    return (value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))).bytes
+
+
+class Segment:
+    """One immutable, memory-mapped archive segment."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.columns = {
+            name[: -len(".npy")]: np.load(os.path.join(path, name), mmap_mode="r")
+            for name in os.listdir(path)
+            if name.endswith(".npy")
+        }
+        self.min_id = bytes.fromhex(self.manifest["min_id"])
+        self.max_id = bytes.fromhex(self.manifest["max_id"])
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    def find(self, loan_id: uuid.UUID) -> Optional[int]:
+        key = loan_id.bytes
+        if not self.min_id <= key <= self.max_id:
+            return None
+        ids = self.columns["id"]
+        index = int(np.searchsorted(ids, np.array(key, dtype="S16")))
+        if index < len(ids) and ids[index] == np.array(key, dtype="S16"):
+            return index
+        return None
+
+    def record(self, index: int) -> Dict[str, Any]:
+        c = self.columns
+        start, end = c["purpose_offsets"][index], c["purpose_offsets"][index + 1]
+        purpose = None if c["purpose_null"][index] else bytes(c["purpose"][start:end]).decode()
+        record = {
+            "id": uuid.UUID(bytes=bytes(c["id"][index]).ljust(16, b"\0")),
+            "borrower_id": uuid.UUID(bytes=bytes(c["borrower_id"][index]).ljust(16, b"\0")),
+            "amount": _from_cents(c["amount_cents"][index]),
+            "currency": bytes(c["currency"][index]).decode(),
+            "status": STATUSES[c["status"][index]],
+            "term_months": None if c["term_months"][index] < 0 else int(c["term_months"][index]),
+            "interest_rate_apr": _from_cents(c["interest_rate_apr_cents"][index]),
+            "purpose": purpose,
+        }
+        for name in _DATETIME_COLUMNS:
+            record[name] = _from_datetime64(c[name][index])
+        return record
+
+
+def write_segment(directory: str, rows: Sequence[Any]) -> str:
+    """Write ``rows`` (selected with all ``loans`` columns) as a new segment.
+
+    The segment is written to a temporary directory and renamed into place, so
+    readers never see a partial segment.
+
+    Returns:
+        str: Path of the segment directory.
+    """
+    rows = sorted(rows, key=lambda row: _id_bytes(row.id))
+    purposes = [None if row.purpose is None else row.purpose.encode() for row in rows]
+    columns = {
+        "id": np.array([_id_bytes(row.id) for row in rows], dtype="S16"),
+        "borrower_id": np.array([_id_bytes(row.borrower_id) for row in rows], dtype="S16"),
+        "amount_cents": np.array([_cents(row.amount) for row in rows], dtype=np.int64),
+        "currency": np.array([row.currency.encode() for row in rows], dtype="S3"),
+        "status": np.array([STATUSES.index(LoanStatus(row.status)) for row in rows], dtype=np.uint8),
+        "term_months": np.array(
+            [-1 if row.term_months is None else row.term_months for row in rows], dtype=np.int32
+        ),
+        "interest_rate_apr_cents": np.array([_cents(row.interest_rate_apr) for row in rows], dtype=np.int64),
+        "purpose": np.frombuffer(b"".join(p or b"" for p in purposes), dtype=np.uint8),
+        "purpose_offsets": np.cumsum([0] + [len(p or b"") for p in purposes], dtype=np.int64),
+        "purpose_null": np.array([p is None for p in purposes], dtype=bool),
+    }
+    for name in _DATETIME_COLUMNS:
+        columns[name] = np.array([_datetime64(getattr(row, name)) for row in rows], dtype="datetime64[us]")
+
+    created = datetime.now(timezone.utc)
+    name = f"segment-{created:%Y%m%dT%H%M%S%f}-{columns['id'][0].hex()[:8]}"
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    path = os.path.join(directory, name)
+    os.makedirs(tmp_path)
+    for column, values in columns.items():
+        np.save(os.path.join(tmp_path, f"{column}.npy"), values)
+    # (status, currency, created_at month) -> [count, amount in cents]
+    totals: Dict[tuple, List[int]] = {}
+    for row in rows:
+        key = (LoanStatus(row.status).value, row.currency, _month(row.created_at))
+        total = totals.setdefault(key, [0, 0])
+        total[0] += 1
+        total[1] += _cents(row.amount)
+    manifest = {
+        "rows": len(rows),
+        "min_id": _id_bytes(rows[0].id).hex(),
+        "max_id": _id_bytes(rows[-1].id).hex(),
+        "archived_at": created.isoformat(),
+        "totals": [[*key, count, cents] for key, (count, cents) in sorted(totals.items())],
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, path)
+    return path
+
+
+class LoanArchive:
+    """Read access to the archive segments in ``directory``.
+
+    New segments are picked up when the directory's modification time changes.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._segments: Dict[str, Segment] = {}
+        self._mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def segments(self) -> List[Segment]:
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if mtime != self._mtime:
+                names = sorted(
+                    name for name in os.listdir(self.directory) if name.startswith("segment-")
+                )
+                self._segments = {
+                    name: self._segments.get(name) or Segment(os.path.join(self.directory, name))
+                    for name in names
+                }
+                self._mtime = mtime
+            return list(self._segments.values())
+
+    def get(self, loan_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        """Return an archived loan as a dict of column values, or None."""
+        for segment in self.segments():
+            index = segment.find(loan_id)
+            if index is not None:
+                return segment.record(index)
+        return None
+
+    def get_many(self, loan_ids: Iterable[uuid.UUID]) -> Dict[uuid.UUID, Dict[str, Any]]:
+        found = {}
+        for loan_id in loan_ids:
+            record = self.get(loan_id)
+            if record is not None:
+                found[loan_id] = record
+        return found
+
+    def aggregates(
+        self, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """Count and amount totals of archived loans, optionally by ``created_at`` range.
+
+        Returns:
+            dict: ``total_loans``, ``total_amount`` (Decimal), ``by_status`` and
+            ``by_currency`` counts.
+        """
+        created_from, created_to = _aware(created_from), _aware(created_to)
+        result = {"total_loans": 0, "total_cents": 0, "by_status": {}, "by_currency": {}}
+        for segment in self.segments():
+            totals = segment.manifest.get("totals")
+            if totals is None:
+                # Written before totals were kept
+                self._scan(result, segment, created_from, created_to)
+                continue
+            cut_months = set()
+            for status, currency, month, count, cents in totals:
+                start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+                end = add_months(start, 1)
+                if (created_from is not None and end <= created_from) or (
+                    created_to is not None and start >= created_to
+                ):
+                    continue
+                if (created_from is not None and start < created_from) or (
+                    created_to is not None and end > created_to
+                ):
+                    cut_months.add(month)
+                    continue
+                self._add(result, status, currency, count, cents)
+            if cut_months:
+                self._scan(result, segment, created_from, created_to, cut_months)
+        return {
+            "total_loans": result["total_loans"],
+            "total_amount": Decimal(result["total_cents"]).scaleb(-2),
+            "by_status": result["by_status"],
+            "by_currency": result["by_currency"],
+        }
+
+    @staticmethod
+    def _add(result: Dict[str, Any], status: str, currency: str, count: int, cents: int) -> None:
+        result["total_loans"] += count
+        result["total_cents"] += cents
+        result["by_status"][status] = result["by_status"].get(status, 0) + count
+        result["by_currency"][currency] = result["by_currency"].get(currency, 0) + count
+
+    def _scan(
+        self,
+        result: Dict[str, Any],
+        segment: Segment,
+        created_from: Optional[datetime],
+        created_to: Optional[datetime],
+        months: Optional[Iterable[str]] = None,
+    ) -> None:
+        """Add the rows of ``segment`` in the range (and ``months``, if given) from its columns."""
+        c = segment.columns
+        mask = np.ones(len(segment), dtype=bool)
+        if created_from is not None:
+            mask &= c["created_at"] >= _datetime64(created_from)
+        if created_to is not None:
+            mask &= c["created_at"] < _datetime64(created_to)
+        if months is not None:
+            mask &= np.isin(c["created_at"].astype("datetime64[M]"), np.array(sorted(months), dtype="datetime64[M]"))
+        statuses, currencies, cents = c["status"][mask], c["currency"][mask], c["amount_cents"][mask]
+        for code in np.unique(statuses):
+            for currency in np.unique(currencies[statuses == code]):
+                selected = (statuses == code) & (currencies == currency)
+                self._add(
+                    result, STATUSES[code].value, currency.decode(),
+                    int(selected.sum()), int(cents[selected].sum()),
+                )
+
+
+def archive_loans(
+    directory: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    min_age: Optional[timedelta] = None,
+    statuses: Sequence[LoanStatus] = ARCHIVABLE_STATUSES,
+    session_factory=None,
+) -> int:
+    """Move terminal-state loans untouched for ``min_age`` into archive segments.
+
+    Each chunk is one transaction: the rows are locked, written to a segment,
+    deleted with a ``delete`` audit entry each, and the owners' exposure and
+    the loans' origination rollups refreshed. The segment becomes visible
+    just before the commit and is removed again if the commit fails.
+
+    Without ``session_factory`` the default database is archived, or every
+    loan shard in turn when sharding is configured.
+
+    Returns:
+        int: Number of loans archived.
+    """
+    directory = directory or settings.ARCHIVE_DIR
+    chunk_size = chunk_size or settings.ARCHIVE_CHUNK_SIZE
+    if min_age is None:
+        min_age = timedelta(days=settings.ARCHIVE_MIN_AGE_DAYS)
+    cutoff = datetime.now(timezone.utc) - min_age
+    os.makedirs(directory, exist_ok=True)
+
+    if session_factory is not None:
+        factories = [session_factory]
+    elif get_shard_router() is not None:
+        shards = get_shard_router()
+        factories = [shards.session_factories[shard] for shard in shards.shards]
+    else:
+        factories = [SessionFactory]
+    return sum(
+        _archive_database(factory, directory, chunk_size, cutoff, statuses) for factory in factories
+    )
+
+
+def _archive_database(session_factory, directory: str, chunk_size: int, cutoff: datetime, statuses) -> int:
+    total = 0
+    last_id = None
+    while True:
+        session = session_factory()
+        segment = None
+        try:
+            stmt = (
+                select(*Loan.__table__.columns)
+                .where(Loan.status.in_(statuses), Loan.updated_at < cutoff)
+                .order_by(Loan.id)
+                .limit(chunk_size)
+            )
+            if last_id is not None:
+                stmt = stmt.where(Loan.id > last_id)
+            if session.get_bind().dialect.name == "postgresql":
+                stmt = stmt.with_for_update(skip_locked=True)
+            rows = session.execute(stmt).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            segment = write_segment(directory, rows)
+            session.execute(
+                delete(Loan).where(Loan.id.in_([row.id for row in rows])),
+                execution_options={"synchronize_session": False},
+            )
+            record_changes(session, [
+                audit_entry("loan", row.id, row.id, DELETE, {key: (value, None) for key, value in row._mapping.items()})
+                for row in rows
+            ])
+            refresh_borrower_exposure(session.connection(), {row.borrower_id for row in rows})
+            invalidate_loan_buckets(session.connection(), [row.created_at for row in rows])
+            session.commit()
+            total += len(rows)
+            logger.info(f"Archived {len(rows)} loans to {segment}")
+        except Exception:
+            session.rollback()
+            if segment is not None:
+                shutil.rmtree(segment, ignore_errors=True)
+            raise
+        finally:
+            session.close()
+    return total
+
+
+_archive: Optional[LoanArchive] = None
+
+
+def get_loan_archive() -> LoanArchive:
+    """Return the process-wide archive reader for ``ARCHIVE_DIR``."""
+    global _archive
+    if _archive is None:
+        _archive = LoanArchive(settings.ARCHIVE_DIR)
+    return _archive
@@ -0,0 +1,463 @@
+"""Append-only change history of loans and payments.
+
+Every insert, update and delete of a :class:`~app.models.Loan` or
+:class:`~app.models.Payment` is captured as an ``audit_log`` row holding the
+changed fields as ``{field: [old, new]}``: an ``after_flush`` session hook
+covers ORM writes, and code writing with Core/bulk statements calls
+:func:`record_changes` itself (as it does for outbox events).
+
+``AUDIT_MODE`` selects how entries reach the table:
+
+* ``buffered`` (default): entries wait on the session until it commits and
+  are then handed to the process-wide :class:`AuditBuffer`, which writes them
+  from a background thread with multi-row ``INSERT`` statements of up to
+  ``batch_size`` rows. Writers never wait for the history insert, unless the
+  buffer is over ``max_entries`` (the database is falling behind), in which
+  case the committing thread writes the backlog itself. Entries of rolled
+  back transactions and savepoints are dropped; entries still buffered when
+  the process is killed are lost.
+* ``strict``: entries are written in the writing transaction itself (with
+  ``COPY`` on PostgreSQL), so history exists if and only if the change was
+  committed.
+
+``audit_log`` is range partitioned by month on PostgreSQL (see
+app.partitions) and a trigger rejects ``UPDATE`` and ``DELETE``; history
+is only ever removed by dropping whole partitions. :func:`loan_history`
+reads the entries of a loan and its payments through ``ix_audit_log_loan_id``.
+"""
+import atexit
+import csv
+import io
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from sqlalchemy import DDL, event, insert, inspect, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .metrics import AUDIT_BUFFER_DEPTH, AUDIT_ENTRIES_WRITTEN
+from .models import AuditEntry, Loan, Payment
+from .partitions import ID_TIMESTAMP_SLACK, uuid7, uuid_timestamp
+from .schemas import serialize_value
+
+logger = logging.getLogger(__name__)
+
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+BUFFERED = "buffered"
+STRICT = "strict"
+
+_ENTITY_TYPES = {Loan: "loan", Payment: "payment"}
+
+# Pending entries of a session: (transaction they were captured in, entry)
+_PENDING_KEY = "audit_pending"
+
+_COPY_COLUMNS = ("id", "entity_type", "entity_id", "loan_id", "action", "changes", "created_at")
+
+_APPEND_ONLY_DDL = {
+    "postgresql": (
+        "CREATE OR REPLACE FUNCTION audit_log_append_only() RETURNS trigger LANGUAGE plpgsql AS $$ "
+        "BEGIN RAISE EXCEPTION 'audit_log is append-only'; END $$",
+        "CREATE TRIGGER audit_log_append_only BEFORE UPDATE OR DELETE ON audit_log "
+        "FOR EACH ROW EXECUTE FUNCTION audit_log_append_only()",
+    ),
+    "sqlite": (
+        "CREATE TRIGGER IF NOT EXISTS audit_log_no_update BEFORE UPDATE ON audit_log "
+        "BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END",
+        "CREATE TRIGGER IF NOT EXISTS audit_log_no_delete BEFORE DELETE ON audit_log "
+        "BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END",
+    ),
+}
+
+for _dialect, _statements in _APPEND_ONLY_DDL.items():
+    for _statement in _statements:
+        event.listen(AuditEntry.__table__, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+
+
+_last_id = 0
+_id_lock = threading.Lock()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _entry_id() -> UUID:
+    """A UUIDv7 greater than any previous one of this process.
+
+    Entries captured within the same millisecond keep their order.
+    """
+    global _last_id
+    with _id_lock:
+        _last_id = max(uuid7().int, _last_id + 1)
+        return UUID(int=_last_id)
+
+
+def audit_entry(
+    entity_type: str,
+    entity_id: UUID,
+    loan_id: UUID,
+    action: str,
+    changes: Dict[str, Sequence[Any]],
+) -> Dict[str, Any]:
+    """``audit_log`` row values for one change.
+
+    Args:
+        entity_type: ``loan`` or ``payment``.
+        entity_id: Id of the changed row.
+        loan_id: The loan itself, or the loan the payment belongs to.
+        action: ``insert``, ``update`` or ``delete``.
+        changes: Field -> ``(old, new)``; values are serialized to JSON.
+    """
+    return {
+        "id": _entry_id(),
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "loan_id": loan_id,
+        "action": action,
+        "changes": {
+            field: [serialize_value(old), serialize_value(new)] for field, (old, new) in changes.items()
+        },
+        "created_at": _utcnow(),
+    }
+
+
+def _loaded_columns(obj: Any) -> Dict[str, Any]:
+    # Only values already loaded: reading expired ones would query mid-flush
+    state = inspect(obj)
+    return {
+        attr.key: state.dict[attr.key]
+        for attr in state.mapper.column_attrs
+        if attr.key in state.dict
+    }
+
+
+def _entry_for(obj: Any, action: str, changes: Dict[str, Sequence[Any]]) -> Dict[str, Any]:
+    state = inspect(obj)
+    entity_id = state.identity[0] if state.identity else state.dict["id"]
+    # Payments whose loan_id is not loaded get it filled in by _flush_entries
+    loan_id = entity_id if isinstance(obj, Loan) else state.dict.get("loan_id")
+    return audit_entry(_ENTITY_TYPES[type(obj)], entity_id, loan_id, action, changes)
+
+
+def inserted_entry(obj: Any) -> Dict[str, Any]:
+    """Entry for a newly inserted loan or payment (ORM object with its columns loaded)."""
+    return _entry_for(obj, INSERT, {key: (None, value) for key, value in _loaded_columns(obj).items()})
+
+
+def _flush_entries(session: Session) -> List[Dict[str, Any]]:
+    entries = []
+    for obj in session.new:
+        if type(obj) in _ENTITY_TYPES:
+            entries.append(inserted_entry(obj))
+    for obj in session.dirty:
+        if type(obj) not in _ENTITY_TYPES:
+            continue
+        state = inspect(obj)
+        changes = {}
+        for attr in state.mapper.column_attrs:
+            history = state.attrs[attr.key].history
+            if not history.added:
+                continue
+            old = history.deleted[0] if history.deleted else None
+            if old != history.added[0]:
+                changes[attr.key] = (old, history.added[0])
+        version = state.mapper.version_id_col
+        if changes and version is not None:
+            # Bumped by the flush itself, outside of attribute history
+            key = state.mapper.get_property_by_column(version).key
+            if state.dict.get(key) is not None:
+                changes[key] = (state.dict[key] - 1, state.dict[key])
+        if changes:
+            entries.append(_entry_for(obj, UPDATE, changes))
+    for obj in session.deleted:
+        if type(obj) in _ENTITY_TYPES:
+            entries.append(
+                _entry_for(obj, DELETE, {key: (value, None) for key, value in _loaded_columns(obj).items()})
+            )
+
+    missing = [entry for entry in entries if entry["loan_id"] is None]
+    if missing:
+        loan_ids = dict(
+            session.connection().execute(
+                select(Payment.id, Payment.loan_id).where(
+                    Payment.id.in_([entry["entity_id"] for entry in missing])
+                )
+            ).all()
+        )
+        for entry in missing:
+            entry["loan_id"] = loan_ids[entry["entity_id"]]
+    return entries
+
+
+def write_entries(connection: Connection, entries: Sequence[Dict[str, Any]]) -> None:
+    """Insert ``entries`` on ``connection`` inside the caller's transaction.
+
+    Uses ``COPY`` on PostgreSQL (psycopg2) and a multi-row ``INSERT`` elsewhere.
+    """
+    if not entries:
+        return
+    if connection.dialect.driver == "psycopg2":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for entry in entries:
+            writer.writerow([
+                entry["id"],
+                entry["entity_type"],
+                entry["entity_id"],
+                entry["loan_id"],
+                entry["action"],
+                json.dumps(entry["changes"], separators=(",", ":")),
+                entry["created_at"].isoformat(),
+            ])
+        buffer.seek(0)
+        cursor = connection.connection.driver_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY audit_log ({', '.join(_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        finally:
+            cursor.close()
+    else:
+        connection.execute(insert(AuditEntry), list(entries))
+
+
+def _current_transaction(session: Session):
+    return session.get_nested_transaction() or session.get_transaction()
+
+
+def record_changes(session: Session, entries: Sequence[Dict[str, Any]]) -> None:
+    """Record audit entries for changes made in ``session``'s current transaction.
+
+    In strict mode they are written right away on the session's connection;
+    in buffered mode they are handed to the buffer once the session commits.
+    """
+    if not entries:
+        return
+    if settings.AUDIT_MODE == STRICT:
+        write_entries(session.connection(), entries)
+        AUDIT_ENTRIES_WRITTEN.labels(mode=STRICT).inc(len(entries))
+        return
+    transaction = _current_transaction(session)
+    session.info.setdefault(_PENDING_KEY, []).extend((transaction, entry) for entry in entries)
+
+
+@event.listens_for(Session, "after_flush")
+def capture_changes(session, flush_context):
+    """Capture the loan and payment rows inserted, updated or deleted by this flush."""
+    record_changes(session, _flush_entries(session))
+
+
+@event.listens_for(Session, "after_commit")
+def hand_over_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        get_audit_buffer().add(session.get_bind(AuditEntry), [entry for _, entry in pending])
+
+
+def _within(transaction, ancestor) -> bool:
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_changes(session, previous_transaction):
+    """Drop entries captured in a rolled back transaction or savepoint."""
+    pending = session.info.get(_PENDING_KEY)
+    if pending:
+        pending[:] = [item for item in pending if not _within(item[0], previous_transaction)]
+
+
+@event.listens_for(Session, "after_transaction_end")
+def discard_uncommitted_changes(session, transaction):
+    # A session closed without committing
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+
+
+class AuditBuffer:
+    """Collects committed audit entries and writes them in batches.
+
+    Entries are kept per database (engine or connection the session was
+    bound to), so shards and test connections each get their own history.
+
+    Args:
+        batch_size: Rows per ``INSERT`` statement.
+        flush_interval: Seconds between background flushes.
+        max_entries: Buffered entries above which :meth:`add` writes the
+            backlog in the caller's thread.
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 1.0, max_entries: int = 50000) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._entries: Dict[Any, List[Dict[str, Any]]] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        # Serializes writers, so entries of one database are written in order
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, bind: Any, entries: Sequence[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._entries.setdefault(bind, []).extend(entries)
+            self._size += len(entries)
+            size = self._size
+        AUDIT_BUFFER_DEPTH.set(size)
+        if size > self.max_entries:
+            self.flush()
+        elif size >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write all buffered entries; entries that fail to write stay buffered.
+
+        Returns:
+            int: Number of entries written.
+        """
+        written = 0
+        with self._write_lock:
+            with self._lock:
+                taken, self._entries = self._entries, {}
+            for bind, entries in taken.items():
+                try:
+                    self._write(bind, entries)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(entries)} audit entries: {e}")
+                    with self._lock:
+                        self._entries.setdefault(bind, [])[:0] = entries
+                    continue
+                written += len(entries)
+                with self._lock:
+                    self._size -= len(entries)
+        AUDIT_BUFFER_DEPTH.set(self._size)
+        AUDIT_ENTRIES_WRITTEN.labels(mode=BUFFERED).inc(written)
+        return written
+
+    def _write(self, bind: Any, entries: List[Dict[str, Any]]) -> None:
+        session = Session(bind=bind, join_transaction_mode="create_savepoint")
+        try:
+            for start in range(0, len(entries), self.batch_size):
+                session.execute(insert(AuditEntry), entries[start : start + self.batch_size])
+            session.commit()
+        finally:
+            session.close()
+
+    def start(self) -> None:
+        """Flush every ``flush_interval`` seconds (or when a batch is full) in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and write what is left."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._size:
+                self.flush()
+
+
+def loan_history(db: Session, loan_id: UUID, after: Optional[UUID] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """Audit entries of a loan and its payments, oldest first.
+
+    Args:
+        db: SQLAlchemy session.
+        loan_id: Loan id.
+        after: Return entries after this entry id (the last one of the
+            previous page).
+        limit: Maximum number of entries.
+
+    Returns:
+        List[dict]: Entries with ``id``, ``entity_type``, ``entity_id``,
+        ``action``, ``changes`` and ``created_at``.
+    """
+    stmt = (
+        select(
+            AuditEntry.id,
+            AuditEntry.entity_type,
+            AuditEntry.entity_id,
+            AuditEntry.action,
+            AuditEntry.changes,
+            AuditEntry.created_at,
+        )
+        .where(AuditEntry.loan_id == loan_id)
+        .order_by(AuditEntry.id)
+        .limit(limit)
+    )
+    if after is not None:
+        stmt = stmt.where(AuditEntry.id > after)
+    # No change to a loan predates its (UUIDv7) id, nor any entry the cursor
+    since = uuid_timestamp(after) if after is not None else uuid_timestamp(loan_id)
+    if since is not None:
+        stmt = stmt.where(AuditEntry.created_at >= since - ID_TIMESTAMP_SLACK)
+    return [
+        {
+            "id": str(row.id),
+            "entity_type": row.entity_type,
+            "entity_id": str(row.entity_id),
+            "action": row.action,
+            "changes": row.changes,
+            "created_at": serialize_value(row.created_at),
+        }
+        for row in db.execute(stmt)
+    ]
+
+
+_buffer: Optional[AuditBuffer] = None
+
+
+def get_audit_buffer() -> AuditBuffer:
+    """Return the process-wide audit buffer, starting its flush thread on first use."""
+    global _buffer
+    if _buffer is None:
+        _buffer = AuditBuffer(
+            batch_size=settings.AUDIT_BATCH_SIZE,
+            flush_interval=settings.AUDIT_FLUSH_INTERVAL_MS / 1000,
+            max_entries=settings.AUDIT_BUFFER_MAX_ENTRIES,
+        )
+        _buffer.start()
+    return _buffer
+
+
+def stop_audit_buffer() -> None:
+    """Write out buffered entries and stop the flush thread, if it was started."""
+    if _buffer is not None:
+        _buffer.stop()
+
+
+def _forget_buffer() -> None:
+    # A forked child (job worker process) has the buffer but not its thread
+    global _buffer
+    _buffer = None
+
+
+atexit.register(stop_audit_buffer)
+os.register_at_fork(after_in_child=_forget_buffer)
@@ -4,6 +4,7 @@ This module defines the configuration settings for the application using Pydanti
 BaseSettings. It supports different environments (development, testing, production)
 and loads configuration from environment variables with sensible defaults.
 """
+import json
 import os
 import sys
 from functools import lru_cache
@@ -61,10 +62,117 @@ class Settings(BaseSettings):
     DATABASE_POOL_PRE_PING: bool = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() == "true"
     DATABASE_POOL_RECYCLE: int = int(os.getenv("DATABASE_POOL_RECYCLE", "3600"))
     
+    # Statement caching
+    SQLALCHEMY_QUERY_CACHE_SIZE: int = int(os.getenv("SQLALCHEMY_QUERY_CACHE_SIZE", "500"))
+    DATABASE_PREPARE_THRESHOLD: int = int(os.getenv("DATABASE_PREPARE_THRESHOLD", "5"))
+    
+    # Horizontal sharding of loans (see app.sharding): JSON objects mapping
+    # shard numbers to database URLs and currencies to shard numbers. Loans in
+    # other currencies are placed by borrower hash. Empty disables sharding.
+    DATABASE_SHARDS: Dict[int, str] = json.loads(os.getenv("DATABASE_SHARDS", "{}"))
+    SHARD_CURRENCIES: Dict[str, int] = json.loads(os.getenv("SHARD_CURRENCIES", "{}"))
+    
+    # Adaptive concurrency limiting in front of the database pool
+    CONCURRENCY_LIMIT_ENABLED: bool = (
+        os.getenv("CONCURRENCY_LIMIT_ENABLED", "false").lower() == "true"
+    )
+    CONCURRENCY_LIMIT_INITIAL: int = int(os.getenv("CONCURRENCY_LIMIT_INITIAL", "15"))
+    CONCURRENCY_LIMIT_MIN: int = int(os.getenv("CONCURRENCY_LIMIT_MIN", "2"))
+    CONCURRENCY_LIMIT_MAX: int = int(os.getenv("CONCURRENCY_LIMIT_MAX", "100"))
+    CONCURRENCY_QUEUE_SIZE: int = int(os.getenv("CONCURRENCY_QUEUE_SIZE", "50"))
+    CONCURRENCY_QUEUE_TIMEOUT_MS: int = int(os.getenv("CONCURRENCY_QUEUE_TIMEOUT_MS", "1000"))
+    CONCURRENCY_LATENCY_TOLERANCE: float = float(
+        os.getenv("CONCURRENCY_LATENCY_TOLERANCE", "2.0")
+    )
+    
     # SQLAlchemy settings
     SQL_ECHO: bool = os.getenv("SQL_ECHO", "false").lower() == "true"
     SQL_ECHO_POOL: bool = os.getenv("SQL_ECHO_POOL", "false").lower() == "true"
     
+    # Write coalescing for loan creation
+    LOAN_WRITE_COALESCING_ENABLED: bool = (
+        os.getenv("LOAN_WRITE_COALESCING_ENABLED", "false").lower() == "true"
+    )
+    LOAN_WRITE_BATCH_MAX_SIZE: int = int(os.getenv("LOAN_WRITE_BATCH_MAX_SIZE", "64"))
+    LOAN_WRITE_BATCH_MAX_WAIT_MS: float = float(
+        os.getenv("LOAN_WRITE_BATCH_MAX_WAIT_MS", "5")
+    )
+    
+    # Loan reads
+    LOANS_BATCH_GET_MAX_IDS: int = int(os.getenv("LOANS_BATCH_GET_MAX_IDS", "1000"))
+
+    # Text search over borrowers and loan purposes (see app.search)
+    SEARCH_MAX_LIMIT: int = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+    SEARCH_CANDIDATE_LIMIT: int = int(os.getenv("SEARCH_CANDIDATE_LIMIT", "1000"))
+    
+    # Loan status transitions (see app.transitions)
+    LOAN_TRANSITIONS_MAX_ITEMS: int = int(os.getenv("LOAN_TRANSITIONS_MAX_ITEMS", "10000"))
+    LOAN_TRANSITION_CHUNK_SIZE: int = int(os.getenv("LOAN_TRANSITION_CHUNK_SIZE", "500"))
+
+    # Automated credit decisions for pending loans (see app.decisioning)
+    DECISIONING_CHUNK_SIZE: int = int(os.getenv("DECISIONING_CHUNK_SIZE", "5000"))
+    DECISIONING_WORKERS: int = int(os.getenv("DECISIONING_WORKERS", "2"))
+    DECISIONING_APPROVE_SCORE: int = int(os.getenv("DECISIONING_APPROVE_SCORE", "70"))
+
+    # Idempotency-Key replay for loan creation (see app.idempotency)
+    IDEMPOTENCY_KEY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+    IDEMPOTENCY_LOCK_SECONDS: float = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+    IDEMPOTENCY_PURGE_BATCH_SIZE: int = int(os.getenv("IDEMPOTENCY_PURGE_BATCH_SIZE", "1000"))
+
+    # Change history of loans and payments (see app.audit)
+    AUDIT_MODE: str = os.getenv("AUDIT_MODE", "buffered")
+    AUDIT_BATCH_SIZE: int = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+    AUDIT_FLUSH_INTERVAL_MS: float = float(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "1000"))
+    AUDIT_BUFFER_MAX_ENTRIES: int = int(os.getenv("AUDIT_BUFFER_MAX_ENTRIES", "50000"))
+    AUDIT_HISTORY_MAX_LIMIT: int = int(os.getenv("AUDIT_HISTORY_MAX_LIMIT", "500"))
+
+    # Repayment file imports (see app.reconciliation)
+    PAYMENT_IMPORT_CHUNK_SIZE: int = int(os.getenv("PAYMENT_IMPORT_CHUNK_SIZE", "5000"))
+    PAYMENT_IMPORT_MAX_REJECTS: int = int(os.getenv("PAYMENT_IMPORT_MAX_REJECTS", "100"))
+
+    # Portfolio analytics
+    ANALYTICS_CHUNK_SIZE: int = int(os.getenv("ANALYTICS_CHUNK_SIZE", "50000"))
+    ORIGINATION_MAX_BUCKETS: int = int(os.getenv("ORIGINATION_MAX_BUCKETS", "366"))
+    ORIGINATION_SETTLE_SECONDS: float = float(os.getenv("ORIGINATION_SETTLE_SECONDS", "300"))
+    
+    # Partition maintenance (loans and payments, see app.partitions)
+    PARTITION_MONTHS_AHEAD: int = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+    
+    # Cold storage of repaid, rejected and defaulted loans (see app.archive)
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", str(ROOT_DIR / "archive"))
+    ARCHIVE_CHUNK_SIZE: int = int(os.getenv("ARCHIVE_CHUNK_SIZE", "10000"))
+    ARCHIVE_MIN_AGE_DAYS: int = int(os.getenv("ARCHIVE_MIN_AGE_DAYS", "90"))
+    
+    # Loan event outbox (see app.outbox)
+    OUTBOX_DISPATCHER_ENABLED: bool = (
+        os.getenv("OUTBOX_DISPATCHER_ENABLED", "false").lower() == "true"
+    )
+    OUTBOX_SINKS: str = os.getenv("OUTBOX_SINKS", "file")
+    OUTBOX_FILE_PATH: str = os.getenv(
+        "OUTBOX_FILE_PATH", str(ROOT_DIR / "exports" / "loan-events.ndjson")
+    )
+    OUTBOX_HTTP_URL: Optional[str] = os.getenv("OUTBOX_HTTP_URL")
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+    OUTBOX_POLL_INTERVAL_MS: float = float(os.getenv("OUTBOX_POLL_INTERVAL_MS", "500"))
+    OUTBOX_LEASE_SECONDS: float = float(os.getenv("OUTBOX_LEASE_SECONDS", "30"))
+    OUTBOX_RETRY_BACKOFF_SECONDS: float = float(os.getenv("OUTBOX_RETRY_BACKOFF_SECONDS", "2"))
+    
+    # Background jobs
+    JOBS_CONCURRENCY: int = int(os.getenv("JOBS_CONCURRENCY", "4"))
+    JOBS_PROCESS_POOL_SIZE: int = int(os.getenv("JOBS_PROCESS_POOL_SIZE", "2"))
+    JOBS_MAX_ATTEMPTS: int = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+    JOBS_RETRY_BACKOFF_SECONDS: float = float(os.getenv("JOBS_RETRY_BACKOFF_SECONDS", "2"))
+    JOBS_LEASE_SECONDS: float = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+    JOBS_EXPORT_DIR: str = os.getenv("JOBS_EXPORT_DIR", str(ROOT_DIR / "exports"))
+    
+    # Profiling
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_TOKEN: Optional[str] = os.getenv("PROFILING_TOKEN")
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+    PROFILING_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", "5"))
+    PROFILING_BUFFER_SIZE: int = int(os.getenv("PROFILING_BUFFER_SIZE", "50"))
+    
     # Security
     SECURITY_PASSWORD_SALT: str = os.getenv(
         "SECURITY_PASSWORD_SALT", "dev-salt-change-in-production"
@@ -114,9 +222,9 @@ class Settings(BaseSettings):
         if isinstance(v, str):
             return v
         
-        # For testing, use SQLite
+        # For testing, use an in-memory SQLite database
         if values.get("TESTING"):
-            return "sqlite:///./test.db"
+            return "sqlite://"
         
         # Build PostgreSQL DSN
         return PostgresDsn.build(
@@ -178,7 +286,10 @@ class TestingConfig(Settings):
     TESTING: bool = True
     DEBUG: bool = True
     LOG_LEVEL: str = "DEBUG"
-    DATABASE_URI: str = "sqlite:///./test.db"
+    # In-memory, so parallel test workers never share a database file
+    DATABASE_URI: str = "sqlite://"
+    # Write history in the test's transaction, so it is rolled back with it
+    AUDIT_MODE: str = "strict"
     
     class Config:
         env_file = ".env.test"
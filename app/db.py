@@ -4,10 +4,12 @@ This module provides database connection, session management, and initialization
 utilities for the Branch Loans API.
 """
 import logging
+import threading
 from contextlib import contextmanager
-from typing import Generator, Optional
+from typing import Any, Dict, Generator, List, Optional
 
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, scoped_session, Session as SessionType, declarative_base
 from sqlalchemy.pool import QueuePool
@@ -20,6 +22,19 @@ from .config import settings
 # Configure logging
 logger = logging.getLogger(__name__)
 
+
+def driver_connect_args(url: str) -> Dict[str, Any]:
+    """Return DBAPI connect arguments enabling server-side prepared statements.
+
+    psycopg (v3) prepares a statement after it has been executed
+    ``DATABASE_PREPARE_THRESHOLD`` times on a connection. psycopg2 has no
+    prepared statement support, so nothing is added for it.
+    """
+    if make_url(url).drivername == "postgresql+psycopg":
+        return {"prepare_threshold": settings.DATABASE_PREPARE_THRESHOLD}
+    return {}
+
+
 # Create database engine with connection pooling
 engine = create_engine(
     str(settings.DATABASE_URL),
@@ -31,6 +46,8 @@ engine = create_engine(
     pool_recycle=settings.DATABASE_POOL_RECYCLE,
     echo=settings.SQL_ECHO,
     echo_pool=settings.SQL_ECHO_POOL,
+    query_cache_size=settings.SQLALCHEMY_QUERY_CACHE_SIZE,
+    connect_args=driver_connect_args(str(settings.DATABASE_URL)),
 )
 
 # Create a scoped session factory
@@ -119,6 +136,72 @@ def on_checkin(dbapi_connection, connection_record):
     logger.debug("Connection returned to pool")
 
 
+class QueryCounter:
+    """Collects the SQL statements executed while it is active."""
+
+    def __init__(self) -> None:
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a block of code executes more statements than allowed."""
+
+
+_active_counters: List[QueryCounter] = []
+_counters_lock = threading.Lock()
+
+
+# Transaction control statements are not queries (tests run inside SAVEPOINTs)
+_TRANSACTION_CONTROL = ("BEGIN", "SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    """Record the statement on every active QueryCounter."""
+    if _active_counters and not statement.lstrip().upper().startswith(_TRANSACTION_CONTROL):
+        with _counters_lock:
+            for counter in _active_counters:
+                counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries() -> Generator[QueryCounter, None, None]:
+    """Count the statements executed on any engine, from any thread, in the block.
+
+    Example:
+        with count_queries() as counter:
+            client.get("/api/loans/")
+        assert counter.count == 1
+    """
+    counter = QueryCounter()
+    with _counters_lock:
+        _active_counters.append(counter)
+    try:
+        yield counter
+    finally:
+        with _counters_lock:
+            _active_counters.remove(counter)
+
+
+@contextmanager
+def assert_max_queries(budget: int) -> Generator[QueryCounter, None, None]:
+    """Fail with QueryBudgetExceeded if the block runs more than ``budget`` statements.
+
+    Used by tests to catch N+1 query regressions.
+    """
+    with count_queries() as counter:
+        yield counter
+    if counter.count > budget:
+        statements = "\n".join(f"  {i + 1}. {s}" for i, s in enumerate(counter.statements))
+        raise QueryBudgetExceeded(
+            f"Expected at most {budget} queries, {counter.count} were executed:\n{statements}"
+        )
+
+
 # Add error handling for database operations
 def handle_database_error(e: Exception) -> None:
     """Handle database errors and log them appropriately.
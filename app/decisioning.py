@@ -0,0 +1,253 @@
+"""Automated credit decisions for pending loans.
+
+Pending loans are read in chunks of plain column values (keyset-paginated on
+``id``, served by the ``ix_loans_pending`` partial index) together with the
+borrower features the scorecard uses: ``credit_score`` and the
+:class:`~app.models.BorrowerExposure` aggregate. Each chunk is turned into
+NumPy arrays and scored in a ``ProcessPoolExecutor`` while the next chunk is
+read, then the approve/reject outcomes are written back with
+:func:`app.transitions.transition_loans`, whose conditional bulk ``UPDATE``
+only applies a decision if the loan is still at the version that was scored.
+Each chunk is committed on its own, so a long run holds no locks and an
+interrupted run simply resumes with the loans still pending. With
+``DATABASE_SHARDS`` set, :func:`decide_all_pending_loans` decides the loans of
+each shard in turn.
+
+The scorecard adds points per feature band (see :data:`SCORECARD`); loans
+scoring at least ``approve_score`` are approved unless a knockout rule
+applies (overdue repayments on existing loans, or a credit score below
+:data:`MIN_CREDIT_SCORE`).
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import Float, cast, select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionFactory
+from .jobs import job_type
+from .metrics import LOAN_DECISIONS
+from .models import Borrower, BorrowerExposure, Loan, LoanStatus, PaymentStatus
+from .sharding import get_shard_router
+from .transitions import APPLIED, transition_loans
+
+logger = logging.getLogger(__name__)
+
+# feature -> (band lower bounds, points per band); the first band is below the
+# first bound, so there is one more points value than bounds.
+SCORECARD: Dict[str, Tuple[List[float], List[int]]] = {
+    "credit_score": ([580, 620, 660, 700, 740], [0, 15, 30, 45, 60, 75]),
+    "amount": ([1000, 5000, 20000], [20, 15, 5, 0]),
+    "term_months": ([13, 25, 37], [15, 10, 5, 0]),
+    "active_loan_count": ([1, 2], [10, 5, 0]),
+}
+
+# Points for a borrower without a credit score
+MISSING_CREDIT_SCORE_POINTS = 10
+
+# Knockout: always rejected below this credit score
+MIN_CREDIT_SCORE = 500
+
+
+def score_loans(features: Dict[str, np.ndarray], approve_score: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Score a chunk of loans with :data:`SCORECARD`.
+
+    Args:
+        features: Equal-length arrays keyed by feature name, plus
+            ``overdue`` (bool); a missing ``credit_score`` is NaN.
+        approve_score: Minimum score to approve.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Scores and the approval mask.
+    """
+    credit_score = features["credit_score"]
+    missing = np.isnan(credit_score)
+    scores = np.zeros(len(credit_score), dtype=np.int32)
+    for name, (bounds, points) in SCORECARD.items():
+        values = np.nan_to_num(features[name], nan=-np.inf)
+        scores += np.asarray(points, dtype=np.int32)[np.searchsorted(bounds, values, side="right")]
+    scores[missing] += MISSING_CREDIT_SCORE_POINTS
+
+    approve = scores >= approve_score
+    approve &= ~features["overdue"]
+    approve &= missing | (credit_score >= MIN_CREDIT_SCORE)
+    return scores, approve
+
+
+def _pending_chunk(db: Session, after, chunk_size: int):
+    stmt = (
+        select(
+            Loan.id,
+            Loan.version,
+            cast(Loan.amount, Float).label("amount"),
+            Loan.term_months,
+            Borrower.credit_score,
+            BorrowerExposure.active_loan_count,
+            BorrowerExposure.worst_payment_status,
+        )
+        .join(Borrower, Borrower.id == Loan.borrower_id)
+        .outerjoin(BorrowerExposure, BorrowerExposure.borrower_id == Loan.borrower_id)
+        .where(Loan.status == LoanStatus.PENDING)
+        .order_by(Loan.id)
+        .limit(chunk_size)
+    )
+    if after is not None:
+        stmt = stmt.where(Loan.id > after)
+    return db.execute(stmt).all()
+
+
+def _features(rows) -> Dict[str, np.ndarray]:
+    count = len(rows)
+    return {
+        "credit_score": np.fromiter(
+            (np.nan if row.credit_score is None else row.credit_score for row in rows), float, count
+        ),
+        "amount": np.fromiter((row.amount for row in rows), float, count),
+        "term_months": np.fromiter((row.term_months for row in rows), float, count),
+        "active_loan_count": np.fromiter((row.active_loan_count or 0 for row in rows), float, count),
+        "overdue": np.fromiter(
+            (row.worst_payment_status == PaymentStatus.OVERDUE for row in rows), bool, count
+        ),
+    }
+
+
+def decide_pending_loans(
+    db: Session,
+    chunk_size: int = 5000,
+    workers: int = 2,
+    approve_score: int = 70,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Approve or reject pending loans with the scorecard.
+
+    Args:
+        db: SQLAlchemy session; committed after each chunk.
+        chunk_size: Loans read, scored and written per round.
+        workers: Scoring processes; 0 scores in this process.
+        approve_score: Minimum score to approve.
+        limit: Stop after this many loans.
+
+    Returns:
+        Dict[str, Any]: Counts of ``scored``, ``approved``, ``rejected`` and
+        ``conflicts`` (loans changed since they were read, left pending), the
+        run time and ``decisions_per_second``.
+    """
+    report = {"scored": 0, "approved": 0, "rejected": 0, "conflicts": 0}
+    start = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    in_flight: Deque[Tuple[List[Tuple[Any, int]], Future]] = deque()
+
+    def write(loans, scored) -> None:
+        _, approve = scored.result() if pool is not None else scored
+        results = transition_loans(
+            db,
+            (
+                (loan_id, version, LoanStatus.APPROVED if approved else LoanStatus.REJECTED)
+                for (loan_id, version), approved in zip(loans, approve.tolist())
+            ),
+            chunk_size=settings.LOAN_TRANSITION_CHUNK_SIZE,
+        )
+        db.commit()
+        for result in results:
+            if result["result"] != APPLIED:
+                decision = "conflict"
+                report["conflicts"] += 1
+            else:
+                decision = result["status"]
+                report[decision] += 1
+            LOAN_DECISIONS.labels(decision=decision).inc()
+
+    try:
+        after = None
+        while limit is None or report["scored"] < limit:
+            size = chunk_size if limit is None else min(chunk_size, limit - report["scored"])
+            rows = _pending_chunk(db, after, size)
+            # End the read transaction before handing the chunk off
+            db.commit()
+            if not rows:
+                break
+            after = rows[-1].id
+            report["scored"] += len(rows)
+            features = _features(rows)
+            loans = [(row.id, row.version) for row in rows]
+            if pool is None:
+                write(loans, score_loans(features, approve_score))
+                continue
+            # Keep the workers busy while earlier chunks are written back
+            in_flight.append((loans, pool.submit(score_loans, features, approve_score)))
+            if len(in_flight) > workers:
+                write(*in_flight.popleft())
+        while in_flight:
+            write(*in_flight.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    decided = report["approved"] + report["rejected"]
+    report["elapsed_seconds"] = round(elapsed, 3)
+    report["decisions_per_second"] = round(decided / elapsed, 1) if elapsed > 0 else 0.0
+    logger.info(
+        f"Decided {decided} pending loans ({report['approved']} approved, "
+        f"{report['rejected']} rejected, {report['conflicts']} conflicts) "
+        f"in {elapsed:.2f}s, {report['decisions_per_second']} decisions/s"
+    )
+    return report
+
+
+def decide_all_pending_loans(limit: Optional[int] = None, **kwargs: Any) -> Dict[str, Any]:
+    """Run :func:`decide_pending_loans` on the default database, or on each loan shard in turn.
+
+    ``limit`` applies to the whole run; other keyword arguments are passed through.
+
+    Returns:
+        Dict[str, Any]: The counts summed over the shards, with the total run time.
+    """
+    shards = get_shard_router()
+    if shards is None:
+        factories = [SessionFactory]
+    else:
+        factories = [shards.session_factories[shard] for shard in shards.shards]
+    report = {"scored": 0, "approved": 0, "rejected": 0, "conflicts": 0}
+    start = time.perf_counter()
+    for factory in factories:
+        remaining = None if limit is None else limit - report["scored"]
+        if remaining is not None and remaining <= 0:
+            break
+        session = factory()
+        try:
+            part = decide_pending_loans(session, limit=remaining, **kwargs)
+        finally:
+            session.close()
+        for key in ("scored", "approved", "rejected", "conflicts"):
+            report[key] += part[key]
+    elapsed = time.perf_counter() - start
+    report["elapsed_seconds"] = round(elapsed, 3)
+    report["decisions_per_second"] = (
+        round((report["approved"] + report["rejected"]) / elapsed, 1) if elapsed > 0 else 0.0
+    )
+    return report
+
+
+def _decide_from_settings(params: Dict[str, Any]) -> Dict[str, Any]:
+    return decide_all_pending_loans(
+        chunk_size=int(params.get("chunk_size", settings.DECISIONING_CHUNK_SIZE)),
+        workers=int(params.get("workers", settings.DECISIONING_WORKERS)),
+        approve_score=int(params.get("approve_score", settings.DECISIONING_APPROVE_SCORE)),
+        limit=int(params["limit"]) if params.get("limit") is not None else None,
+    )
+
+
+@job_type("decide_pending_loans", kind="io")
+async def decide_pending_loans_job(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Approve or reject all pending loans; schedule it periodically through the jobs API.
+
+    Runs in a thread, as the scoring has its own process pool.
+    """
+    return await asyncio.to_thread(_decide_from_settings, params)
@@ -0,0 +1,217 @@
+"""Per-borrower exposure aggregate.
+
+``borrower_exposure`` holds, for every borrower, the outstanding amount and
+number of active (approved or disbursed) loans and the worst status of any of
+their payments, so that ``GET /api/borrowers/{id}/exposure`` is a primary key
+lookup.
+
+Rows are maintained incrementally: an ``after_flush`` session hook collects the
+borrowers touched by inserted, updated or deleted ``Loan`` and ``Payment``
+objects and recomputes only those borrowers inside the same transaction, after
+locking their ``borrowers`` rows so that concurrent writers for the same
+borrower recompute one after the other and each sees the other's rows. Code
+that writes loans or payments with Core/bulk statements, which bypass the ORM
+flush, must call :func:`refresh_borrower_exposure` itself.
+:func:`rebuild_all` recomputes every borrower in parallel chunks.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Set
+from uuid import UUID
+
+from sqlalchemy import case, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .db import SessionFactory
+from .models import Borrower, BorrowerExposure, Loan, LoanStatus, Payment, PaymentStatus
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_LOAN_STATUSES = (LoanStatus.APPROVED, LoanStatus.DISBURSED)
+
+# Higher is worse
+PAYMENT_STATUS_SEVERITY = {
+    PaymentStatus.PAID: 1,
+    PaymentStatus.PENDING: 2,
+    PaymentStatus.FAILED: 3,
+    PaymentStatus.OVERDUE: 4,
+}
+_SEVERITY_STATUS = {v: k for k, v in PAYMENT_STATUS_SEVERITY.items()}
+
+
+def exposure_select(borrower_ids: Optional[Iterable[UUID]] = None):
+    """Build the aggregate query computing exposure rows per borrower.
+
+    With ``borrower_ids`` only the loans and payments of those borrowers are
+    read.
+    """
+    if borrower_ids is not None:
+        borrower_ids = list(borrower_ids)
+    severity = case(
+        *((Payment.status == status, value) for status, value in PAYMENT_STATUS_SEVERITY.items())
+    )
+    per_loan = select(
+        Payment.loan_id.label("loan_id"),
+        func.coalesce(
+            func.sum(case((Payment.status == PaymentStatus.PAID, Payment.paid_amount), else_=0)), 0
+        ).label("paid"),
+        func.max(severity).label("worst"),
+    ).group_by(Payment.loan_id)
+    if borrower_ids is not None:
+        per_loan = per_loan.where(
+            Payment.loan_id.in_(select(Loan.id).where(Loan.borrower_id.in_(borrower_ids)))
+        )
+    per_loan = per_loan.subquery()
+    active = Loan.status.in_(ACTIVE_LOAN_STATUSES)
+    stmt = (
+        select(
+            Loan.borrower_id,
+            func.coalesce(
+                func.sum(case((active, Loan.amount - func.coalesce(per_loan.c.paid, 0)), else_=0)), 0
+            ).label("outstanding_amount"),
+            func.coalesce(func.sum(case((active, 1), else_=0)), 0).label("active_loan_count"),
+            func.max(per_loan.c.worst).label("worst"),
+        )
+        .outerjoin(per_loan, per_loan.c.loan_id == Loan.id)
+        .group_by(Loan.borrower_id)
+    )
+    if borrower_ids is not None:
+        stmt = stmt.where(Loan.borrower_id.in_(borrower_ids))
+    return stmt
+
+
+def refresh_borrower_exposure(connection: Connection, borrower_ids: Iterable[UUID]) -> int:
+    """Recompute and upsert exposure rows for ``borrower_ids`` on ``connection``.
+
+    Borrowers without loans are reset to zero. Ids that do not belong to a
+    borrower are ignored.
+
+    Returns:
+        int: Number of exposure rows written.
+    """
+    borrower_ids = set(borrower_ids)
+    if not borrower_ids:
+        return 0
+
+    # Serialize writers per borrower; under READ COMMITTED the aggregate below
+    # then sees every committed loan and payment. NO KEY UPDATE does not wait
+    # for the KEY SHARE locks that inserting loans takes on their borrower.
+    existing = list(
+        connection.scalars(
+            select(Borrower.id)
+            .where(Borrower.id.in_(list(borrower_ids)))
+            .order_by(Borrower.id)
+            .with_for_update(key_share=True)
+        )
+    )
+    if not existing:
+        return 0
+    computed = {
+        row.borrower_id: row for row in connection.execute(exposure_select(existing))
+    }
+    values = []
+    for borrower_id in existing:
+        row = computed.get(borrower_id)
+        values.append({
+            "borrower_id": borrower_id,
+            "outstanding_amount": max(row.outstanding_amount, 0) if row else 0,
+            "active_loan_count": row.active_loan_count if row else 0,
+            "worst_payment_status": _SEVERITY_STATUS.get(row.worst) if row else None,
+        })
+
+    insert = pg_insert if connection.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(BorrowerExposure)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BorrowerExposure.borrower_id],
+        set_={
+            "outstanding_amount": stmt.excluded.outstanding_amount,
+            "active_loan_count": stmt.excluded.active_loan_count,
+            "worst_payment_status": stmt.excluded.worst_payment_status,
+            "updated_at": func.now(),
+        },
+    )
+    connection.execute(stmt, values)
+    return len(values)
+
+
+def _affected_borrowers(session: Session) -> Set[UUID]:
+    borrower_ids: Set[UUID] = set()
+    loan_ids: Set[UUID] = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Loan):
+            history = inspect(obj).attrs.borrower_id.history
+            borrower_ids.update(v for v in history.sum() if v)
+        elif isinstance(obj, Payment):
+            history = inspect(obj).attrs.loan_id.history
+            loan_ids.update(v for v in history.sum() if v)
+    if loan_ids:
+        borrower_ids.update(
+            session.connection().scalars(select(Loan.borrower_id).where(Loan.id.in_(list(loan_ids))))
+        )
+    return borrower_ids
+
+
+@event.listens_for(Session, "after_flush")
+def maintain_borrower_exposure(session, flush_context):
+    """Recompute exposure for borrowers whose loans or payments were flushed."""
+    if not any(
+        isinstance(obj, (Loan, Payment)) for obj in (*session.new, *session.dirty, *session.deleted)
+    ):
+        return
+    borrower_ids = _affected_borrowers(session)
+    if borrower_ids:
+        refresh_borrower_exposure(session.connection(), borrower_ids)
+
+
+def get_exposure(db: Session, borrower_id: UUID) -> Optional[BorrowerExposure]:
+    """Read a borrower's exposure row by primary key."""
+    return db.get(BorrowerExposure, borrower_id)
+
+
+def _rebuild_chunk(borrower_ids: List[UUID]) -> int:
+    session = SessionFactory()
+    try:
+        written = refresh_borrower_exposure(session.connection(), borrower_ids)
+        session.commit()
+        return written
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+        SessionFactory.remove()
+
+
+def rebuild_all(chunk_size: int = 1000, workers: int = 4) -> int:
+    """Recompute exposure for every borrower, ``chunk_size`` borrowers per task.
+
+    Chunks are built by keyset pagination over ``borrowers.id`` and processed by
+    ``workers`` threads, each with its own session and transaction.
+
+    Returns:
+        int: Number of exposure rows written.
+    """
+    total = 0
+    session = SessionFactory()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            last_id = None
+            while True:
+                stmt = select(Borrower.id).order_by(Borrower.id).limit(chunk_size)
+                if last_id is not None:
+                    stmt = stmt.where(Borrower.id > last_id)
+                chunk = list(session.scalars(stmt))
+                if not chunk:
+                    break
+                last_id = chunk[-1]
+                futures.append(pool.submit(_rebuild_chunk, chunk))
+            for future in futures:
+                total += future.result()
+    finally:
+        session.close()
+    logger.info(f"Rebuilt exposure for {total} borrowers")
+    return total
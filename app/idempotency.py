@@ -0,0 +1,369 @@
+"""Idempotency-Key support for retried write requests.
+
+A client that times out and retries ``POST /api/loans`` would otherwise create
+the loan twice. When the request carries an ``Idempotency-Key`` header,
+:class:`IdempotencyStore` runs the handler at most once per key and answers
+repeats with the stored status code and body:
+
+1. a bounded in-memory LRU of finished responses answers most repeats
+   without touching the database;
+2. a repeat arriving while the first attempt is still running in this
+   process waits for it;
+3. otherwise the key is claimed with ``INSERT ... ON CONFLICT DO NOTHING``
+   into ``idempotency_keys``. A key already finished by another process is
+   replayed from the table; one still running there is polled until it
+   finishes, or taken over once its lock is older than ``lock_seconds``
+   (the first attempt crashed, or is slow).
+
+The claim records a ``resource_id`` chosen by the caller, and the handler
+creates its resource under that id. An attempt taking the key over for the
+same request gets the recorded id rather than a new one, so if the first
+attempt did create the resource (it is still running, or crashed before its
+response was saved) the second one collides with it on the primary key and
+answers with the existing resource instead of creating another. Only the
+current holder of a claim can save a response for it or release it.
+
+If the handler raises, the claim is released so a retry can take it over at
+once. Reusing a key with a different request body is an error. Keys expire
+after ``ttl`` and are deleted in batches by :func:`purge_expired` (also
+available as the ``purge_idempotency_keys`` job).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .config import settings
+from .db import SessionFactory
+from .jobs import job_type
+from .metrics import IDEMPOTENT_REQUESTS
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+# Delay between checks of a key being executed by another process
+_POLL_INTERVAL = 0.05
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a request with a different body."""
+
+
+class Claim(NamedTuple):
+    locked_at: datetime
+    resource_id: Optional[str]
+
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int
+    body: Any
+    expires_at: datetime
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite returns naive datetimes
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def request_hash(payload: Any) -> str:
+    """Fingerprint of a request body, compared when a key is reused."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Execute a request handler at most once per idempotency key.
+
+    Args:
+        ttl: Seconds a stored response is replayed for.
+        cache_size: Finished responses kept in memory.
+        lock_seconds: Age after which an unfinished claim is considered
+            abandoned and can be taken over.
+        session_factory: Callable returning a new SQLAlchemy session.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 86400,
+        cache_size: int = 10000,
+        lock_seconds: float = 30,
+        session_factory=SessionFactory,
+    ) -> None:
+        self.ttl = timedelta(seconds=ttl)
+        self.cache_size = cache_size
+        self.lock = timedelta(seconds=lock_seconds)
+        self.session_factory = session_factory
+        self._cache: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Optional[StoredResponse]]"] = {}
+
+    async def execute(
+        self,
+        key: str,
+        request_hash: str,
+        handler: Callable[[Optional[str]], Awaitable[Tuple[int, Any]]],
+        resource_id: Optional[str] = None,
+    ) -> Tuple[int, Any, bool]:
+        """Run ``handler`` unless ``key`` was already used.
+
+        Args:
+            key: Idempotency-Key header value.
+            request_hash: Fingerprint of the request (see :func:`request_hash`).
+            handler: Coroutine function called with the resource id to create
+                under and returning ``(status_code, body)``; the body must be
+                JSON-serialisable.
+            resource_id: Fresh id for the resource; an attempt taking over
+                the key is given the id recorded by the first one instead.
+
+        Returns:
+            Tuple[int, Any, bool]: Status code, body and whether the response
+            was replayed.
+
+        Raises:
+            IdempotencyKeyReused: If ``key`` was used for a different request.
+        """
+        while True:
+            stored = self._cached(key)
+            if stored is not None:
+                IDEMPOTENT_REQUESTS.labels(result="replayed_cache").inc()
+                return self._replay(stored, request_hash)
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            stored = await asyncio.shield(pending)
+            if stored is not None:
+                IDEMPOTENT_REQUESTS.labels(result="replayed_waiting").inc()
+                return self._replay(stored, request_hash)
+            # The first attempt failed: try again ourselves
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            stored, executed = await self._execute(key, request_hash, handler, resource_id)
+        except BaseException:
+            future.set_result(None)
+            raise
+        else:
+            future.set_result(stored)
+        finally:
+            del self._inflight[key]
+
+        self._remember(key, stored)
+        if executed:
+            IDEMPOTENT_REQUESTS.labels(result="executed").inc()
+            return stored.status_code, stored.body, False
+        IDEMPOTENT_REQUESTS.labels(result="replayed_db").inc()
+        return self._replay(stored, request_hash)
+
+    async def _execute(self, key, request_hash, handler, resource_id) -> Tuple[StoredResponse, bool]:
+        while True:
+            claim, stored = await asyncio.to_thread(self._claim, key, request_hash, resource_id)
+            if claim is not None:
+                break
+            if stored is not None and stored.status_code is not None:
+                return stored, False
+            if stored is not None:
+                self._replay(stored, request_hash)
+            # Still running in another process
+            await asyncio.sleep(_POLL_INTERVAL)
+
+        try:
+            status_code, body = await handler(claim.resource_id)
+        except BaseException:
+            await asyncio.to_thread(self._release, key, claim)
+            raise
+        stored = StoredResponse(request_hash, status_code, body, _utcnow() + self.ttl)
+        await asyncio.to_thread(self._save, key, claim, stored)
+        return stored, True
+
+    def _replay(self, stored: StoredResponse, request_hash: str) -> Tuple[int, Any, bool]:
+        if stored.request_hash != request_hash:
+            raise IdempotencyKeyReused("Idempotency-Key was already used for a different request")
+        return stored.status_code, stored.body, True
+
+    def _cached(self, key: str) -> Optional[StoredResponse]:
+        stored = self._cache.get(key)
+        if stored is None:
+            return None
+        if stored.expires_at <= _utcnow():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return stored
+
+    def _remember(self, key: str, stored: StoredResponse) -> None:
+        self._cache[key] = stored
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _claim(
+        self, key: str, request_hash: str, resource_id: Optional[str]
+    ) -> Tuple[Optional[Claim], Optional[StoredResponse]]:
+        """Reserve ``key``; if it is taken, return what is stored for it."""
+        session = self.session_factory()
+        try:
+            now = _utcnow()
+            values = dict(
+                request_hash=request_hash,
+                status_code=None,
+                response=None,
+                locked_at=now,
+                expires_at=now + self.ttl,
+            )
+            insert_ = pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+            claimed = session.execute(
+                insert_(IdempotencyKey)
+                .values(key=key, resource_id=resource_id, **values)
+                .on_conflict_do_nothing(index_elements=["key"])
+                .returning(IdempotencyKey.resource_id)
+            ).one_or_none()
+            if claimed is None:
+                # Expired, or abandoned by an attempt that never finished.
+                # The same request keeps the id the abandoned attempt may
+                # already have created its resource under.
+                same_request = and_(
+                    IdempotencyKey.expires_at > now,
+                    IdempotencyKey.request_hash == request_hash,
+                    IdempotencyKey.resource_id.is_not(None),
+                )
+                claimed = session.execute(
+                    update(IdempotencyKey)
+                    .where(
+                        IdempotencyKey.key == key,
+                        or_(
+                            IdempotencyKey.expires_at <= now,
+                            and_(
+                                IdempotencyKey.status_code.is_(None),
+                                IdempotencyKey.locked_at <= now - self.lock,
+                            ),
+                        ),
+                    )
+                    .values(
+                        resource_id=case(
+                            (same_request, IdempotencyKey.resource_id), else_=resource_id
+                        ),
+                        **values,
+                    )
+                    .returning(IdempotencyKey.resource_id)
+                ).one_or_none()
+            stored = None
+            if claimed is None:
+                row = session.execute(
+                    select(
+                        IdempotencyKey.request_hash,
+                        IdempotencyKey.status_code,
+                        IdempotencyKey.response,
+                        IdempotencyKey.expires_at,
+                    ).where(IdempotencyKey.key == key)
+                ).one_or_none()
+                if row is not None:
+                    stored = StoredResponse(
+                        row.request_hash, row.status_code, row.response, _aware(row.expires_at)
+                    )
+            session.commit()
+            if claimed is None:
+                return None, stored
+            return Claim(now, claimed.resource_id), None
+        finally:
+            session.close()
+
+    def _save(self, key: str, claim: Claim, stored: StoredResponse) -> None:
+        session = self.session_factory()
+        try:
+            # Not if another attempt has taken the key over meanwhile
+            session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key, IdempotencyKey.locked_at == claim.locked_at)
+                .values(
+                    status_code=stored.status_code,
+                    response=stored.body,
+                    expires_at=stored.expires_at,
+                )
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def _release(self, key: str, claim: Claim) -> None:
+        session = self.session_factory()
+        try:
+            # Kept rather than deleted: the handler may have created the
+            # resource before failing, and a retry must reuse its id.
+            session.execute(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.locked_at == claim.locked_at,
+                    IdempotencyKey.status_code.is_(None),
+                )
+                .values(locked_at=claim.locked_at - self.lock)
+            )
+            session.commit()
+        finally:
+            session.close()
+
+
+def purge_expired(batch_size: int = 1000, session_factory=SessionFactory) -> int:
+    """Delete expired keys, ``batch_size`` rows per transaction.
+
+    Returns:
+        int: Number of keys deleted.
+    """
+    deleted = 0
+    session = session_factory()
+    try:
+        while True:
+            expired = (
+                select(IdempotencyKey.key)
+                .where(IdempotencyKey.expires_at <= _utcnow())
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            count = session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired))
+            ).rowcount
+            session.commit()
+            deleted += count
+            if count < batch_size:
+                return deleted
+    finally:
+        session.close()
+
+
+@job_type("purge_idempotency_keys", kind="process")
+def purge_idempotency_keys(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Delete expired idempotency keys in batches."""
+    deleted = purge_expired(int(params.get("batch_size", settings.IDEMPOTENCY_PURGE_BATCH_SIZE)))
+    logger.info(f"Purged {deleted} expired idempotency keys")
+    return {"deleted": deleted}
+
+
+_store: Optional[IdempotencyStore] = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Return the process-wide idempotency store configured from settings.
+
+    Also used as a FastAPI dependency, so tests can override it.
+    """
+    global _store
+    if _store is None:
+        _store = IdempotencyStore(
+            ttl=settings.IDEMPOTENCY_KEY_TTL_SECONDS,
+            cache_size=settings.IDEMPOTENCY_CACHE_SIZE,
+            lock_seconds=settings.IDEMPOTENCY_LOCK_SECONDS,
+        )
+    return _store
@@ -0,0 +1,412 @@
+"""Lightweight background job runner.
+
+Heavy work such as full exports, repayment schedule generation or recomputing
+statistics should not run inside a request handler. Jobs are persisted in the
+``jobs`` table, which doubles as a durable queue, and executed by a fixed
+number of asyncio workers inside the API process, so no external broker is
+needed:
+
+* ``process`` jobs are CPU-bound and run in a ``ProcessPoolExecutor``;
+* ``io`` jobs are coroutines and run on the event loop.
+
+Failed jobs are retried with exponential backoff up to ``max_attempts``.
+Several runners (API processes) can share the table: a job is claimed with a
+conditional ``UPDATE ... WHERE status = 'queued'``, so only one of them
+executes it, and the claiming runner holds a lease on it that it keeps
+extending while the job runs. When a runner starts (on application startup)
+it picks up queued jobs and jobs left ``running`` by a runner whose lease
+expired (a crashed process), never those still leased by a live runner; while
+it runs it repeats the scan for expired leases every ``lease`` seconds, so the
+jobs of a peer that crashed are picked up too.
+"""
+import asyncio
+import csv
+import logging
+import os
+import socket
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+from uuid import UUID
+
+from sqlalchemy import or_, select, update
+
+from .config import settings
+from .db import SessionFactory, engine
+from .models import Job, JobStatus, Loan
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[Dict[str, Any]], Union[Dict[str, Any], Awaitable[Dict[str, Any]]]]
+
+
+@dataclass(frozen=True)
+class JobType:
+    name: str
+    func: JobFunc
+    kind: str
+
+
+JOB_TYPES: Dict[str, JobType] = {}
+
+
+def job_type(name: str, kind: str = "process") -> Callable[[JobFunc], JobFunc]:
+    """Register a job handler.
+
+    ``process`` handlers must be module-level functions taking the job params
+    and returning a JSON-serialisable dict. ``io`` handlers are coroutine
+    functions with the same signature.
+    """
+    if kind not in ("process", "io"):
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    def decorator(func: JobFunc) -> JobFunc:
+        JOB_TYPES[name] = JobType(name=name, func=func, kind=kind)
+        return func
+
+    return decorator
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _init_worker_process() -> None:
+    # Connections inherited from the parent must not be reused in the child.
+    engine.dispose(close=False)
+
+
+class JobRunner:
+    """Execute persisted jobs with bounded concurrency.
+
+    Args:
+        concurrency: Number of jobs executing at the same time.
+        process_workers: Size of the process pool for ``process`` jobs.
+        retry_backoff: Base delay in seconds before a failed job is retried.
+        lease: Seconds a running job stays claimed without a heartbeat; it is
+            renewed every third of that while the job runs.
+        session_factory: Callable returning a new SQLAlchemy session.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        process_workers: int = 2,
+        retry_backoff: float = 2.0,
+        lease: float = 60.0,
+        session_factory=SessionFactory,
+    ) -> None:
+        self.concurrency = concurrency
+        self.process_workers = process_workers
+        self.retry_backoff = retry_backoff
+        self.lease = lease
+        self.session_factory = session_factory
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: Optional["asyncio.Queue[UUID]"] = None
+        self._workers: List[asyncio.Task] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        """Start the workers and re-enqueue unfinished jobs."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.process_workers, initializer=_init_worker_process
+        )
+        for job_id in await asyncio.to_thread(self._recover):
+            self._queue.put_nowait(job_id)
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+        self._workers.append(asyncio.create_task(self._recover_expired()))
+
+    async def stop(self) -> None:
+        """Stop the workers; interrupted jobs are recovered on next start."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def submit(
+        self, name: str, params: Optional[Dict[str, Any]] = None, max_attempts: Optional[int] = None
+    ) -> Job:
+        """Persist a new job of type ``name`` and queue it for execution."""
+        if name not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {name}")
+        await self.start()
+        job = await asyncio.to_thread(
+            self._create, name, params or {}, max_attempts or settings.JOBS_MAX_ATTEMPTS
+        )
+        self._queue.put_nowait(job.id)
+        return job
+
+    def get(self, job_id: UUID) -> Optional[Job]:
+        session = self.session_factory()
+        try:
+            return session.get(Job, job_id)
+        finally:
+            session.close()
+
+    def _create(self, name: str, params: Dict[str, Any], max_attempts: int) -> Job:
+        session = self.session_factory()
+        try:
+            job = Job(type=name, params=params, status=JobStatus.QUEUED, attempts=0, max_attempts=max_attempts)
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            return job
+        finally:
+            session.close()
+
+    def _recover(self, queued: bool = True) -> List[UUID]:
+        """Re-queue jobs whose lease expired; return them, and all queued jobs if ``queued``."""
+        session = self.session_factory()
+        try:
+            # Jobs of runners that stopped renewing their lease
+            job_ids = session.scalars(
+                update(Job)
+                .where(
+                    Job.status == JobStatus.RUNNING,
+                    or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < _utcnow()),
+                )
+                .values(status=JobStatus.QUEUED, runner_id=None, lease_expires_at=None)
+                .returning(Job.id)
+            ).all()
+            if queued:
+                job_ids = session.scalars(
+                    select(Job.id).where(Job.status == JobStatus.QUEUED).order_by(Job.created_at)
+                ).all()
+            session.commit()
+            return list(job_ids)
+        finally:
+            session.close()
+
+    async def _recover_expired(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease)
+            try:
+                job_ids = await asyncio.to_thread(self._recover, False)
+            except Exception as e:
+                logger.error(f"Job recovery failed: {e}")
+                continue
+            if job_ids:
+                logger.warning(f"Recovered {len(job_ids)} jobs with an expired lease")
+            for job_id in job_ids:
+                self._queue.put_nowait(job_id)
+
+    def _update(self, job_id: UUID, **values: Any) -> bool:
+        """Update a job this runner holds; False if another runner took it over."""
+        session = self.session_factory()
+        try:
+            result = session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == JobStatus.RUNNING, Job.runner_id == self.runner_id)
+                .values(**values)
+            )
+            session.commit()
+            return result.rowcount == 1
+        finally:
+            session.close()
+
+    def _claim(self, job_id: UUID) -> Optional[Job]:
+        session = self.session_factory()
+        try:
+            now = _utcnow()
+            job = session.scalars(
+                update(Job)
+                .where(Job.id == job_id, Job.status == JobStatus.QUEUED)
+                .values(
+                    status=JobStatus.RUNNING,
+                    attempts=Job.attempts + 1,
+                    started_at=now,
+                    runner_id=self.runner_id,
+                    lease_expires_at=now + timedelta(seconds=self.lease),
+                )
+                .returning(Job)
+            ).one_or_none()
+            session.commit()
+            return job
+        finally:
+            session.close()
+
+    async def _heartbeat(self, job_id: UUID) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            renewed = await asyncio.to_thread(
+                self._update, job_id, lease_expires_at=_utcnow() + timedelta(seconds=self.lease)
+            )
+            if not renewed:
+                logger.warning(f"Lost the lease on job {job_id}")
+                return
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job runner error for job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: UUID) -> None:
+        job = await asyncio.to_thread(self._claim, job_id)
+        if job is None:
+            return
+
+        handler = JOB_TYPES.get(job.type)
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job type: {job.type}")
+            if handler.kind == "process":
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._pool, handler.func, job.params)
+            else:
+                result = await handler.func(job.params)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job.attempts < job.max_attempts and handler is not None:
+                delay = self.retry_backoff * 2 ** (job.attempts - 1)
+                logger.warning(f"Job {job_id} attempt {job.attempts} failed, retrying in {delay}s: {error}")
+                released = await asyncio.to_thread(
+                    self._update, job_id, status=JobStatus.QUEUED, error=error, runner_id=None, lease_expires_at=None
+                )
+                if released:
+                    asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job_id)
+            else:
+                logger.error(f"Job {job_id} failed after {job.attempts} attempts: {error}")
+                await asyncio.to_thread(
+                    self._update, job_id, status=JobStatus.FAILED, error=error, finished_at=_utcnow()
+                )
+            return
+        finally:
+            heartbeat.cancel()
+
+        await asyncio.to_thread(
+            self._update, job_id, status=JobStatus.SUCCEEDED, result=result, error=None, finished_at=_utcnow()
+        )
+
+
+# Built-in job types
+
+@job_type("recompute_stats", kind="process")
+def recompute_stats(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Recompute loan statistics in a single pass over the loans table."""
+    total_count = 0
+    total_amount = Decimal("0")
+    by_status: Dict[str, int] = {}
+    by_currency: Dict[str, int] = {}
+    session = SessionFactory()
+    try:
+        rows = session.execute(
+            select(Loan.amount, Loan.status, Loan.currency).execution_options(yield_per=10000)
+        )
+        for amount, status, currency in rows:
+            total_count += 1
+            total_amount += amount
+            status = getattr(status, "value", status)
+            by_status[status] = by_status.get(status, 0) + 1
+            by_currency[currency] = by_currency.get(currency, 0) + 1
+    finally:
+        session.close()
+    return {
+        "total_loans": total_count,
+        "total_amount": float(total_amount),
+        "avg_amount": float(total_amount / total_count) if total_count else 0.0,
+        "by_status": by_status,
+        "by_currency": by_currency,
+    }
+
+
+@job_type("repayment_schedule", kind="process")
+def repayment_schedule(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate the amortization schedule of a loan."""
+    session = SessionFactory()
+    try:
+        loan = session.get(Loan, UUID(str(params["loan_id"])))
+        if loan is None:
+            raise ValueError(f"Loan {params['loan_id']} not found")
+        principal = Decimal(loan.amount)
+        monthly_rate = Decimal(loan.interest_rate_apr or 0) / 100 / 12
+        term = loan.term_months
+    finally:
+        session.close()
+
+    if monthly_rate == 0:
+        payment = principal / term
+    else:
+        payment = principal * monthly_rate / (1 - (1 + monthly_rate) ** -term)
+
+    schedule = []
+    balance = principal
+    for month in range(1, term + 1):
+        interest = balance * monthly_rate
+        principal_part = payment - interest if month < term else balance
+        balance -= principal_part
+        schedule.append({
+            "month": month,
+            "payment": str((principal_part + interest).quantize(Decimal("0.01"))),
+            "principal": str(principal_part.quantize(Decimal("0.01"))),
+            "interest": str(interest.quantize(Decimal("0.01"))),
+            "balance": str(balance.quantize(Decimal("0.01"))),
+        })
+    return {"loan_id": str(params["loan_id"]), "schedule": schedule}
+
+
+def _write_loans_csv(path: str) -> int:
+    columns = [c.name for c in Loan.__table__.columns]
+    rows = 0
+    session = SessionFactory()
+    try:
+        result = session.execute(
+            select(*Loan.__table__.columns).order_by(Loan.created_at).execution_options(yield_per=10000)
+        )
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for partition in result.partitions():
+                writer.writerows(
+                    [getattr(value, "value", value) for value in row] for row in partition
+                )
+                rows += len(partition)
+    finally:
+        session.close()
+    return rows
+
+
+@job_type("export_loans", kind="io")
+async def export_loans(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Stream all loans to a CSV file in ``JOBS_EXPORT_DIR``."""
+    os.makedirs(settings.JOBS_EXPORT_DIR, exist_ok=True)
+    filename = f"loans-{_utcnow().strftime('%Y%m%dT%H%M%S%f')}.csv"
+    path = os.path.join(settings.JOBS_EXPORT_DIR, filename)
+    rows = await asyncio.to_thread(_write_loans_csv, path)
+    return {"path": path, "rows": rows}
+
+
+_runner: Optional[JobRunner] = None
+
+
+def get_job_runner() -> JobRunner:
+    """Return the process-wide job runner configured from settings."""
+    global _runner
+    if _runner is None:
+        _runner = JobRunner(
+            concurrency=settings.JOBS_CONCURRENCY,
+            process_workers=settings.JOBS_PROCESS_POOL_SIZE,
+            retry_backoff=settings.JOBS_RETRY_BACKOFF_SECONDS,
+            lease=settings.JOBS_LEASE_SECONDS,
+        )
+    return _runner
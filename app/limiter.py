@@ -0,0 +1,230 @@
+"""Adaptive concurrency limiting and load shedding.
+
+When Postgres slows down, requests otherwise queue on the connection pool for
+up to ``DATABASE_POOL_TIMEOUT`` seconds and latency explodes on every worker.
+The :class:`AdaptiveConcurrencyMiddleware` caps the number of in-flight
+requests with a limit that adapts to observed latency (AIMD with a Vegas-style
+latency baseline kept per route, so that a route that is always slower than
+another is not mistaken for congestion), keeps a small bounded wait queue and
+sheds everything beyond it with a fast ``503``. Client errors (``4xx``) return
+early and say nothing about database latency, so they do not move the limit. Health probes bypass the limiter entirely so that
+orchestrators never mistake shedding for a dead process.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from time import monotonic
+from typing import Any, Deque, Dict, Hashable, Iterable, Optional
+
+from .metrics import CONCURRENCY_IN_FLIGHT, CONCURRENCY_LIMIT, CONCURRENCY_QUEUE_DEPTH, REQUESTS_SHED
+
+logger = logging.getLogger(__name__)
+
+
+class LimitExceeded(Exception):
+    """Raised when a request can neither run nor wait in the queue."""
+
+
+class AdaptiveLimiter:
+    """Latency-adaptive concurrency limit with a bounded FIFO wait queue.
+
+    The limit grows additively while latency stays within ``tolerance`` times
+    the observed baseline (the lowest recent latency of the same route) and
+    shrinks multiplicatively by ``backoff`` when latency exceeds it or a
+    request fails. Baselines slowly decay upwards so that they can follow a
+    permanent change in the workload.
+
+    Args:
+        initial_limit: Starting concurrency limit.
+        min_limit: Lower bound for the limit.
+        max_limit: Upper bound for the limit.
+        max_queue: Maximum number of requests waiting for a slot.
+        queue_timeout: Seconds a request may wait for a slot before shedding.
+        tolerance: Latency multiple of the baseline considered congestion.
+        backoff: Multiplicative decrease factor applied on congestion.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 15,
+        min_limit: int = 1,
+        max_limit: int = 200,
+        max_queue: int = 50,
+        queue_timeout: float = 1.0,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        # Route -> lowest recent latency
+        self.baselines: Dict[Any, float] = {}
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        self._last_decrease = 0.0
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """Wait for a slot, raising :class:`LimitExceeded` if none is available."""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self._enter()
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            raise LimitExceeded("wait queue is full")
+
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[None]" = loop.create_future()
+        self._waiters.append(future)
+        CONCURRENCY_QUEUE_DEPTH.set(len(self._waiters))
+        timer = loop.call_later(self.queue_timeout, self._expire, future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Cancelled after ``_wake_waiters`` handed us a slot: pass it on
+                self._leave()
+                self._wake_waiters()
+            raise
+        finally:
+            timer.cancel()
+            if future in self._waiters:
+                self._waiters.remove(future)
+            CONCURRENCY_QUEUE_DEPTH.set(len(self._waiters))
+        # The slot was handed over by ``release`` which already counted it.
+
+    @staticmethod
+    def _expire(future: "asyncio.Future[None]") -> None:
+        if not future.done():
+            future.set_exception(LimitExceeded("timed out waiting for a slot"))
+
+    def release(
+        self, latency: float, failed: bool = False, route: Hashable = None, sample: bool = True
+    ) -> None:
+        """Return a slot and feed the request latency into the limit.
+
+        Args:
+            latency: Seconds the request took.
+            failed: The request failed (``5xx``); counts as congestion.
+            route: Key of the route, whose baseline the latency is compared to.
+            sample: False to leave the limit alone (client errors).
+        """
+        self._leave()
+        if sample or failed:
+            self._update_limit(latency, failed, route)
+        self._wake_waiters()
+
+    def _enter(self) -> None:
+        self.in_flight += 1
+        CONCURRENCY_IN_FLIGHT.set(self.in_flight)
+
+    def _leave(self) -> None:
+        self.in_flight -= 1
+        CONCURRENCY_IN_FLIGHT.set(self.in_flight)
+
+    def _update_limit(self, latency: float, failed: bool, route: Hashable) -> None:
+        baseline = self.baselines.get(route)
+        if baseline is None or latency < baseline:
+            baseline = latency
+        else:
+            # Let the baseline drift towards current latency very slowly.
+            baseline += (latency - baseline) * 0.001
+        self.baselines[route] = baseline
+
+        congested = failed or latency > baseline * self.tolerance
+        if congested:
+            # Decrease at most once per baseline interval to avoid collapsing
+            # the limit on a single burst of slow responses.
+            now = monotonic()
+            if now - self._last_decrease >= max(baseline, 0.01):
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        elif self.in_flight + 1 >= int(self.limit):
+            # Only grow while the limit is actually the bottleneck.
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self._enter()
+                future.set_result(None)
+        CONCURRENCY_QUEUE_DEPTH.set(len(self._waiters))
+
+
+class AdaptiveConcurrencyMiddleware:
+    """ASGI middleware applying an :class:`AdaptiveLimiter` to HTTP requests.
+
+    Args:
+        app: The wrapped ASGI application.
+        limiter: Limiter instance; a default one is created when omitted.
+        exempt_paths: Path prefixes that bypass the limiter (health probes).
+        retry_after: Value of the ``Retry-After`` header on shed responses.
+    """
+
+    def __init__(
+        self,
+        app,
+        limiter: Optional[AdaptiveLimiter] = None,
+        exempt_paths: Iterable[str] = ("/health", "/api/health", "/metrics"),
+        retry_after: int = 1,
+    ):
+        self.app = app
+        self.limiter = limiter or AdaptiveLimiter()
+        self.exempt_paths = tuple(exempt_paths)
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].startswith(self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.limiter.acquire()
+        except LimitExceeded as e:
+            REQUESTS_SHED.labels(reason=str(e)).inc()
+            await self._shed(send, str(e))
+            return
+
+        start_time = monotonic()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched endpoint in the (shared) scope
+            self.limiter.release(
+                monotonic() - start_time,
+                failed=status_code >= 500,
+                route=scope.get("endpoint"),
+                sample=status_code < 400,
+            )
+
+    async def _shed(self, send, reason: str) -> None:
+        body = json.dumps({"detail": "Service overloaded, retry later", "reason": reason}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 503,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(self.retry_after).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -10,6 +10,8 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 import time
 import uuid
+from app.config import settings
+from app.limiter import AdaptiveConcurrencyMiddleware, AdaptiveLimiter
 from app.metrics import PrometheusMiddleware, get_metrics_route
 
 # Configure structured logging first
@@ -91,8 +93,37 @@ except ImportError as e:
     logger.warning(f"Failed to import health router: {str(e)}. Health check endpoint may not work as expected.")
 
 
+# On-demand profiling (only installed when enabled, so it costs nothing otherwise)
+if settings.PROFILING_ENABLED:
+    from app.profiling import ProfilingMiddleware, profile_store
+    from app.routes import profiling as profiling_router
+
+    app.include_router(profiling_router.router, prefix="/api", tags=["profiling"])
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=profile_store,
+        token=settings.PROFILING_TOKEN,
+        sample_rate=settings.PROFILING_SAMPLE_RATE,
+        sample_interval=settings.PROFILING_SAMPLE_INTERVAL_MS / 1000,
+    )
+
+
 # Add Prometheus metrics endpoint
 app.add_route("/metrics", get_metrics_route())
 
+# Add adaptive concurrency limiting (inside Prometheus so shed requests are counted)
+if settings.CONCURRENCY_LIMIT_ENABLED:
+    app.add_middleware(
+        AdaptiveConcurrencyMiddleware,
+        limiter=AdaptiveLimiter(
+            initial_limit=settings.CONCURRENCY_LIMIT_INITIAL,
+            min_limit=settings.CONCURRENCY_LIMIT_MIN,
+            max_limit=settings.CONCURRENCY_LIMIT_MAX,
+            max_queue=settings.CONCURRENCY_QUEUE_SIZE,
+            queue_timeout=settings.CONCURRENCY_QUEUE_TIMEOUT_MS / 1000,
+            tolerance=settings.CONCURRENCY_LATENCY_TOLERANCE,
+        ),
+    )
+
 # Add Prometheus middleware
 app.add_middleware(PrometheusMiddleware)
\ No newline at end of file
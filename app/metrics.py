@@ -1,4 +1,4 @@
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from fastapi import Response
 from fastapi.routing import APIRoute
 from time import time
@@ -16,6 +16,104 @@ REQUEST_LATENCY = Histogram(
     ['method', 'endpoint']
 )
 
+CONCURRENCY_LIMIT = Gauge(
+    'http_concurrency_limit',
+    'Current adaptive concurrency limit'
+)
+
+CONCURRENCY_IN_FLIGHT = Gauge(
+    'http_concurrency_in_flight',
+    'Number of requests currently holding a concurrency slot'
+)
+
+CONCURRENCY_QUEUE_DEPTH = Gauge(
+    'http_concurrency_queue_depth',
+    'Number of requests waiting for a concurrency slot'
+)
+
+REQUESTS_SHED = Counter(
+    'http_requests_shed_total',
+    'Total number of requests rejected by the concurrency limiter',
+    ['reason']
+)
+
+HOT_QUERY_DURATION = Histogram(
+    'db_hot_query_duration_seconds',
+    'Time spent per hot query, split into compile/ORM overhead and cursor execution',
+    ['query', 'phase'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+HOT_QUERY_CACHE = Counter(
+    'db_hot_query_compiled_cache_total',
+    'SQLAlchemy compiled cache lookups for hot queries',
+    ['query', 'result']
+)
+
+ORIGINATION_ROLLUP_BUCKETS = Counter(
+    'origination_rollup_buckets_total',
+    'Origination time buckets served, by whether they came from the rollup table or were computed',
+    ['granularity', 'source']
+)
+
+OUTBOX_EVENTS_DISPATCHED = Counter(
+    'outbox_events_dispatched_total',
+    'Outbox events delivered to all sinks',
+    ['event_type']
+)
+
+OUTBOX_DELIVERY_FAILURES = Counter(
+    'outbox_delivery_failures_total',
+    'Outbox batches a sink failed to accept',
+    ['sink']
+)
+
+OUTBOX_DISPATCH_LAG = Histogram(
+    'outbox_dispatch_lag_seconds',
+    'Time from recording an outbox event to its delivery',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+)
+
+OUTBOX_BACKLOG_AGE = Gauge(
+    'outbox_backlog_age_seconds',
+    'Age of the oldest undelivered outbox event'
+)
+
+LOAN_TRANSITIONS_TOTAL = Counter(
+    'loan_transitions_total',
+    'Requested loan status transitions by outcome',
+    ['result']
+)
+
+PAYMENT_IMPORT_ROWS = Counter(
+    'payment_import_rows_total',
+    'Rows of imported repayment files by outcome',
+    ['result']
+)
+
+IDEMPOTENT_REQUESTS = Counter(
+    'idempotent_requests_total',
+    'Requests carrying an Idempotency-Key by outcome',
+    ['result']
+)
+
+LOAN_DECISIONS = Counter(
+    'loan_decisions_total',
+    'Automated credit decisions on pending loans by outcome',
+    ['decision']
+)
+
+AUDIT_ENTRIES_WRITTEN = Counter(
+    'audit_entries_written_total',
+    'Loan and payment change history entries written by mode',
+    ['mode']
+)
+
+AUDIT_BUFFER_DEPTH = Gauge(
+    'audit_buffer_entries',
+    'Committed change history entries waiting to be written'
+)
+
 def get_metrics_route():
     async def metrics_route():
         return Response(
@@ -0,0 +1,360 @@
+"""Helpers for online schema migrations of large tables.
+
+Plain alembic operations run inside the migration transaction, so the locks
+they take are held until the whole migration commits: an index build or a
+constraint check on ``loans`` blocks writes for the duration of a full table
+scan. The helpers here split such changes into steps that each commit on their
+own and hold strong locks only for metadata changes:
+
+- :func:`create_index_concurrently` builds indexes with ``CREATE INDEX
+  CONCURRENTLY``, partition by partition for partitioned tables;
+- :func:`add_check_constraint` and :func:`add_foreign_key` add constraints
+  ``NOT VALID`` (no scan) and then ``VALIDATE`` them, which scans under a
+  lock that does not block writes;
+- :func:`set_not_null` uses a validated ``IS NOT NULL`` check so ``SET NOT
+  NULL`` does not scan the table;
+- :func:`backfill` updates rows in throttled key-range batches and records
+  its progress in ``migration_backfills``, so an interrupted migration
+  resumes where it stopped.
+
+DDL runs with a short ``lock_timeout`` and is retried, so a migration waiting
+for a lock behind a long transaction never queues application queries behind
+it. The helpers need a database connection and cannot be rendered in offline
+(``--sql``) mode. PostgreSQL does not accept ``NOT VALID`` constraints or
+``CONCURRENTLY`` on partitioned tables, so those are applied to every partition
+first; adding the constraint or index to the parent afterwards then attaches
+the existing, already valid partition objects instead of scanning again.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+from .partitions import existing_partitions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCK_TIMEOUT = "5s"
+DDL_ATTEMPTS = 5
+PROGRESS_TABLE = "migration_backfills"
+
+# SQLSTATE lock_not_available, raised when lock_timeout expires
+_LOCK_NOT_AVAILABLE = "55P03"
+
+
+def _op():
+    from alembic import op
+
+    if op.get_context().as_sql:
+        raise RuntimeError("Online migration helpers need a database connection; run without --sql")
+    return op
+
+
+@contextmanager
+def outside_transaction() -> Iterator[Connection]:
+    """Commit the migration transaction and yield an autocommit connection."""
+    op = _op()
+    with op.get_context().autocommit_block():
+        yield op.get_bind()
+
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    return bool(
+        connection.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = :table"
+            ),
+            {"table": table},
+        ).first()
+    )
+
+
+def run_ddl(
+    connection: Connection,
+    statements: Sequence[str],
+    lock_timeout: str = DEFAULT_LOCK_TIMEOUT,
+    attempts: int = DDL_ATTEMPTS,
+) -> None:
+    """Run ``statements`` in one short transaction on an autocommit connection.
+
+    The transaction gives up after ``lock_timeout`` when a lock is not
+    available and is retried with backoff up to ``attempts`` times.
+    """
+    for attempt in range(1, attempts + 1):
+        connection.exec_driver_sql("BEGIN")
+        try:
+            connection.exec_driver_sql(f"SET LOCAL lock_timeout = '{lock_timeout}'")
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql("COMMIT")
+            return
+        except OperationalError as e:
+            connection.exec_driver_sql("ROLLBACK")
+            if getattr(e.orig, "pgcode", None) != _LOCK_NOT_AVAILABLE or attempt == attempts:
+                raise
+            delay = min(2 ** attempt, 30)
+            logger.warning(f"Lock not available (attempt {attempt}/{attempts}), retrying in {delay}s")
+            time.sleep(delay)
+        except Exception:
+            connection.exec_driver_sql("ROLLBACK")
+            raise
+
+
+def execute(*statements: str, lock_timeout: str = DEFAULT_LOCK_TIMEOUT) -> None:
+    """Run metadata-only DDL (e.g. ``ADD COLUMN`` without default) in its own transaction."""
+    with outside_transaction() as connection:
+        run_ddl(connection, statements, lock_timeout)
+
+
+def _drop_invalid_index(connection: Connection, name: str) -> None:
+    """Drop ``name`` if a previous concurrent build failed and left it invalid."""
+    invalid = connection.execute(
+        text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ),
+        {"name": name},
+    ).first()
+    if invalid:
+        logger.warning(f"Dropping invalid index {name} left by an interrupted build")
+        connection.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def create_index_concurrently(
+    name: str,
+    table: str,
+    columns: Sequence[str],
+    unique: bool = False,
+    where: Optional[str] = None,
+    include: Sequence[str] = (),
+    using: Optional[str] = None,
+    lock_timeout: str = DEFAULT_LOCK_TIMEOUT,
+) -> None:
+    """Build an index without blocking writes.
+
+    On a partitioned table an invalid index is created on the parent only,
+    each partition's index is built concurrently and attached, and the parent
+    index becomes valid once all partitions are attached. ``include`` lists
+    non-key columns stored in the index for index-only scans; ``using`` names
+    the index method (e.g. ``gin``), and ``columns`` may then carry operator
+    classes or be expressions.
+    """
+    unique_sql = "UNIQUE " if unique else ""
+    columns_sql = ", ".join(columns)
+    using_sql = f" USING {using}" if using else ""
+    if include:
+        columns_sql += f") INCLUDE ({', '.join(include)}"
+    where_sql = f" WHERE {where}" if where else ""
+    with outside_transaction() as connection:
+        if not is_partitioned(connection, table):
+            _drop_invalid_index(connection, name)
+            connection.exec_driver_sql(
+                f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                f"ON {table}{using_sql} ({columns_sql}){where_sql}"
+            )
+            return
+
+        run_ddl(
+            connection,
+            [f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON ONLY {table}{using_sql} ({columns_sql}){where_sql}"],
+            lock_timeout,
+        )
+        for partition in existing_partitions(connection, table):
+            # PostgreSQL identifiers are truncated to 63 bytes
+            child = f"{partition}_{name}"[:63]
+            _drop_invalid_index(connection, child)
+            connection.exec_driver_sql(
+                f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {child} "
+                f"ON {partition}{using_sql} ({columns_sql}){where_sql}"
+            )
+            attached = connection.execute(
+                text(
+                    "SELECT 1 FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                    "WHERE c.relname = :child AND p.relname = :name"
+                ),
+                {"child": child, "name": name},
+            ).first()
+            if not attached:
+                run_ddl(connection, [f"ALTER INDEX {name} ATTACH PARTITION {child}"], lock_timeout)
+            logger.info(f"Built index {child}")
+
+
+def _constraint_validated(connection: Connection, table: str, name: str) -> Optional[bool]:
+    """Whether constraint ``name`` on ``table`` is validated, or None if it does not exist."""
+    return connection.execute(
+        text(
+            "SELECT con.convalidated FROM pg_constraint con JOIN pg_class c ON c.oid = con.conrelid "
+            "WHERE c.relname = :table AND con.conname = :name"
+        ),
+        {"table": table, "name": name},
+    ).scalar()
+
+
+def _add_validated_constraint(table: str, name: str, definition: str, lock_timeout: str) -> None:
+    with outside_transaction() as connection:
+        if _constraint_validated(connection, table, name) is not None:
+            return
+        partitioned = is_partitioned(connection, table)
+        targets = existing_partitions(connection, table) if partitioned else [table]
+        for target in targets:
+            validated = _constraint_validated(connection, target, name)
+            if validated is None:
+                run_ddl(
+                    connection,
+                    [f"ALTER TABLE {target} ADD CONSTRAINT {name} {definition} NOT VALID"],
+                    lock_timeout,
+                )
+            if not validated:
+                # Scans the table under SHARE UPDATE EXCLUSIVE, which allows writes
+                run_ddl(connection, [f"ALTER TABLE {target} VALIDATE CONSTRAINT {name}"], lock_timeout)
+        if partitioned:
+            # Attaches the validated partition constraints without another scan
+            run_ddl(connection, [f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}"], lock_timeout)
+
+
+def add_check_constraint(
+    table: str, name: str, condition: str, lock_timeout: str = DEFAULT_LOCK_TIMEOUT
+) -> None:
+    """Add ``CHECK (condition)`` as ``NOT VALID`` and validate it separately."""
+    _add_validated_constraint(table, name, f"CHECK ({condition})", lock_timeout)
+
+
+def add_foreign_key(
+    table: str,
+    name: str,
+    column: str,
+    referred_table: str,
+    referred_column: str = "id",
+    lock_timeout: str = DEFAULT_LOCK_TIMEOUT,
+) -> None:
+    """Add a foreign key as ``NOT VALID`` and validate it separately."""
+    _add_validated_constraint(
+        table,
+        name,
+        f"FOREIGN KEY ({column}) REFERENCES {referred_table} ({referred_column})",
+        lock_timeout,
+    )
+
+
+def set_not_null(table: str, column: str, lock_timeout: str = DEFAULT_LOCK_TIMEOUT) -> None:
+    """``SET NOT NULL`` backed by a validated check, so the table is not scanned again."""
+    check = f"chk_{table}_{column}_not_null"
+    add_check_constraint(table, check, f"{column} IS NOT NULL", lock_timeout)
+    execute(
+        f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL",
+        f"ALTER TABLE {table} DROP CONSTRAINT {check}",
+        lock_timeout=lock_timeout,
+    )
+
+
+def run_backfill(
+    connection: Connection,
+    name: str,
+    table: str,
+    set_clause: str,
+    where: str = "TRUE",
+    key: str = "id",
+    batch_size: int = 10000,
+    pause: float = 0.1,
+    max_batches: Optional[int] = None,
+) -> int:
+    """Apply ``UPDATE table SET set_clause`` to rows matching ``where`` in key order.
+
+    Each batch covers the next ``batch_size`` values of the unique column
+    ``key`` and commits together with the progress row ``name`` of
+    ``migration_backfills``; a later call with the same ``name`` continues
+    after the last committed batch. ``set_clause`` must be idempotent, as the
+    batch being written when a run was interrupted is applied again.
+
+    Args:
+        connection: Connection outside of any migration transaction.
+        name: Identifier of this backfill.
+        table: Table to update.
+        set_clause: SQL for the ``SET`` clause.
+        where: SQL condition restricting the rows updated.
+        key: Unique, indexed column batches are ranged over.
+        batch_size: Key values per batch.
+        pause: Seconds to sleep between batches, leaving room for replication
+            and autovacuum to keep up.
+        max_batches: Stop after this many batches (the rest is resumable).
+
+    Returns:
+        int: Number of rows updated by this call.
+    """
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} ("
+            "name VARCHAR PRIMARY KEY, last_key VARCHAR, rows_done BIGINT NOT NULL DEFAULT 0, "
+            "completed_at TIMESTAMP, updated_at TIMESTAMP)"
+        )
+    )
+    progress = connection.execute(
+        text(f"SELECT last_key, completed_at FROM {PROGRESS_TABLE} WHERE name = :name"),
+        {"name": name},
+    ).first()
+    if progress is None:
+        connection.execute(text(f"INSERT INTO {PROGRESS_TABLE} (name) VALUES (:name)"), {"name": name})
+        last_key = None
+    elif progress.completed_at is not None:
+        return 0
+    else:
+        last_key = progress.last_key
+    connection.commit()
+
+    updated = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        after = "" if last_key is None else f"WHERE {key} > :last_key "
+        params = {} if last_key is None else {"last_key": last_key}
+        # Last key of the batch (PostgreSQL has no max() for uuid)
+        upper = connection.execute(
+            text(
+                f"SELECT {key} FROM (SELECT {key} FROM {table} {after}"
+                f"ORDER BY {key} LIMIT :batch_size) batch ORDER BY {key} DESC LIMIT 1"
+            ),
+            {**params, "batch_size": batch_size},
+        ).scalar()
+        if upper is None:
+            connection.execute(
+                text(
+                    f"UPDATE {PROGRESS_TABLE} SET completed_at = CURRENT_TIMESTAMP, "
+                    "updated_at = CURRENT_TIMESTAMP WHERE name = :name"
+                ),
+                {"name": name},
+            )
+            connection.commit()
+            logger.info(f"Backfill {name} complete")
+            break
+
+        lower = "" if last_key is None else f"{key} > :last_key AND "
+        rows = connection.execute(
+            text(f"UPDATE {table} SET {set_clause} WHERE {lower}{key} <= :upper AND ({where})"),
+            {**params, "upper": upper},
+        ).rowcount
+        connection.execute(
+            text(
+                f"UPDATE {PROGRESS_TABLE} SET last_key = :upper, rows_done = rows_done + :rows, "
+                "updated_at = CURRENT_TIMESTAMP WHERE name = :name"
+            ),
+            {"upper": str(upper), "rows": rows, "name": name},
+        )
+        connection.commit()
+        updated += rows
+        batches += 1
+        last_key = str(upper)
+        logger.info(f"Backfill {name}: {updated} rows updated, up to {key} {last_key}")
+        if pause:
+            time.sleep(pause)
+    return updated
+
+
+def backfill(name: str, table: str, set_clause: str, **kwargs) -> int:
+    """:func:`run_backfill` on the migration's connection, outside its transaction."""
+    with outside_transaction() as connection:
+        return run_backfill(connection, name, table, set_clause, **kwargs)
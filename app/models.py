@@ -4,21 +4,32 @@ from enum import Enum
 from typing import List, Optional
 
 from sqlalchemy import (
+    BigInteger,
     CheckConstraint,
     Column,
     String,
     Numeric,
     Integer,
     ForeignKey,
+    Index,
     DateTime,
     Enum as SQLEnum,
+    JSON,
+    Text,
     event,
+    text,
 )
-from sqlalchemy.dialects.postgresql import UUID, TIMESTAMP
+from sqlalchemy.dialects.postgresql import JSONB, UUID, TIMESTAMP
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.sql import func
 
 from .db import Base
+from .partitions import uuid7
+
+
+def enum_values(enum_cls) -> List[str]:
+    """Persist enum values (e.g. 'paid') rather than member names, to match the CHECK constraints."""
+    return [member.value for member in enum_cls]
 
 
 class LoanStatus(str, Enum):
@@ -37,6 +48,13 @@ class PaymentStatus(str, Enum):
     OVERDUE = "overdue"
 
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
 class Borrower(Base):
     __tablename__ = "borrowers"
 
@@ -61,15 +79,28 @@ class Borrower(Base):
     # Relationships
     loans: Mapped[List["Loan"]] = relationship("Loan", back_populates="borrower")
 
+    # Trigram indexes for substring search (app.search); SQLite uses FTS5.
+    __table_args__ = tuple(
+        Index(
+            f"ix_borrowers_{column}_trgm",
+            column,
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql")
+        for column in ("name", "email", "phone")
+    )
+
     def __repr__(self) -> str:
         return f"<Borrower(id={self.id}, name='{self.name}', email='{self.email}')>"
 
 
 class Loan(Base):
+    """Loan, range partitioned by month of ``created_at`` on PostgreSQL (see app.partitions)."""
+
     __tablename__ = "loans"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+        UUID(as_uuid=True), primary_key=True, default=uuid7
     )
     borrower_id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), ForeignKey("borrowers.id"), nullable=False, index=True
@@ -77,7 +108,9 @@ class Loan(Base):
     amount: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
     currency: Mapped[str] = mapped_column(String(3), nullable=False, default="USD")
     status: Mapped[LoanStatus] = mapped_column(
-        SQLEnum(LoanStatus), default=LoanStatus.PENDING, nullable=False
+        SQLEnum(LoanStatus, values_callable=enum_values),
+        default=LoanStatus.PENDING,
+        nullable=False,
     )
     term_months: Mapped[int] = mapped_column(Integer, nullable=False)
     interest_rate_apr: Mapped[float] = mapped_column(Numeric(5, 2), nullable=False)
@@ -88,8 +121,11 @@ class Loan(Base):
     due_date: Mapped[Optional[datetime]] = mapped_column(
         TIMESTAMP(timezone=True), nullable=True
     )
+    # Optimistic concurrency: incremented on every update (see app.transitions)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
+    # Partition key, hence part of the table's primary key
     created_at: Mapped[datetime] = mapped_column(
-        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+        TIMESTAMP(timezone=True), primary_key=True, server_default=func.now(), nullable=False
     )
     updated_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True),
@@ -101,14 +137,43 @@ class Loan(Base):
     # Relationships
     borrower: Mapped["Borrower"] = relationship("Borrower", back_populates="loans")
     payments: Mapped[List["Payment"]] = relationship(
-        "Payment", back_populates="loan", cascade="all, delete-orphan"
+        "Payment",
+        primaryjoin="Loan.id == foreign(Payment.loan_id)",
+        back_populates="loan",
+        cascade="all, delete-orphan",
     )
 
     __table_args__ = (
         CheckConstraint("amount > 0 AND amount <= 50000", name="chk_amount_range"),
         CheckConstraint("term_months > 0", name="chk_term_positive"),
         CheckConstraint("interest_rate_apr >= 0", name="chk_interest_non_negative"),
+        # Loans are appended in created_at order, so a BRIN index stays tiny
+        # while still letting time-range scans skip most of the table.
+        Index("ix_loans_created_at_brin", "created_at", postgresql_using="brin"),
+        # Serves list_loans ordered by created_at with index-only scans when
+        # ?fields= asks for a subset of these columns.
+        Index(
+            "ix_loans_created_at_summary",
+            "created_at",
+            postgresql_include=["id", "amount", "status", "currency"],
+        ),
+        # Pending loans in id order, read in chunks by app.decisioning
+        Index(
+            "ix_loans_pending",
+            "id",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+        # Full-text search over purpose (app.search); SQLite uses FTS5.
+        Index(
+            "ix_loans_purpose_fts",
+            text("to_tsvector('simple', purpose)"),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
+    # Rows are still identified by id alone
+    __mapper_args__ = {"primary_key": [id], "version_id_col": version}
 
     def calculate_monthly_payment(self) -> float:
         """Calculate the monthly payment amount using the loan details."""
@@ -126,17 +191,27 @@ class Loan(Base):
 
 
 class Payment(Base):
+    """Loan payment, range partitioned by month of ``created_at`` on PostgreSQL.
+
+    ``loan_id`` has no database foreign key: a partitioned ``loans`` table can
+    only be referenced through its full ``(id, created_at)`` primary key. For
+    the same reason ``transaction_reference`` is only unique together with
+    ``created_at``.
+    """
+
     __tablename__ = "payments"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+        UUID(as_uuid=True), primary_key=True, default=uuid7
     )
     loan_id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), ForeignKey("loans.id"), nullable=False, index=True
+        UUID(as_uuid=True), nullable=False, index=True
     )
     amount: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
     status: Mapped[PaymentStatus] = mapped_column(
-        SQLEnum(PaymentStatus), default=PaymentStatus.PENDING, nullable=False
+        SQLEnum(PaymentStatus, values_callable=enum_values),
+        default=PaymentStatus.PENDING,
+        nullable=False,
     )
     due_date: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
     paid_amount: Mapped[Optional[float]] = mapped_column(
@@ -145,12 +220,10 @@ class Payment(Base):
     paid_at: Mapped[Optional[datetime]] = mapped_column(
         TIMESTAMP(timezone=True), nullable=True
     )
-    transaction_reference: Mapped[Optional[str]] = mapped_column(
-        String, nullable=True, unique=True, index=True
-    )
+    transaction_reference: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     notes: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
-        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+        TIMESTAMP(timezone=True), primary_key=True, server_default=func.now(), nullable=False
     )
     updated_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True),
@@ -160,7 +233,9 @@ class Payment(Base):
     )
 
     # Relationships
-    loan: Mapped["Loan"] = relationship("Loan", back_populates="payments")
+    loan: Mapped["Loan"] = relationship(
+        "Loan", primaryjoin="Loan.id == foreign(Payment.loan_id)", back_populates="payments"
+    )
 
     __table_args__ = (
         CheckConstraint("amount > 0", name="chk_payment_amount_positive"),
@@ -169,12 +244,248 @@ class Payment(Base):
             "(status != 'paid' AND paid_amount IS NULL AND paid_at IS NULL)",
             name="chk_payment_status_consistency",
         ),
+        # Unique indexes of a partitioned table must contain the partition key.
+        Index(
+            "uq_payments_transaction_reference",
+            "transaction_reference",
+            "created_at",
+            unique=True,
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
+    __mapper_args__ = {"primary_key": [id]}
 
     def __repr__(self) -> str:
         return f"<Payment(id={self.id}, amount={self.amount}, status='{self.status}')>"
 
 
+class PaymentReference(Base):
+    """Globally unique bank transaction references of imported payments.
+
+    ``payments`` can only enforce uniqueness of ``transaction_reference``
+    per ``created_at``, so app.reconciliation deduplicates against this table.
+    """
+
+    __tablename__ = "payment_references"
+
+    transaction_reference: Mapped[str] = mapped_column(String, primary_key=True)
+    payment_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    imported_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return f"<PaymentReference(transaction_reference='{self.transaction_reference}', payment_id={self.payment_id})>"
+
+
+class BorrowerExposure(Base):
+    """Per-borrower risk aggregate maintained by app.exposure."""
+
+    __tablename__ = "borrower_exposure"
+
+    borrower_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("borrowers.id", ondelete="CASCADE"), primary_key=True
+    )
+    outstanding_amount: Mapped[float] = mapped_column(
+        Numeric(14, 2), nullable=False, default=0
+    )
+    active_loan_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    worst_payment_status: Mapped[Optional[PaymentStatus]] = mapped_column(
+        SQLEnum(PaymentStatus, values_callable=enum_values), nullable=True
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"<BorrowerExposure(borrower_id={self.borrower_id}, "
+            f"outstanding_amount={self.outstanding_amount}, active_loan_count={self.active_loan_count})>"
+        )
+
+
+class OriginationRollup(Base):
+    """Cached origination aggregate of a closed period, maintained by app.rollups.
+
+    ``status`` and ``currency`` hold ``"*"`` on rows aggregated over all values.
+    """
+
+    __tablename__ = "origination_rollups"
+
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)
+    period_start: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)
+    status: Mapped[str] = mapped_column(String(16), primary_key=True)
+    currency: Mapped[str] = mapped_column(String(3), primary_key=True)
+    loan_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    total_amount: Mapped[float] = mapped_column(Numeric(16, 2), nullable=False)
+    p50_amount: Mapped[Optional[float]] = mapped_column(Numeric(12, 2), nullable=True)
+    p90_amount: Mapped[Optional[float]] = mapped_column(Numeric(12, 2), nullable=True)
+    p99_amount: Mapped[Optional[float]] = mapped_column(Numeric(12, 2), nullable=True)
+    computed_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"<OriginationRollup(granularity='{self.granularity}', period_start={self.period_start}, "
+            f"status='{self.status}', currency='{self.currency}', loan_count={self.loan_count})>"
+        )
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    type: Mapped[str] = mapped_column(String(64), nullable=False)
+    params: Mapped[dict] = mapped_column(
+        JSON().with_variant(JSONB, "postgresql"), nullable=False, default=dict
+    )
+    status: Mapped[JobStatus] = mapped_column(
+        SQLEnum(JobStatus), default=JobStatus.QUEUED, nullable=False, index=True
+    )
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=3)
+    result: Mapped[Optional[dict]] = mapped_column(
+        JSON().with_variant(JSONB, "postgresql"), nullable=True
+    )
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+    started_at: Mapped[Optional[datetime]] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+    finished_at: Mapped[Optional[datetime]] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+    # Runner executing the job and until when it holds it (renewed while running)
+    runner_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        CheckConstraint("attempts >= 0", name="chk_job_attempts_non_negative"),
+        CheckConstraint("max_attempts > 0", name="chk_job_max_attempts_positive"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<Job(id={self.id}, type='{self.type}', status='{self.status}')>"
+
+
+class OutboxEvent(Base):
+    """Loan event recorded in the writing transaction, delivered by app.outbox."""
+
+    __tablename__ = "outbox_events"
+
+    id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True
+    )
+    event_type: Mapped[str] = mapped_column(String(64), nullable=False)
+    aggregate_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    payload: Mapped[dict] = mapped_column(
+        JSON().with_variant(JSONB, "postgresql"), nullable=False
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+    # Not claimable before this time: set to the lease end when claimed and to
+    # the retry time after a failed delivery.
+    available_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    dispatched_at: Mapped[Optional[datetime]] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+
+    __table_args__ = (
+        Index(
+            "ix_outbox_events_pending",
+            "id",
+            postgresql_where=text("dispatched_at IS NULL"),
+            sqlite_where=text("dispatched_at IS NULL"),
+        ),
+    )
+
+    def __repr__(self) -> str:
+        return f"<OutboxEvent(id={self.id}, event_type='{self.event_type}', aggregate_id={self.aggregate_id})>"
+
+
+class IdempotencyKey(Base):
+    """Response stored for an ``Idempotency-Key`` header, replayed by app.idempotency.
+
+    ``status_code`` and ``response`` are NULL while the first attempt is still
+    running; ``locked_at`` tells how long it has been running. ``resource_id``
+    is the id reserved for what the request creates, reused by an attempt that
+    takes the key over.
+    """
+
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    status_code: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    response: Mapped[Optional[dict]] = mapped_column(
+        JSON().with_variant(JSONB, "postgresql"), nullable=True
+    )
+    resource_id: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    locked_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (Index("ix_idempotency_keys_expires_at", "expires_at"),)
+
+    def __repr__(self) -> str:
+        return f"<IdempotencyKey(key='{self.key}', status_code={self.status_code})>"
+
+
+class AuditEntry(Base):
+    """Append-only change history of loans and payments, written by app.audit.
+
+    Range partitioned by month of ``created_at`` on PostgreSQL (see
+    app.partitions); a trigger rejects ``UPDATE`` and ``DELETE``.
+    ``changes`` maps each changed field to ``[old, new]``.
+    """
+
+    __tablename__ = "audit_log"
+
+    # UUIDv7 generated when the change is captured, so ids follow change order
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    entity_type: Mapped[str] = mapped_column(String(16), nullable=False)
+    entity_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    # The loan itself, or the loan a payment belongs to
+    loan_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    action: Mapped[str] = mapped_column(String(8), nullable=False)
+    changes: Mapped[dict] = mapped_column(
+        JSON().with_variant(JSONB, "postgresql"), nullable=False
+    )
+    # Partition key: time the change was captured, not written
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), primary_key=True, nullable=False
+    )
+
+    __table_args__ = (
+        Index("ix_audit_log_loan_id", "loan_id", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+    def __repr__(self) -> str:
+        return f"<AuditEntry(entity_type='{self.entity_type}', entity_id={self.entity_id}, action='{self.action}')>"
+
+
 # Add indexes and other database-level optimizations
 @event.listens_for(Loan, "before_insert")
 def set_loan_defaults(mapper, connection, target):
@@ -190,3 +501,11 @@ def set_payment_defaults(mapper, connection, target):
     """Set default values for new payments."""
     if target.status is None:
         target.status = PaymentStatus.PENDING
+
+
+# Register the session hooks maintaining derived tables
+from . import exposure  # noqa: E402,F401
+from . import outbox  # noqa: E402,F401
+from . import search  # noqa: E402,F401
+from . import audit  # noqa: E402,F401
+from . import rollups  # noqa: E402,F401
@@ -0,0 +1,408 @@
+"""Transactional outbox for loan events.
+
+Loan creations and status changes are recorded as rows of ``outbox_events`` in
+the same transaction as the change itself: an ``after_flush`` session hook
+covers ORM writes, and code writing loans with Core/bulk statements calls
+:func:`record_events` itself. An event therefore exists if and only if the
+change was committed.
+
+:class:`OutboxDispatcher` delivers pending events to pluggable sinks in
+batches. Rows are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` and leased
+by moving ``available_at`` forward, so several dispatchers can run side by
+side without holding locks during delivery. An event is marked dispatched
+only after every sink accepted its batch; failed or interrupted deliveries are
+retried with exponential backoff once their lease or backoff expires. Delivery
+is at least once: consumers should deduplicate on the event ``id``.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import delete, event, insert, inspect, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionFactory
+from .metrics import (
+    OUTBOX_BACKLOG_AGE,
+    OUTBOX_DELIVERY_FAILURES,
+    OUTBOX_DISPATCH_LAG,
+    OUTBOX_EVENTS_DISPATCHED,
+)
+from .models import Loan, OutboxEvent
+from .schemas import serialize_value
+
+logger = logging.getLogger(__name__)
+
+LOAN_CREATED = "loan.created"
+LOAN_STATUS_CHANGED = "loan.status_changed"
+
+# Loan attributes included in loan.created payloads
+_LOAN_PAYLOAD_FIELDS = (
+    "id",
+    "borrower_id",
+    "amount",
+    "currency",
+    "status",
+    "term_months",
+    "interest_rate_apr",
+    "purpose",
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def loan_created_event(loan: Any) -> Dict[str, Any]:
+    """Outbox row values for a new loan (ORM object or row with loan columns)."""
+    return {
+        "event_type": LOAN_CREATED,
+        "aggregate_id": loan.id,
+        "payload": {field: serialize_value(getattr(loan, field)) for field in _LOAN_PAYLOAD_FIELDS},
+    }
+
+
+def loan_status_changed_event(loan_id: Any, from_status: Any, to_status: Any) -> Dict[str, Any]:
+    """Outbox row values for a loan status transition."""
+    return {
+        "event_type": LOAN_STATUS_CHANGED,
+        "aggregate_id": loan_id,
+        "payload": {
+            "loan_id": serialize_value(loan_id),
+            "from_status": serialize_value(from_status),
+            "to_status": serialize_value(to_status),
+        },
+    }
+
+
+def record_events(connection: Connection, events: Sequence[Dict[str, Any]]) -> None:
+    """Insert outbox rows on ``connection``, inside the caller's transaction."""
+    if events:
+        connection.execute(insert(OutboxEvent), list(events))
+
+
+@event.listens_for(Session, "after_flush")
+def capture_loan_events(session, flush_context):
+    """Record outbox events for loans inserted or whose status changed in this flush."""
+    events = []
+    for obj in session.new:
+        if isinstance(obj, Loan):
+            events.append(loan_created_event(obj))
+    for obj in session.dirty:
+        if not isinstance(obj, Loan):
+            continue
+        history = inspect(obj).attrs.status.history
+        if not history.added:
+            continue
+        from_status = history.deleted[0] if history.deleted else None
+        to_status = history.added[0]
+        if from_status != to_status:
+            events.append(loan_status_changed_event(obj.id, from_status, to_status))
+    if events:
+        record_events(session.connection(), events)
+
+
+# Sinks
+
+class FileSink:
+    """Append events as JSON lines to a local file (fsynced per batch)."""
+
+    name = "file"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # Dispatchers of several shards may share the sink
+        self._lock = threading.Lock()
+
+    async def send(self, events: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._write, events)
+
+    def _write(self, events: List[Dict[str, Any]]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, open(self.path, "a") as f:
+            for e in events:
+                f.write(json.dumps(e, default=str, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class HttpSink:
+    """POST each batch as a JSON array to ``url``; any non-2xx response fails the batch."""
+
+    name = "http"
+
+    def __init__(self, url: str, timeout: float = 5.0) -> None:
+        self.url = url
+        self.timeout = timeout
+
+    async def send(self, events: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._post, events)
+
+    def _post(self, events: List[Dict[str, Any]]) -> None:
+        body = json.dumps(events, default=str).encode()
+        request = urllib.request.Request(
+            self.url, data=body, method="POST", headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if not 200 <= response.status < 300:
+                raise RuntimeError(f"Sink {self.url} answered {response.status}")
+
+
+def sinks_from_settings() -> List[Any]:
+    sinks = []
+    for name in (s.strip() for s in settings.OUTBOX_SINKS.split(",")):
+        if name == "file":
+            sinks.append(FileSink(settings.OUTBOX_FILE_PATH))
+        elif name == "http":
+            if not settings.OUTBOX_HTTP_URL:
+                raise ValueError("OUTBOX_HTTP_URL is required for the http outbox sink")
+            sinks.append(HttpSink(settings.OUTBOX_HTTP_URL))
+        elif name:
+            raise ValueError(f"Unknown outbox sink: {name}")
+    return sinks
+
+
+class OutboxDispatcher:
+    """Deliver pending outbox events to ``sinks`` in batches.
+
+    Args:
+        sinks: Objects with a ``name`` and an ``async send(events)`` method.
+        batch_size: Maximum number of events claimed and delivered at once.
+        poll_interval: Seconds to wait when no full batch was pending.
+        lease: Seconds a claimed batch stays invisible to other dispatchers.
+        retry_backoff: Base delay in seconds before a failed batch is retried.
+        max_backoff: Upper bound of the retry delay in seconds.
+        session_factory: Callable returning a new SQLAlchemy session.
+    """
+
+    def __init__(
+        self,
+        sinks: Sequence[Any],
+        batch_size: int = 100,
+        poll_interval: float = 0.5,
+        lease: float = 30.0,
+        retry_backoff: float = 2.0,
+        max_backoff: float = 300.0,
+        session_factory=SessionFactory,
+    ) -> None:
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop polling; a batch being delivered is redelivered after its lease."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                claimed = await self.dispatch_once()
+            except Exception as e:
+                logger.error(f"Outbox dispatch error: {e}")
+                claimed = 0
+            if claimed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def dispatch_once(self) -> int:
+        """Claim and deliver one batch.
+
+        Returns:
+            int: Number of events claimed.
+        """
+        events = await asyncio.to_thread(self._claim)
+        if events:
+            await self._deliver(events)
+        await asyncio.to_thread(self._update_backlog_age)
+        return len(events)
+
+    async def _deliver(self, events: List[Dict[str, Any]]) -> None:
+        ids = [e["id"] for e in events]
+        for sink in self.sinks:
+            try:
+                await sink.send(events)
+            except Exception as exc:
+                OUTBOX_DELIVERY_FAILURES.labels(sink=sink.name).inc()
+                attempts = max(e["attempts"] for e in events)
+                delay = min(self.retry_backoff * 2 ** (attempts - 1), self.max_backoff)
+                error = f"{sink.name}: {type(exc).__name__}: {exc}"
+                logger.warning(f"Outbox delivery of {len(events)} events failed, retrying in {delay}s: {error}")
+                await asyncio.to_thread(self._release, ids, error, delay)
+                return
+
+        await asyncio.to_thread(self._mark_dispatched, ids)
+        now = _utcnow()
+        for e in events:
+            OUTBOX_EVENTS_DISPATCHED.labels(event_type=e["event_type"]).inc()
+            OUTBOX_DISPATCH_LAG.observe(max((now - e["created_at"]).total_seconds(), 0.0))
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        session = self.session_factory()
+        try:
+            now = _utcnow()
+            rows = session.execute(
+                select(
+                    OutboxEvent.id,
+                    OutboxEvent.event_type,
+                    OutboxEvent.aggregate_id,
+                    OutboxEvent.payload,
+                    OutboxEvent.created_at,
+                    OutboxEvent.attempts,
+                )
+                .where(OutboxEvent.dispatched_at.is_(None), OutboxEvent.available_at <= now)
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if rows:
+                session.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id.in_([row.id for row in rows]))
+                    .values(
+                        available_at=now + timedelta(seconds=self.lease),
+                        attempts=OutboxEvent.attempts + 1,
+                    )
+                )
+            session.commit()
+        finally:
+            session.close()
+
+        events = []
+        for row in rows:
+            created_at = row.created_at
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            events.append({
+                "id": row.id,
+                "event_type": row.event_type,
+                "aggregate_id": str(row.aggregate_id),
+                "payload": row.payload,
+                "created_at": created_at,
+                "attempts": row.attempts + 1,
+            })
+        return events
+
+    def _mark_dispatched(self, ids: List[int]) -> None:
+        session = self.session_factory()
+        try:
+            session.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(ids))
+                .values(dispatched_at=_utcnow(), last_error=None)
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def _release(self, ids: List[int], error: str, delay: float) -> None:
+        session = self.session_factory()
+        try:
+            session.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(ids))
+                .values(available_at=_utcnow() + timedelta(seconds=delay), last_error=error)
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def _update_backlog_age(self) -> None:
+        session = self.session_factory()
+        try:
+            oldest = session.scalar(
+                select(OutboxEvent.created_at)
+                .where(OutboxEvent.dispatched_at.is_(None))
+                .order_by(OutboxEvent.id)
+                .limit(1)
+            )
+        finally:
+            session.close()
+        if oldest is None:
+            OUTBOX_BACKLOG_AGE.set(0)
+            return
+        if oldest.tzinfo is None:
+            oldest = oldest.replace(tzinfo=timezone.utc)
+        OUTBOX_BACKLOG_AGE.set(max((_utcnow() - oldest).total_seconds(), 0.0))
+
+
+def purge_dispatched(older_than: timedelta, session_factory=SessionFactory) -> int:
+    """Delete events dispatched more than ``older_than`` ago.
+
+    Returns:
+        int: Number of events deleted.
+    """
+    session = session_factory()
+    try:
+        deleted = session.execute(
+            delete(OutboxEvent).where(OutboxEvent.dispatched_at < _utcnow() - older_than)
+        ).rowcount
+        session.commit()
+        return deleted
+    finally:
+        session.close()
+
+
+_dispatcher: Optional[OutboxDispatcher] = None
+_shard_dispatchers: Optional[List[OutboxDispatcher]] = None
+
+
+def _dispatcher_from_settings(sinks: List[Any], session_factory=SessionFactory) -> OutboxDispatcher:
+    return OutboxDispatcher(
+        sinks=sinks,
+        batch_size=settings.OUTBOX_BATCH_SIZE,
+        poll_interval=settings.OUTBOX_POLL_INTERVAL_MS / 1000,
+        lease=settings.OUTBOX_LEASE_SECONDS,
+        retry_backoff=settings.OUTBOX_RETRY_BACKOFF_SECONDS,
+        session_factory=session_factory,
+    )
+
+
+def get_outbox_dispatcher() -> OutboxDispatcher:
+    """Return the process-wide outbox dispatcher configured from settings."""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = _dispatcher_from_settings(sinks_from_settings())
+    return _dispatcher
+
+
+def get_outbox_dispatchers() -> List[OutboxDispatcher]:
+    """Return the default dispatcher plus one per loan shard (see app.sharding).
+
+    Events are written to the database holding the loan, so each shard's
+    outbox needs its own dispatcher; all of them share the same sinks.
+    """
+    global _shard_dispatchers
+    if _shard_dispatchers is None:
+        from .sharding import get_shard_router
+
+        router = get_shard_router()
+        default = get_outbox_dispatcher()
+        _shard_dispatchers = [default]
+        if router is not None:
+            _shard_dispatchers.extend(
+                _dispatcher_from_settings(default.sinks, router.session_factories[shard])
+                for shard in router.shards
+            )
+    return _shard_dispatchers
@@ -0,0 +1,166 @@
+"""Monthly range partitioning of ``loans``, ``payments`` and ``audit_log`` by ``created_at``.
+
+On PostgreSQL these tables are declared ``PARTITION BY RANGE (created_at)``
+(see the models and migration 0005) with one partition per calendar month,
+named ``<table>_pYYYYMM``, plus a ``<table>_default`` partition catching rows
+outside the pre-created range. :func:`ensure_partitions`, run periodically by
+``scripts/create_partitions.py``, creates the partitions for the coming months
+ahead of time so new rows never land in the default partition.
+
+Partition pruning needs a ``created_at`` predicate. Loans and payments get
+time-ordered UUIDv7 ids, which embed their creation time, so lookups by id can
+derive a ``created_at`` window (:func:`created_at_window`) and only touch the
+matching partitions. Ids generated before the switch (UUIDv4) carry no
+timestamp; callers fall back to an unbounded lookup for them.
+"""
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("loans", "payments", "audit_log")
+
+# Margin around the id timestamp: ids are generated by the application while
+# created_at is the database transaction time.
+ID_TIMESTAMP_SLACK = timedelta(days=1)
+
+
+def uuid7(tag: Optional[int] = None) -> uuid.UUID:
+    """Generate a UUIDv7: 48-bit Unix millisecond timestamp followed by random bits.
+
+    Args:
+        tag: Optional 12-bit value stored in place of the ``rand_a`` bits
+            (app.sharding keeps the shard number there).
+    """
+    millis = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (millis & ((1 << 48) - 1)) << 80
+    value |= 0x7 << 76  # version
+    value |= (rand >> 62 & 0xFFF if tag is None else tag & 0xFFF) << 64
+    value |= 0b10 << 62  # RFC 4122 variant
+    value |= rand & ((1 << 62) - 1)
+    return uuid.UUID(int=value)
+
+
+def uuid_timestamp(value: uuid.UUID) -> Optional[datetime]:
+    """Creation time embedded in a UUIDv7, or None for other versions."""
+    if value.version != 7:
+        return None
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=timezone.utc)
+
+
+def uuid_tag(value: uuid.UUID) -> Optional[int]:
+    """The 12-bit ``rand_a`` field of a UUIDv7 (see :func:`uuid7`), or None for other versions."""
+    if value.version != 7:
+        return None
+    return value.int >> 64 & 0xFFF
+
+
+def created_range_params(
+    created_from: Optional[datetime] = None, created_to: Optional[datetime] = None
+) -> Optional[Dict[str, datetime]]:
+    """Bind parameters of the ``*_pruned`` hot queries for an optional, half-open range."""
+    if created_from is None and created_to is None:
+        return None
+    return {
+        "created_from": created_from or datetime(1970, 1, 1, tzinfo=timezone.utc),
+        "created_to": created_to or datetime(9999, 12, 31, tzinfo=timezone.utc),
+    }
+
+
+def created_at_window(ids: Iterable[uuid.UUID]) -> Optional[Dict[str, datetime]]:
+    """``created_at`` range covering the rows with ``ids``, if all of them are UUIDv7.
+
+    Returns:
+        Optional[Dict[str, datetime]]: ``created_from``/``created_to`` bind
+        parameters for the ``*_pruned`` hot queries, or None.
+    """
+    timestamps = [uuid_timestamp(value) for value in ids]
+    if not timestamps or None in timestamps:
+        return None
+    return created_range_params(
+        min(timestamps) - ID_TIMESTAMP_SLACK, max(timestamps) + ID_TIMESTAMP_SLACK
+    )
+
+
+def month_start(value: datetime) -> datetime:
+    value = value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    year, month = divmod(value.month - 1 + months, 12)
+    return value.replace(year=value.year + year, month=month + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_ddl(table: str, month: datetime) -> str:
+    """``CREATE TABLE`` statement for the partition of ``table`` holding ``month``."""
+    start = month_start(month)
+    end = add_months(start, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, start)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+def existing_partitions(connection: Connection, table: str) -> List[str]:
+    """Names of the partitions currently attached to ``table``."""
+    rows = connection.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table ORDER BY c.relname"
+        ),
+        {"table": table},
+    )
+    return [row[0] for row in rows]
+
+
+def ensure_partitions(
+    connection: Connection,
+    months_ahead: int = 3,
+    start: Optional[datetime] = None,
+    tables: Iterable[str] = PARTITIONED_TABLES,
+) -> List[str]:
+    """Create missing monthly partitions from ``start``'s month to ``months_ahead`` months later.
+
+    Does nothing on databases other than PostgreSQL, where the tables are not
+    partitioned.
+
+    Args:
+        connection: Connection to run the DDL on; the caller commits.
+        months_ahead: Number of months after the current one to prepare.
+        start: First month to cover; defaults to now.
+        tables: Partitioned tables to maintain.
+
+    Returns:
+        List[str]: Names of the partitions that were created.
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+
+    first = month_start(start or datetime.now(timezone.utc))
+    months = [add_months(first, i) for i in range(months_ahead + 1)]
+    created = []
+    for table in tables:
+        existing = set(existing_partitions(connection, table))
+        for month in months:
+            name = partition_name(table, month)
+            if name in existing:
+                continue
+            connection.execute(text(partition_ddl(table, month)))
+            created.append(name)
+            logger.info(f"Created partition {name}")
+    return created
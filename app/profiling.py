@@ -0,0 +1,199 @@
+"""On-demand per-request profiling.
+
+The :class:`ProfilingMiddleware` profiles a request when it carries an
+``X-Profile`` header with the configured token, or when it is picked by the
+``PROFILING_SAMPLE_RATE`` sampler. A profiled request runs under ``cProfile``
+(exact per-function timings) while a background thread samples the event loop
+thread's Python stack every ``PROFILING_SAMPLE_INTERVAL_MS`` to build collapsed
+stacks for flamegraphs. Results are kept in a bounded in-memory ring buffer and
+served by ``app.routes.profiling``.
+
+The middleware is only installed when ``PROFILING_ENABLED`` is set; when it is
+installed, unprofiled requests only pay for a header lookup and one random draw.
+Profiles cover everything running on the event loop thread while the request
+is in flight, so concurrent requests may show up in each other's profiles.
+"""
+import cProfile
+import itertools
+import os
+import pstats
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from .config import settings
+
+PROFILE_HEADER = b"x-profile"
+
+
+class StackSampler(threading.Thread):
+    """Periodically sample the Python stack of another thread.
+
+    Args:
+        thread_id: Identifier of the thread to sample.
+        interval: Seconds between samples.
+    """
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        super().__init__(daemon=True, name="profiling-sampler")
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self._collapse(frame)] += 1
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+
+class ProfileStore:
+    """Bounded ring buffer of completed request profiles."""
+
+    def __init__(self, maxlen: int = 50) -> None:
+        self._profiles: Deque[Dict[str, Any]] = deque(maxlen=maxlen)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, profile: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            profile["id"] = next(self._ids)
+            self._profiles.append(profile)
+        return profile
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {k: v for k, v in p.items() if k not in ("functions", "stacks")}
+                for p in reversed(self._profiles)
+            ]
+
+    def get(self, profile_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return next((p for p in self._profiles if p["id"] == profile_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+
+
+def top_functions(profile: Dict[str, Any], limit: int = 20, sort: str = "tottime") -> List[Dict[str, Any]]:
+    """Return the ``limit`` hottest functions of a stored profile."""
+    key = "cumulative_ms" if sort == "cumulative" else "total_ms"
+    return sorted(profile["functions"], key=lambda f: f[key], reverse=True)[:limit]
+
+
+def collapsed_stacks(profile: Dict[str, Any]) -> str:
+    """Render a stored profile's stack samples in collapsed (folded) format."""
+    return "\n".join(f"{stack} {count}" for stack, count in profile["stacks"].items())
+
+
+def _function_stats(profiler: cProfile.Profile) -> List[Dict[str, Any]]:
+    stats = pstats.Stats(profiler)
+    functions = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        functions.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "total_ms": round(tottime * 1000, 3),
+            "cumulative_ms": round(cumtime * 1000, 3),
+        })
+    return functions
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling header-triggered or sampled requests.
+
+    Args:
+        app: The wrapped ASGI application.
+        store: Ring buffer receiving completed profiles.
+        token: Value the ``X-Profile`` header must carry to force profiling.
+        sample_rate: Fraction of requests to profile without the header.
+        sample_interval: Seconds between stack samples.
+    """
+
+    def __init__(
+        self,
+        app,
+        store: ProfileStore,
+        token: Optional[str] = None,
+        sample_rate: float = 0.0,
+        sample_interval: float = 0.005,
+    ):
+        self.app = app
+        self.store = store
+        self.token = token.encode() if token else None
+        self.sample_rate = sample_rate
+        self.sample_interval = sample_interval
+        # cProfile can only be active once per thread.
+        self._active = threading.Lock()
+
+    def _should_profile(self, scope) -> bool:
+        if self.token is not None:
+            for name, value in scope.get('headers', ()):
+                if name == PROFILE_HEADER and secrets.compare_digest(value, self.token):
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        if not self._active.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = None
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), self.sample_interval)
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        sampler.start()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            sampler.stop()
+            self._active.release()
+            duration = time.perf_counter() - start
+            self.store.add({
+                "method": scope['method'],
+                "path": scope['path'],
+                "status_code": status_code,
+                "started_at": started_at.isoformat() + "Z",
+                "duration_ms": round(duration * 1000, 3),
+                "samples": sum(sampler.stacks.values()),
+                "functions": _function_stats(profiler),
+                "stacks": dict(sampler.stacks),
+            })
+
+
+# Process-wide profile buffer
+profile_store = ProfileStore(maxlen=settings.PROFILING_BUFFER_SIZE)
@@ -0,0 +1,163 @@
+"""Registry of pre-built hot queries with compile/execute instrumentation.
+
+The handful of statements behind ``get_loan``, ``list_loans`` and ``get_stats``
+run on almost every request. Building them once at import time with explicit
+bind parameters means each request only does a compiled-cache lookup in
+SQLAlchemy instead of constructing and compiling a new ``Select``; driver-level
+prepared statements (see :func:`app.db.driver_connect_args`) then let Postgres
+skip parsing and planning as well.
+
+Every hot query is tagged with a ``hot_query`` execution option. Cursor
+execution time is measured through engine events and the remaining time spent
+in :func:`execute` (statement compilation or cache lookup and ORM overhead) is
+reported separately, together with SQLAlchemy's compiled cache hit/miss state.
+"""
+from functools import lru_cache
+from time import perf_counter
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from sqlalchemy import any_, bindparam, event, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.engine import Engine, Result
+from sqlalchemy.engine.interfaces import CacheStats
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.sql import Executable
+
+from .metrics import HOT_QUERY_CACHE, HOT_QUERY_DURATION
+from .models import Loan
+from .schemas import LOAN_OUT_COLUMNS
+
+# Label values for SQLAlchemy's ExecutionContext.cache_hit states
+_CACHE_STATES = {
+    CacheStats.CACHE_HIT: "hit",
+    CacheStats.CACHE_MISS: "miss",
+    CacheStats.CACHING_DISABLED: "disabled",
+    CacheStats.NO_CACHE_KEY: "no_key",
+    CacheStats.NO_DIALECT_SUPPORT: "unsupported",
+}
+
+
+def _hot(name: str, statement: Executable) -> Executable:
+    return statement.execution_options(hot_query=name)
+
+
+def _created_between(statement):
+    """Restrict to ``created_from <= created_at < created_to`` so partitions can be pruned."""
+    return statement.where(
+        Loan.created_at >= bindparam("created_from", type_=Loan.created_at.type),
+        Loan.created_at < bindparam("created_to", type_=Loan.created_at.type),
+    )
+
+
+_STATEMENTS: Dict[str, Executable] = {
+    "loan_by_id": _hot(
+        "loan_by_id", select(Loan).where(Loan.id == bindparam("loan_id"))
+    ),
+    # Borrower is joined in the same query, payments come from one extra IN query.
+    "loan_detail": _hot(
+        "loan_detail",
+        select(Loan)
+        .options(joinedload(Loan.borrower), selectinload(Loan.payments))
+        .where(Loan.id == bindparam("loan_id")),
+    ),
+    # One array parameter keeps a single cached plan for any number of ids.
+    "loans_by_ids": _hot(
+        "loans_by_ids",
+        select(*LOAN_OUT_COLUMNS).where(
+            Loan.id == any_(bindparam("ids", type_=ARRAY(UUID(as_uuid=True))))
+        ),
+    ),
+    # Fallback for databases without array parameters (SQLite).
+    "loans_by_ids_in": _hot(
+        "loans_by_ids_in",
+        select(*LOAN_OUT_COLUMNS).where(Loan.id.in_(bindparam("ids", expanding=True))),
+    ),
+    "list_loans": _hot("list_loans", select(Loan).order_by(Loan.created_at.desc())),
+    # Every /stats figure is derived from these groups in a single scan.
+    "stats_totals": _hot(
+        "stats_totals",
+        select(Loan.status, Loan.currency, func.count(Loan.id), func.sum(Loan.amount))
+        .group_by(Loan.status, Loan.currency),
+    ),
+}
+
+# Variants bounded by created_at, used when the range of the rows is known
+# (from UUIDv7 ids or request filters) so PostgreSQL only scans the matching
+# monthly partitions of ``loans``.
+_PARTITION_PRUNED = (
+    "loan_by_id",
+    "loan_detail",
+    "loans_by_ids",
+    "loans_by_ids_in",
+    "list_loans",
+    "stats_totals",
+)
+
+HOT_QUERIES: Dict[str, Executable] = dict(_STATEMENTS)
+for _name in _PARTITION_PRUNED:
+    HOT_QUERIES[f"{_name}_pruned"] = _hot(f"{_name}_pruned", _created_between(_STATEMENTS[_name]))
+
+
+@lru_cache(maxsize=512)
+def projection(name: str, fields: Tuple[str, ...]) -> Executable:
+    """Variant of the loan hot query ``name`` selecting only the ``fields`` columns.
+
+    Rows come back as plain tuples instead of ORM instances, and an index
+    covering the selected columns lets PostgreSQL answer with an index-only
+    scan. Statements are built once per field combination.
+    """
+    columns = [getattr(Loan, field) for field in fields]
+    return _hot(f"{name}_fields", HOT_QUERIES[name].with_only_columns(*columns))
+
+
+def execute(
+    db,
+    name: str,
+    params: Optional[Mapping[str, Any]] = None,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> Result:
+    """Execute the registered hot query ``name`` on session ``db``.
+
+    Args:
+        db: SQLAlchemy session.
+        name: Key in :data:`HOT_QUERIES`.
+        params: Bind parameter values.
+        fields: Loan columns to select instead of the query's own (see
+            :func:`projection`).
+
+    Returns:
+        Result: The SQLAlchemy result.
+    """
+    statement = HOT_QUERIES[name] if fields is None else projection(name, fields)
+    start = perf_counter()
+    info = db.connection().info
+    info["hot_query_cursor_time"] = 0.0
+    result = db.execute(statement, params or {})
+    total = perf_counter() - start
+    cursor_time = info.pop("hot_query_cursor_time", 0.0)
+
+    HOT_QUERY_DURATION.labels(query=name, phase="execute").observe(cursor_time)
+    HOT_QUERY_DURATION.labels(query=name, phase="compile").observe(max(total - cursor_time, 0.0))
+    return result
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and "hot_query" in context.execution_options:
+        conn.info["hot_query_cursor_start"] = perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is None:
+        return
+    name = context.execution_options.get("hot_query")
+    if name is None:
+        return
+    start = conn.info.pop("hot_query_cursor_start", None)
+    if start is not None:
+        conn.info["hot_query_cursor_time"] = (
+            conn.info.get("hot_query_cursor_time", 0.0) + perf_counter() - start
+        )
+    cache_state = _CACHE_STATES.get(getattr(context, "cache_hit", None), "unknown")
+    HOT_QUERY_CACHE.labels(query=name, result=cache_state).inc()
@@ -0,0 +1,371 @@
+"""Streaming import of bank repayment files.
+
+A repayment file is CSV (with a header row) or NDJSON, one repayment per
+row with the fields:
+
+- ``transaction_reference``: bank reference, used for deduplication
+- ``loan_id``: loan the repayment belongs to
+- ``amount``: amount paid
+- ``paid_at``: ISO 8601 timestamp (UTC if no offset is given)
+- ``payment_id`` (optional): scheduled payment settled by this repayment
+
+:func:`import_payments` parses the file lazily and processes it in chunks of
+``chunk_size`` rows, one transaction per chunk, so memory use does not depend
+on the file size and an interrupted import can simply be re-run. Per chunk:
+
+1. references are claimed with ``INSERT ... ON CONFLICT DO NOTHING RETURNING``
+   into ``payment_references``; references already imported are skipped as
+   duplicates (``payments`` is partitioned and cannot enforce a global unique
+   index on ``transaction_reference`` itself);
+2. repayments naming a scheduled payment settle it with a set-based
+   ``UPDATE`` setting ``status``, ``paid_amount`` and ``paid_at`` together,
+   as ``chk_payment_status_consistency`` requires;
+3. the remaining repayments are bulk inserted as paid payments;
+4. the settled and inserted payments are recorded in the audit history
+   (see app.audit);
+5. exposure of the affected borrowers is refreshed.
+
+Rows that cannot be parsed or matched are rejected and reported with their
+line number.
+"""
+import csv
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple, Union
+from uuid import UUID
+
+from sqlalchemy import case, delete, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .audit import INSERT, UPDATE, audit_entry, record_changes
+from .exposure import refresh_borrower_exposure
+from .metrics import PAYMENT_IMPORT_ROWS
+from .models import Loan, Payment, PaymentReference, PaymentStatus
+from .partitions import uuid7
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+REQUIRED_FIELDS = ("transaction_reference", "loan_id", "amount", "paid_at")
+
+# Scheduled payments settled per UPDATE statement (three CASE parameters each)
+_SETTLE_BATCH_SIZE = 500
+_MAX_AMOUNT = Decimal("9999999999.99")
+
+
+def iter_records(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Union[str, Dict[str, Any]]]]:
+    """Yield ``(line_number, raw_record)`` pairs from a CSV or NDJSON stream."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "ndjson":
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                yield line_number, line
+    else:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+
+def parse_record(raw: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Validate one raw record.
+
+    Raises:
+        ValueError: With a message suitable for the rejects report.
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e.msg}")
+        if not isinstance(raw, dict):
+            raise ValueError("Expected a JSON object")
+    missing = [name for name in REQUIRED_FIELDS if raw.get(name) in (None, "")]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+
+    try:
+        amount = Decimal(str(raw["amount"])).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {raw['amount']!r}")
+    if not 0 < amount <= _MAX_AMOUNT:
+        raise ValueError(f"Amount out of range: {amount}")
+    try:
+        paid_at = datetime.fromisoformat(str(raw["paid_at"]))
+    except ValueError:
+        raise ValueError(f"Invalid paid_at: {raw['paid_at']!r}")
+    if paid_at.tzinfo is None:
+        paid_at = paid_at.replace(tzinfo=timezone.utc)
+    try:
+        loan_id = UUID(str(raw["loan_id"]))
+        payment_id = UUID(str(raw["payment_id"])) if raw.get("payment_id") else None
+    except ValueError:
+        raise ValueError("Invalid loan_id or payment_id")
+    return {
+        "transaction_reference": str(raw["transaction_reference"]).strip(),
+        "loan_id": loan_id,
+        "amount": amount,
+        "paid_at": paid_at,
+        "payment_id": payment_id,
+    }
+
+
+class ImportReport:
+    """Counters of an import run; keeps at most ``max_rejects`` reject details."""
+
+    def __init__(self, max_rejects: int = 100) -> None:
+        self.max_rejects = max_rejects
+        self.rows = 0
+        self.inserted = 0
+        self.settled = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.rejects: List[Dict[str, Any]] = []
+        self.started = time.perf_counter()
+
+    def reject(self, line: int, reason: str) -> None:
+        self.rejected += 1
+        if len(self.rejects) < self.max_rejects:
+            self.rejects.append({"line": line, "reason": reason})
+
+    def as_dict(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "settled": self.settled,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "rejects": self.rejects,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else None,
+        }
+
+
+def _claim_references(db: Session, records: List[Dict[str, Any]]) -> set:
+    """Insert references not imported before; return the ones that were new."""
+    insert_ = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = (
+        insert_(PaymentReference)
+        .values(
+            [
+                {"transaction_reference": r["transaction_reference"], "payment_id": r["payment_id"]}
+                for r in records
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=["transaction_reference"])
+        .returning(PaymentReference.transaction_reference)
+    )
+    return set(db.scalars(stmt))
+
+
+def _settle(db: Session, records: List[Dict[str, Any]]) -> set:
+    """Mark the scheduled payments of ``records`` paid; return the ids updated."""
+    settled = set()
+    for start in range(0, len(records), _SETTLE_BATCH_SIZE):
+        batch = records[start : start + _SETTLE_BATCH_SIZE]
+
+        def by_id(field, type_):
+            return case(
+                *((Payment.id == r["payment_id"], literal(r[field], type_)) for r in batch)
+            )
+
+        stmt = (
+            update(Payment)
+            .where(
+                Payment.id.in_([r["payment_id"] for r in batch]),
+                Payment.status != PaymentStatus.PAID,
+            )
+            .values(
+                status=PaymentStatus.PAID,
+                paid_amount=by_id("amount", Payment.paid_amount.type),
+                paid_at=by_id("paid_at", Payment.paid_at.type),
+                transaction_reference=by_id("transaction_reference", Payment.transaction_reference.type),
+            )
+            .returning(Payment.id)
+            .execution_options(synchronize_session=False)
+        )
+        settled.update(db.scalars(stmt))
+    return settled
+
+
+def _process_chunk(db: Session, chunk: List[Tuple[int, Dict[str, Any]]], report: ImportReport) -> None:
+    records: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+    for line, record in chunk:
+        if record["transaction_reference"] in records:
+            report.duplicates += 1
+        else:
+            records[record["transaction_reference"]] = (line, record)
+
+    loans = dict(
+        db.execute(
+            select(Loan.id, Loan.borrower_id).where(
+                Loan.id.in_({r["loan_id"] for _, r in records.values()})
+            )
+        ).all()
+    )
+    payment_ids = [r["payment_id"] for _, r in records.values() if r["payment_id"]]
+    scheduled = {}
+    if payment_ids:
+        scheduled = {
+            row.id: row
+            for row in db.execute(
+                select(
+                    Payment.id,
+                    Payment.loan_id,
+                    Payment.status,
+                    Payment.paid_amount,
+                    Payment.paid_at,
+                    Payment.transaction_reference,
+                ).where(Payment.id.in_(payment_ids))
+            )
+        }
+
+    valid = []
+    for line, record in records.values():
+        if record["loan_id"] not in loans:
+            report.reject(line, f"Unknown loan {record['loan_id']}")
+            continue
+        if record["payment_id"] is not None:
+            payment = scheduled.get(record["payment_id"])
+            if payment is None or payment.loan_id != record["loan_id"]:
+                report.reject(line, f"Unknown payment {record['payment_id']} for loan {record['loan_id']}")
+                continue
+            if payment.status == PaymentStatus.PAID:
+                report.reject(line, f"Payment {record['payment_id']} is already paid")
+                continue
+        else:
+            record["new_payment_id"] = uuid7()
+        valid.append((line, record))
+    if not valid:
+        return
+
+    claimed = _claim_references(
+        db, [{**r, "payment_id": r["payment_id"] or r["new_payment_id"]} for _, r in valid]
+    )
+    report.duplicates += len(valid) - len(claimed)
+    new = [(line, r) for line, r in valid if r["transaction_reference"] in claimed]
+
+    to_settle = [r for _, r in new if r["payment_id"] is not None]
+    settled = _settle(db, to_settle) if to_settle else set()
+    unsettled = [(line, r) for line, r in new if r["payment_id"] is not None and r["payment_id"] not in settled]
+    if unsettled:
+        # Paid by a concurrent import between the check and the UPDATE
+        db.execute(
+            delete(PaymentReference).where(
+                PaymentReference.transaction_reference.in_([r["transaction_reference"] for _, r in unsettled])
+            )
+        )
+        for line, record in unsettled:
+            report.reject(line, f"Payment {record['payment_id']} is already paid")
+    report.settled += len(settled)
+
+    changes = []
+    for _, r in new:
+        if r["payment_id"] not in settled:
+            continue
+        old = scheduled[r["payment_id"]]
+        changes.append(
+            audit_entry(
+                "payment", old.id, old.loan_id, UPDATE,
+                {
+                    "status": (old.status, PaymentStatus.PAID),
+                    "paid_amount": (old.paid_amount, r["amount"]),
+                    "paid_at": (old.paid_at, r["paid_at"]),
+                    "transaction_reference": (old.transaction_reference, r["transaction_reference"]),
+                },
+            )
+        )
+
+    to_insert = [r for _, r in new if r["payment_id"] is None]
+    if to_insert:
+        rows = [
+            {
+                "id": r["new_payment_id"],
+                "loan_id": r["loan_id"],
+                "amount": r["amount"],
+                "status": PaymentStatus.PAID,
+                "due_date": r["paid_at"],
+                "paid_amount": r["amount"],
+                "paid_at": r["paid_at"],
+                "transaction_reference": r["transaction_reference"],
+            }
+            for r in to_insert
+        ]
+        db.execute(insert(Payment), rows)
+        changes.extend(
+            audit_entry("payment", row["id"], row["loan_id"], INSERT, {key: (None, value) for key, value in row.items()})
+            for row in rows
+        )
+        report.inserted += len(to_insert)
+    record_changes(db, changes)
+
+    affected = {loans[r["loan_id"]] for _, r in new}
+    refresh_borrower_exposure(db.connection(), affected)
+
+
+def import_payments(
+    db: Session,
+    stream: TextIO,
+    fmt: str = "csv",
+    chunk_size: int = 5000,
+    max_rejects: int = 100,
+) -> Dict[str, Any]:
+    """Import a repayment file from ``stream``, committing once per chunk.
+
+    Args:
+        db: SQLAlchemy session.
+        stream: Text stream of the file contents.
+        fmt: ``csv`` or ``ndjson``.
+        chunk_size: Rows processed per transaction.
+        max_rejects: Maximum number of rejected rows listed in the report.
+
+    Returns:
+        dict: Row counts (``inserted``, ``settled``, ``duplicates``,
+        ``rejected``), the first ``rejects`` and the throughput.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    report = ImportReport(max_rejects)
+    chunk: List[Tuple[int, Dict[str, Any]]] = []
+
+    def flush() -> None:
+        counts = (report.inserted, report.settled, report.duplicates, report.rejected)
+        _process_chunk(db, chunk, report)
+        db.commit()
+        for result, before, after in zip(
+            ("inserted", "settled", "duplicate", "rejected"),
+            counts,
+            (report.inserted, report.settled, report.duplicates, report.rejected),
+        ):
+            PAYMENT_IMPORT_ROWS.labels(result=result).inc(after - before)
+        chunk.clear()
+
+    for line, raw in iter_records(stream, fmt):
+        report.rows += 1
+        try:
+            chunk.append((line, parse_record(raw)))
+        except ValueError as e:
+            report.reject(line, str(e))
+            PAYMENT_IMPORT_ROWS.labels(result="rejected").inc()
+            continue
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    result = report.as_dict()
+    logger.info(
+        f"Imported payments: {result['rows']} rows, {result['inserted']} inserted, "
+        f"{result['settled']} settled, {result['duplicates']} duplicates, "
+        f"{result['rejected']} rejected ({result['rows_per_second']} rows/s)"
+    )
+    return result
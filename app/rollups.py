@@ -0,0 +1,366 @@
+"""Time-bucketed loan origination rollups.
+
+``origination_series`` returns, for each day, week or month of a range, the
+number of loans originated, their total amount and amount percentiles, overall
+and sliced by status and by currency.
+
+On PostgreSQL all buckets and slices come from a single ``GROUPING SETS``
+query, which scans only the requested ``created_at`` range through the BRIN
+index ``ix_loans_created_at_brin``. Buckets that ended more than
+``ORIGINATION_SETTLE_SECONDS`` ago are written to the ``origination_rollups``
+table the first time they are computed and served from there afterwards, so a
+request usually recomputes only the last few buckets. The grace period covers
+loans whose ``created_at`` (taken from their id when the request arrives) is
+older than their commit.
+
+Cached buckets count the loans in the ``loans`` table. When loans change
+status or are deleted (archived), or are inserted with a ``created_at`` older
+than the grace period, the cached buckets containing them are dropped in the
+same transaction, by a session hook for ORM writes and by
+:func:`invalidate_loan_buckets` / :func:`invalidate_inserted_loans` calls from
+Core/bulk writers, and recomputed on the next read.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, delete, event, func, inspect, literal_column, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .metrics import ORIGINATION_ROLLUP_BUCKETS
+from .models import Loan, OriginationRollup
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("day", "week", "month")
+ALL = "*"
+PERCENTILES = (50, 90, 99)
+
+# (period_start, status, currency) -> aggregate values
+RollupKey = Tuple[datetime, str, str]
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def truncate(value: datetime, granularity: str) -> datetime:
+    """Start of the ``granularity`` bucket containing ``value`` (weeks start on Monday)."""
+    day = _as_utc(value).replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_bucket(period_start: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return period_start + timedelta(days=1)
+    if granularity == "week":
+        return period_start + timedelta(weeks=1)
+    year, month = divmod(period_start.month, 12)
+    return period_start.replace(year=period_start.year + year, month=month + 1)
+
+
+def _periods(granularity: str, start: datetime, end: datetime) -> List[datetime]:
+    periods = []
+    period = truncate(start, granularity)
+    while period < end:
+        periods.append(period)
+        period = next_bucket(period, granularity)
+    return periods
+
+
+def _aggregate(count: int, total: Any, p50: Any, p90: Any, p99: Any) -> Dict[str, Any]:
+    return {
+        "loan_count": int(count),
+        "total_amount": Decimal(total or 0).quantize(Decimal("0.01")),
+        "p50_amount": None if p50 is None else round(float(p50), 2),
+        "p90_amount": None if p90 is None else round(float(p90), 2),
+        "p99_amount": None if p99 is None else round(float(p99), 2),
+    }
+
+
+def _compute_postgresql(db, granularity: str, start: datetime, end: datetime) -> Dict[RollupKey, Dict[str, Any]]:
+    # Literal arguments so the expression in SELECT matches the one in GROUPING SETS.
+    period = func.date_trunc(
+        literal_column(f"'{granularity}'"), func.timezone(literal_column("'UTC'"), Loan.created_at)
+    )
+    stmt = (
+        select(
+            period.label("period"),
+            Loan.status,
+            Loan.currency,
+            func.grouping(Loan.status, Loan.currency).label("grouping_id"),
+            func.count(),
+            func.sum(Loan.amount),
+            *(func.percentile_cont(p / 100).within_group(Loan.amount) for p in PERCENTILES),
+        )
+        .where(Loan.created_at >= start, Loan.created_at < end)
+        .group_by(
+            func.grouping_sets(
+                tuple_(period), tuple_(period, Loan.status), tuple_(period, Loan.currency)
+            )
+        )
+    )
+    rows = {}
+    for period_start, status, currency, grouping, *values in db.execute(stmt):
+        key = (
+            _as_utc(period_start),
+            ALL if grouping & 2 else status.value,
+            ALL if grouping & 1 else currency,
+        )
+        rows[key] = _aggregate(*values)
+    return rows
+
+
+def _compute_python(db, granularity: str, start: datetime, end: datetime) -> Dict[RollupKey, Dict[str, Any]]:
+    """Equivalent of the GROUPING SETS query for databases without it (SQLite)."""
+    amounts: Dict[RollupKey, List[Decimal]] = defaultdict(list)
+    stmt = select(Loan.created_at, Loan.status, Loan.currency, Loan.amount).where(
+        Loan.created_at >= start, Loan.created_at < end
+    )
+    for created_at, status, currency, amount in db.execute(stmt.execution_options(yield_per=10000)):
+        period = truncate(created_at, granularity)
+        for key in ((period, ALL, ALL), (period, status.value, ALL), (period, ALL, currency)):
+            amounts[key].append(amount)
+
+    rows = {}
+    for key, values in amounts.items():
+        percentiles = np.percentile(np.array(values, dtype=np.float64), PERCENTILES)
+        rows[key] = _aggregate(len(values), sum(values), *percentiles)
+    return rows
+
+
+def _compute(db, granularity: str, start: datetime, end: datetime) -> Dict[RollupKey, Dict[str, Any]]:
+    if db.get_bind().dialect.name == "postgresql":
+        return _compute_postgresql(db, granularity, start, end)
+    return _compute_python(db, granularity, start, end)
+
+
+def _store(db, granularity: str, rows: Dict[RollupKey, Dict[str, Any]]) -> None:
+    """Cache ``rows`` in a transaction of their own, leaving the caller's session alone."""
+    if not rows:
+        return
+    values = [
+        {"granularity": granularity, "period_start": period, "status": status, "currency": currency, **aggregate}
+        for (period, status, currency), aggregate in rows.items()
+    ]
+    bind = db.get_bind()
+    insert = pg_insert if bind.dialect.name == "postgresql" else sqlite_insert
+    with Session(bind=bind) as session:
+        try:
+            # A concurrent request may have cached the same buckets already.
+            session.execute(insert(OriginationRollup).on_conflict_do_nothing(), values)
+            session.commit()
+        except SQLAlchemyError as e:
+            # Only a cache: the next request computes the buckets again
+            session.rollback()
+            logger.warning(f"Could not cache {granularity} origination rollups: {e}")
+
+
+def invalidate_rollups(db, granularity: Optional[str] = None, since: Optional[datetime] = None) -> int:
+    """Delete cached rollups, optionally only for one granularity or from ``since`` on.
+
+    Returns:
+        int: Number of rollup rows deleted.
+    """
+    stmt = delete(OriginationRollup)
+    if granularity is not None:
+        stmt = stmt.where(OriginationRollup.granularity == granularity)
+    if since is not None:
+        stmt = stmt.where(OriginationRollup.period_start >= _as_utc(since))
+    deleted = db.execute(stmt).rowcount
+    db.commit()
+    return deleted
+
+
+def invalidate_loan_buckets(connection: Connection, created_ats: Iterable[datetime]) -> int:
+    """Drop the cached buckets, of every granularity, containing loans created at ``created_ats``.
+
+    Runs on the caller's connection, so the buckets are dropped if and only if
+    the loan change commits.
+
+    Returns:
+        int: Number of rollup rows deleted.
+    """
+    created_ats = {_as_utc(value) for value in created_ats if value is not None}
+    if not created_ats:
+        return 0
+    stmt = delete(OriginationRollup).where(
+        or_(
+            *(
+                and_(
+                    OriginationRollup.granularity == granularity,
+                    OriginationRollup.period_start.in_(
+                        sorted({truncate(value, granularity) for value in created_ats})
+                    ),
+                )
+                for granularity in GRANULARITIES
+            )
+        )
+    )
+    return connection.execute(stmt).rowcount
+
+
+def _backdated(created_ats: Iterable[Optional[datetime]]) -> List[datetime]:
+    # Newer loans fall in buckets that cannot have been cached yet
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.ORIGINATION_SETTLE_SECONDS)
+    return [value for value in created_ats if value is not None and _as_utc(value) < cutoff]
+
+
+def invalidate_inserted_loans(connection: Connection, created_ats: Iterable[Optional[datetime]]) -> int:
+    """Drop the cached buckets that newly inserted loans created at ``created_ats`` fall into.
+
+    Only loans older than the settle grace period can land in a cached bucket,
+    so for ordinary inserts this does not touch the database.
+
+    Returns:
+        int: Number of rollup rows deleted.
+    """
+    return invalidate_loan_buckets(connection, _backdated(created_ats))
+
+
+@event.listens_for(Session, "after_flush")
+def invalidate_changed_buckets(session, flush_context):
+    """Drop cached buckets of loans whose status changed, that were deleted or backdated inserts."""
+    created_ats = _backdated(
+        obj.created_at for obj in session.new if isinstance(obj, Loan) and "created_at" in inspect(obj).dict
+    )
+    unloaded = []
+    for obj in (*session.dirty, *session.deleted):
+        if not isinstance(obj, Loan):
+            continue
+        state = inspect(obj)
+        if not state.deleted:
+            history = state.attrs.status.history
+            if not history.added or history.added[0] == (history.deleted[0] if history.deleted else None):
+                continue
+        if "created_at" in state.dict:
+            created_ats.append(state.dict["created_at"])
+        elif not state.deleted:
+            unloaded.append(state.identity[0])
+    if unloaded:
+        created_ats.extend(
+            session.connection().scalars(select(Loan.created_at).where(Loan.id.in_(unloaded)))
+        )
+    if created_ats:
+        invalidate_loan_buckets(session.connection(), created_ats)
+
+
+def _bucket(period: datetime, closed: bool, rows: Iterable[Tuple[str, str, Dict[str, Any]]]) -> Dict[str, Any]:
+    bucket = {
+        "period_start": period.isoformat(),
+        "closed": closed,
+        "loan_count": 0,
+        "total_amount": 0.0,
+        "p50_amount": None,
+        "p90_amount": None,
+        "p99_amount": None,
+        "by_status": {},
+        "by_currency": {},
+    }
+    for status, currency, aggregate in rows:
+        aggregate = {**aggregate, "total_amount": float(aggregate["total_amount"])}
+        if status == ALL and currency == ALL:
+            bucket.update(aggregate)
+        elif currency == ALL:
+            bucket["by_status"][status] = aggregate
+        else:
+            bucket["by_currency"][currency] = aggregate
+    return bucket
+
+
+def origination_series(
+    db,
+    granularity: str,
+    start: datetime,
+    end: datetime,
+    now: Optional[datetime] = None,
+    max_buckets: int = 366,
+    settle: Optional[timedelta] = None,
+) -> Dict[str, Any]:
+    """Origination counts, sums and amount percentiles per bucket of ``[start, end)``.
+
+    Args:
+        db: SQLAlchemy session.
+        granularity: ``day``, ``week`` or ``month``.
+        start: Start of the range, rounded down to its bucket.
+        end: Exclusive end of the range.
+        now: Current time, deciding which buckets are closed; defaults to now.
+        max_buckets: Upper bound on the number of buckets in the range.
+        settle: Time after its end before a bucket is cached; defaults to
+            ``ORIGINATION_SETTLE_SECONDS``.
+
+    Returns:
+        dict: ``granularity`` and the list of ``buckets``.
+
+    Raises:
+        ValueError: If the granularity is unknown or the range is too long.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    now = _as_utc(now or datetime.now(timezone.utc))
+    if settle is None:
+        settle = timedelta(seconds=settings.ORIGINATION_SETTLE_SECONDS)
+    settled = now - settle
+    periods = _periods(granularity, start, _as_utc(end))
+    if len(periods) > max_buckets:
+        raise ValueError(f"Range spans {len(periods)} buckets, at most {max_buckets} allowed")
+    if not periods:
+        return {"granularity": granularity, "buckets": []}
+
+    rows: Dict[datetime, List[Tuple[str, str, Dict[str, Any]]]] = defaultdict(list)
+    cached = db.scalars(
+        select(OriginationRollup).where(
+            OriginationRollup.granularity == granularity,
+            OriginationRollup.period_start >= periods[0],
+            OriginationRollup.period_start <= periods[-1],
+        )
+    )
+    for rollup in cached:
+        aggregate = _aggregate(
+            rollup.loan_count, rollup.total_amount, rollup.p50_amount, rollup.p90_amount, rollup.p99_amount
+        )
+        rows[_as_utc(rollup.period_start)].append((rollup.status, rollup.currency, aggregate))
+
+    # Every cached bucket has an overall row, even when no loans were originated.
+    missing = [
+        p for p in periods if not any(s == ALL and c == ALL for s, c, _ in rows.get(p, ()))
+    ]
+    ORIGINATION_ROLLUP_BUCKETS.labels(granularity=granularity, source="cache").inc(len(periods) - len(missing))
+    ORIGINATION_ROLLUP_BUCKETS.labels(granularity=granularity, source="computed").inc(len(missing))
+
+    if missing:
+        missing_set = set(missing)
+        computed = _compute(db, granularity, missing[0], next_bucket(missing[-1], granularity))
+        to_store = {}
+        for period in missing:
+            if next_bucket(period, granularity) <= settled:
+                to_store[(period, ALL, ALL)] = _aggregate(0, 0, None, None, None)
+        for (period, status, currency), aggregate in computed.items():
+            if period not in missing_set:
+                continue
+            rows[period].append((status, currency, aggregate))
+            if next_bucket(period, granularity) <= settled:
+                to_store[(period, status, currency)] = aggregate
+        _store(db, granularity, to_store)
+
+    return {
+        "granularity": granularity,
+        "buckets": [
+            _bucket(period, next_bucket(period, granularity) <= now, rows.get(period, ()))
+            for period in periods
+        ],
+    }
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
+from uuid import UUID
+
+from ..config import settings
+from ..db import SessionContext, get_db
+from ..exposure import PAYMENT_STATUS_SEVERITY, get_exposure
+from ..models import Borrower, PaymentStatus
+from ..schemas import BorrowerExposureOut
+from ..search import MIN_QUERY_LENGTH, search_borrowers
+from ..sharding import ShardRouter, get_shard_router
+
+router = APIRouter(prefix="/borrowers", tags=["borrowers"])
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=MIN_QUERY_LENGTH, max_length=200),
+    limit: int = Query(20, ge=1, le=settings.SEARCH_MAX_LIMIT),
+    db: SessionContext = Depends(get_db),
+):
+    """Borrowers whose name, email or phone contains ``q``, best matches first."""
+    return {"results": search_borrowers(db, q, limit, candidates=settings.SEARCH_CANDIDATE_LIMIT)}
+
+def _shard_exposure(db, borrower_id: UUID) -> Optional[BorrowerExposureOut]:
+    exposure = get_exposure(db, borrower_id)
+    if exposure is not None:
+        return BorrowerExposureOut.from_orm(exposure)
+    if db.get(Borrower, borrower_id) is not None:
+        return BorrowerExposureOut(borrower_id=borrower_id)
+    return None
+
+def _merge_exposure(borrower_id: UUID, parts) -> BorrowerExposureOut:
+    """Sum the exposure a borrower has on each shard; the worst status wins."""
+    merged = BorrowerExposureOut(borrower_id=borrower_id)
+    for part in parts:
+        merged.outstanding_amount += part.outstanding_amount
+        merged.active_loan_count += part.active_loan_count
+        if part.worst_payment_status is not None and (
+            merged.worst_payment_status is None
+            or PAYMENT_STATUS_SEVERITY[PaymentStatus(part.worst_payment_status)]
+            > PAYMENT_STATUS_SEVERITY[PaymentStatus(merged.worst_payment_status)]
+        ):
+            merged.worst_payment_status = part.worst_payment_status
+        if part.updated_at is not None and (merged.updated_at is None or part.updated_at > merged.updated_at):
+            merged.updated_at = part.updated_at
+    return merged
+
+@router.get("/{borrower_id}/exposure", response_model=BorrowerExposureOut)
+async def get_borrower_exposure(
+    borrower_id: UUID,
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+):
+    if shards is not None:
+        # Loans, and so exposure rows, live on the shards
+        parts = [
+            part for part in (await shards.gather(lambda session: _shard_exposure(session, borrower_id))).values()
+            if part is not None
+        ]
+        if not parts:
+            raise HTTPException(status_code=404, detail="Borrower not found")
+        return _merge_exposure(borrower_id, parts)
+    exposure = get_exposure(db, borrower_id)
+    if exposure is not None:
+        return BorrowerExposureOut.from_orm(exposure)
+    if db.get(Borrower, borrower_id) is None:
+        raise HTTPException(status_code=404, detail="Borrower not found")
+    # Borrower exists but has never had a loan written
+    return BorrowerExposureOut(borrower_id=borrower_id)
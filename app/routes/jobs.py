@@ -0,0 +1,25 @@
+from fastapi import APIRouter, HTTPException
+from uuid import UUID
+
+from .. import decisioning  # noqa: F401  registers the decide_pending_loans job
+from ..jobs import JOB_TYPES, get_job_runner
+from ..schemas import CreateJobRequest, JobOut
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+@router.post("/", response_model=JobOut, status_code=202)
+async def create_job(job_data: CreateJobRequest):
+    if job_data.type not in JOB_TYPES:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown job type '{job_data.type}', expected one of {sorted(JOB_TYPES)}",
+        )
+    job = await get_job_runner().submit(job_data.type, job_data.params, job_data.max_attempts)
+    return JobOut.from_orm(job)
+
+@router.get("/{job_id}", response_model=JobOut)
+async def get_job(job_id: UUID):
+    job = get_job_runner().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobOut.from_orm(job)
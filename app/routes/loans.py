@@ -1,42 +1,426 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy import select
+import asyncio
+import heapq
+import json
+
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
+from sqlalchemy.exc import IntegrityError
 from uuid import UUID
+from datetime import datetime
 from decimal import Decimal
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
+from .. import queries
+from ..archive import get_loan_archive
+from ..audit import loan_history
+from ..batching import get_loan_coalescer
+from ..config import settings
 from ..db import SessionContext, get_db
+from ..idempotency import IdempotencyKeyReused, IdempotencyStore, get_idempotency_store, request_hash
 from ..models import Loan
-from ..schemas import CreateLoanRequest, LoanOut
+from ..partitions import created_at_window, created_range_params, uuid7, uuid_timestamp
+from ..transitions import APPLIED, CONFLICT, INVALID_TRANSITION, NOT_FOUND, transition_loans
+from ..search import search_loans
+from ..sharding import ShardRouter, get_shard_router
+from ..schemas import (
+    LOAN_OUT_FIELDS,
+    BatchGetLoansRequest,
+    BulkLoanTransitionRequest,
+    CreateLoanRequest,
+    LoanDetailOut,
+    LoanOut,
+    LoanTransitionRequest,
+    loan_row_to_dict,
+    parse_fields,
+    serialize_value,
+)
 
 router = APIRouter(prefix="/loans", tags=["loans"])
 
+
+def _find_loan(db, query: str, loan_id: UUID, fields: Optional[Tuple[str, ...]] = None):
+    """Look up one loan, first within the partitions its UUIDv7 id points to.
+
+    Returns the ORM instance, or a row of ``fields`` when they are given.
+    """
+    def fetch(name: str, params):
+        result = queries.execute(db, name, params, fields=fields)
+        if fields is not None:
+            return result.one_or_none()
+        return result.unique().scalar_one_or_none()
+
+    window = created_at_window([loan_id])
+    if window is not None:
+        loan = fetch(f"{query}_pruned", {"loan_id": loan_id, **window})
+        if loan is not None:
+            return loan
+    # Legacy ids, or rows whose created_at was set explicitly
+    return fetch(query, {"loan_id": loan_id})
+
+def _fields_param(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _json_response(body, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    # Rows are already JSON-ready, so skip response_model validation.
+    return Response(
+        content=json.dumps(body, separators=(",", ":")),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
+
+def _fetch_loans(db, ids: List[UUID], fields: Optional[Tuple[str, ...]]) -> Dict[UUID, dict]:
+    """Loans of ``ids`` found in the database, as JSON-ready dicts by id."""
+    query = "loans_by_ids" if db.get_bind().dialect.name == "postgresql" else "loans_by_ids_in"
+    found = {}
+    remaining = ids
+    window = created_at_window(ids)
+    if window is not None:
+        rows = queries.execute(db, f"{query}_pruned", {"ids": ids, **window}, fields=fields)
+        found = {row.id: loan_row_to_dict(row) for row in rows}
+        remaining = [loan_id for loan_id in ids if loan_id not in found]
+    if remaining:
+        rows = queries.execute(db, query, {"ids": remaining}, fields=fields)
+        found.update((row.id, loan_row_to_dict(row)) for row in rows)
+    return found
+
+async def _fetch_sharded_loans(
+    shards: ShardRouter, ids: List[UUID], fields: Optional[Tuple[str, ...]]
+) -> Dict[UUID, dict]:
+    """Fetch ``ids`` from the shards their ids point to, then search all shards for the rest."""
+    by_shard: Dict[int, List[UUID]] = {}
+    for loan_id in ids:
+        shard = shards.shard_for_loan(loan_id)
+        if shard is not None:
+            by_shard.setdefault(shard, []).append(loan_id)
+    results = await asyncio.gather(
+        *(shards.run(shard, lambda session, ids=shard_ids: _fetch_loans(session, ids, fields))
+          for shard, shard_ids in by_shard.items())
+    )
+    found = {loan_id: loan for result in results for loan_id, loan in result.items()}
+    remaining = [loan_id for loan_id in ids if loan_id not in found]
+    if remaining:
+        results = await shards.gather(lambda session: _fetch_loans(session, remaining, fields))
+        for result in results.values():
+            found.update(result)
+    return found
+
+async def _transition_sharded_loans(
+    shards: ShardRouter, items: List[Tuple[UUID, int, str]]
+) -> List[dict]:
+    """Apply transitions on the shards their loan ids point to, then on all shards for the rest.
+
+    Each shard commits its own part, so a bulk request is not atomic across shards.
+    """
+    def transition(indexes: List[int]):
+        return lambda session: transition_loans(
+            session, [items[index] for index in indexes], chunk_size=settings.LOAN_TRANSITION_CHUNK_SIZE
+        )
+
+    by_shard: Dict[int, List[int]] = {}
+    for index, (loan_id, _, _) in enumerate(items):
+        shard = shards.shard_for_loan(loan_id)
+        if shard is not None:
+            by_shard.setdefault(shard, []).append(index)
+    results: List[Optional[dict]] = [None] * len(items)
+    outcomes = await asyncio.gather(
+        *(shards.run(shard, transition(indexes)) for shard, indexes in by_shard.items())
+    )
+    for indexes, shard_results in zip(by_shard.values(), outcomes):
+        for index, result in zip(indexes, shard_results):
+            if result["result"] != NOT_FOUND:
+                results[index] = result
+    remaining = [index for index, result in enumerate(results) if result is None]
+    if remaining:
+        # A loan lives on one shard; the others report it as not found
+        for shard_results in (await shards.gather(transition(remaining))).values():
+            for index, result in zip(remaining, shard_results):
+                if results[index] is None or results[index]["result"] == NOT_FOUND:
+                    results[index] = result
+    return results
+
+async def _list_sharded_loans(shards: ShardRouter, window, fields: Tuple[str, ...]) -> List[dict]:
+    """Scatter ``list_loans`` to every shard and merge the sorted results, newest first."""
+    columns = fields if "created_at" in fields else fields + ("created_at",)
+
+    def fetch(session):
+        if window is None:
+            return queries.execute(session, "list_loans", fields=columns).all()
+        return queries.execute(session, "list_loans_pruned", window, fields=columns).all()
+
+    results = await shards.gather(fetch)
+    rows = heapq.merge(*results.values(), key=lambda row: row.created_at, reverse=True)
+    return [{field: serialize_value(getattr(row, field)) for field in fields} for row in rows]
+
+def _loan_to_dict(loan: Loan) -> dict:
+    return {field: serialize_value(getattr(loan, field)) for field in LOAN_OUT_FIELDS}
+
+def _insert_loan(db, values) -> dict:
+    loan = Loan(**values)
+    db.add(loan)
+    db.flush()
+    db.refresh(loan)
+    return _loan_to_dict(loan)
+
+def _existing_loan(db, loan_id: UUID) -> Optional[dict]:
+    loan = _find_loan(db, "loan_by_id", loan_id)
+    return _loan_to_dict(loan) if loan is not None else None
+
 @router.get("/", response_model=List[LoanOut])
-async def list_loans(db: SessionContext = Depends(get_db)):
-    result = db.execute(select(Loan).order_by(Loan.created_at.desc()))
-    loans = [
-        LoanOut.model_validate(obj, from_attributes=True)
-        for obj in result.scalars().all()
-    ]
-    return loans
+async def list_loans(
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+):
+    """List loans, newest first; ``?fields=id,amount,status`` returns only those fields."""
+    selected = _fields_param(fields)
+    window = created_range_params(created_from, created_to)
+    if shards is not None:
+        return _json_response(await _list_sharded_loans(shards, window, selected or LOAN_OUT_FIELDS))
+    if window is None:
+        result = queries.execute(db, "list_loans", fields=selected)
+    else:
+        result = queries.execute(db, "list_loans_pruned", window, fields=selected)
+    if selected is not None:
+        return _json_response([loan_row_to_dict(row) for row in result])
+    return [_loan_to_dict(obj) for obj in result.scalars().all()]
+
+@router.get("/search")
+async def search_loans_by_purpose(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=settings.SEARCH_MAX_LIMIT),
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+):
+    """Loans whose purpose contains every word of ``q`` (as prefixes), best matches first."""
+    candidates = settings.SEARCH_CANDIDATE_LIMIT
+    if shards is None:
+        return _json_response({"results": search_loans(db, q, limit, candidates)})
+    parts = await shards.gather(lambda session: search_loans(session, q, limit, candidates))
+    results = heapq.nlargest(limit, (r for part in parts.values() for r in part), key=lambda r: r["score"])
+    return _json_response({"results": results})
+
+@router.post("/batch-get")
+async def batch_get_loans(
+    request: BatchGetLoansRequest,
+    fields: Optional[str] = None,
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+):
+    """Fetch many loans by id with a single query, preserving input order."""
+    selected = _fields_param(fields)
+    ids = list(dict.fromkeys(request.ids))
+
+    if shards is None:
+        found = _fetch_loans(db, ids, selected)
+    else:
+        found = await _fetch_sharded_loans(shards, ids, selected)
+    remaining = [loan_id for loan_id in ids if loan_id not in found]
+    # Loans moved to cold storage
+    for loan_id, record in get_loan_archive().get_many(remaining).items():
+        found[loan_id] = {
+            field: serialize_value(record.get(field)) for field in selected or LOAN_OUT_FIELDS
+        }
+    return _json_response({
+        "loans": [found[loan_id] for loan_id in ids if loan_id in found],
+        "missing": [str(loan_id) for loan_id in ids if loan_id not in found],
+    })
+
+@router.post("/transitions")
+async def bulk_transition_loans(
+    request: BulkLoanTransitionRequest,
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+):
+    """Apply many status transitions at once; conflicts are reported per item."""
+    if not request.items:
+        raise HTTPException(status_code=422, detail="At least one item is required")
+    if len(request.items) > settings.LOAN_TRANSITIONS_MAX_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.LOAN_TRANSITIONS_MAX_ITEMS} transitions can be requested at once",
+        )
+    items = [(item.id, item.expected_version, item.to_status) for item in request.items]
+    if shards is None:
+        results = transition_loans(db, items, chunk_size=settings.LOAN_TRANSITION_CHUNK_SIZE)
+        db.commit()
+    else:
+        results = await _transition_sharded_loans(shards, items)
+    return {
+        "applied": sum(result["result"] == APPLIED for result in results),
+        "failed": sum(result["result"] != APPLIED for result in results),
+        "results": results,
+    }
+
+@router.post("/{loan_id}/transition")
+async def transition_loan(
+    loan_id: UUID,
+    request: LoanTransitionRequest,
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+):
+    """Move a loan to ``to_status`` if it is still at ``expected_version``."""
+    items = [(loan_id, request.expected_version, request.to_status)]
+    if shards is None:
+        [result] = transition_loans(db, items)
+    else:
+        [result] = await _transition_sharded_loans(shards, items)
+    if result["result"] == NOT_FOUND:
+        raise HTTPException(status_code=404, detail="Loan not found")
+    if result["result"] == CONFLICT:
+        raise HTTPException(status_code=409, detail=result)
+    if result["result"] == INVALID_TRANSITION:
+        raise HTTPException(status_code=422, detail=result)
+    db.commit()
+    return result
 
 @router.get("/{loan_id}", response_model=LoanOut)
-async def get_loan(loan_id: UUID, db: SessionContext = Depends(get_db)):
-    loan = db.get(Loan, loan_id)
+async def get_loan(
+    loan_id: UUID,
+    fields: Optional[str] = None,
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+):
+    selected = _fields_param(fields)
+    if shards is not None:
+        # Rows come back from a worker thread, so always project to plain columns.
+        selected = selected or LOAN_OUT_FIELDS
+        loan = await shards.find_loan(
+            loan_id, lambda session: _find_loan(session, "loan_by_id", loan_id, fields=selected)
+        )
+    else:
+        loan = _find_loan(db, "loan_by_id", loan_id, fields=selected)
     if not loan:
+        archived = get_loan_archive().get(loan_id)
+        if archived is None:
+            raise HTTPException(status_code=404, detail="Loan not found")
+        if selected is not None:
+            return _json_response({field: serialize_value(archived.get(field)) for field in selected})
+        return {field: serialize_value(archived.get(field)) for field in LOAN_OUT_FIELDS}
+    if selected is not None:
+        return _json_response(loan_row_to_dict(loan))
+    return _loan_to_dict(loan)
+
+@router.get("/{loan_id}/detail", response_model=LoanDetailOut)
+async def get_loan_detail(
+    loan_id: UUID,
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+):
+    """Return a loan with its borrower and payments in a bounded number of queries."""
+    if shards is not None:
+        loan = await shards.find_loan(loan_id, lambda session: _find_loan(session, "loan_detail", loan_id))
+    else:
+        loan = _find_loan(db, "loan_detail", loan_id)
+    if not loan:
+        raise HTTPException(status_code=404, detail="Loan not found")
+    return loan
+
+@router.get("/{loan_id}/history")
+async def get_loan_history(
+    loan_id: UUID,
+    after: Optional[UUID] = None,
+    limit: int = Query(100, ge=1, le=settings.AUDIT_HISTORY_MAX_LIMIT),
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+):
+    """Change history of a loan and its payments, oldest first.
+
+    Pass ``next_after`` as ``after`` to get the next page. With buffered
+    auditing, changes show up once the buffer has been flushed.
+    """
+    def read(session):
+        return loan_history(session, loan_id, after=after, limit=limit) or None
+
+    def find(session):
+        return _find_loan(session, "loan_by_id", loan_id, fields=("id",))
+
+    if shards is not None:
+        entries = await shards.find_loan(loan_id, read) or []
+        found = entries or after is not None or await shards.find_loan(loan_id, find)
+    else:
+        entries = read(db) or []
+        found = entries or after is not None or find(db)
+    # History outlives loans moved to cold storage
+    if not found and get_loan_archive().get(loan_id) is None:
         raise HTTPException(status_code=404, detail="Loan not found")
-    return LoanOut.model_validate(loan, from_attributes=True)
+    return _json_response({
+        "loan_id": str(loan_id),
+        "entries": entries,
+        "next_after": entries[-1]["id"] if len(entries) == limit else None,
+    })
 
 @router.post("/", response_model=LoanOut, status_code=201)
-async def create_loan(loan_data: CreateLoanRequest, db: SessionContext = Depends(get_db)):
-    loan = Loan(
-        borrower_id=loan_data.borrower_id,
+async def create_loan(
+    loan_data: CreateLoanRequest,
+    idempotency_key: Optional[str] = Header(default=None, min_length=1, max_length=255),
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+    idempotency: IdempotencyStore = Depends(get_idempotency_store),
+):
+    try:
+        borrower_id = UUID(loan_data.borrower_id)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="borrower_id must be a UUID")
+    values = dict(
+        borrower_id=borrower_id,
         amount=Decimal(str(loan_data.amount)),
         currency=loan_data.currency.upper(),
         term_months=loan_data.term_months,
         interest_rate_apr=(Decimal(str(loan_data.interest_rate_apr)) if loan_data.interest_rate_apr is not None else None),
         status="pending",
     )
-    db.add(loan)
-    db.commit()
-    db.refresh(loan)
-    return LoanOut.model_validate(loan, from_attributes=True)
+
+    shard = None
+    if shards is not None:
+        shard = shards.shard_for(values["currency"], values["borrower_id"])
+        new_id = shards.new_loan_id(shard)
+    else:
+        new_id = uuid7()
+
+    async def insert(loan_id: UUID) -> dict:
+        # created_at comes from the id, so that a second insert of the same id
+        # hits the (id, created_at) primary key.
+        values.update(id=loan_id, created_at=uuid_timestamp(loan_id))
+        if shards is not None:
+            return await shards.run(shard, lambda session: _insert_loan(session, values))
+        if settings.LOAN_WRITE_COALESCING_ENABLED:
+            loan = await get_loan_coalescer().submit(values)
+        else:
+            loan = Loan(**values)
+            db.add(loan)
+            db.commit()
+            db.refresh(loan)
+        return _loan_to_dict(loan)
+
+    async def create(loan_id: str) -> Tuple[int, dict]:
+        loan_id = UUID(loan_id)
+        try:
+            return 201, await insert(loan_id)
+        except IntegrityError:
+            # An earlier attempt with the same Idempotency-Key created it
+            if shards is not None:
+                existing = await shards.run(shard, lambda session: _existing_loan(session, loan_id))
+            else:
+                db.rollback()
+                existing = _existing_loan(db, loan_id)
+            if existing is None:
+                raise
+            return 201, existing
+
+    if idempotency_key is None:
+        status_code, body = await create(str(new_id))
+        return _json_response(body, status_code=status_code)
+    # Retries with the same key get the first response instead of a second loan.
+    try:
+        status_code, body, replayed = await idempotency.execute(
+            idempotency_key, request_hash(loan_data.dict()), create, resource_id=str(new_id)
+        )
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return _json_response(body, status_code=status_code, headers=headers)
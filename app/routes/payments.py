@@ -0,0 +1,59 @@
+import asyncio
+import io
+import tempfile
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from ..config import settings
+from ..db import SessionContext, get_db
+from ..reconciliation import FORMATS, import_payments
+from ..sharding import reject_when_sharded
+
+router = APIRouter(prefix="/payments", tags=["payments"])
+
+# Request bodies above this size are spooled to disk while they are received
+_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+_CONTENT_TYPE_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+}
+
+@router.post("/import", dependencies=[Depends(reject_when_sharded)])
+async def import_payment_file(
+    request: Request,
+    format: Optional[str] = None,
+    db: SessionContext = Depends(get_db),
+):
+    """Import a CSV or NDJSON repayment file sent as the raw request body.
+
+    The format is taken from ``?format=`` or else from the Content-Type.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    fmt = format or _CONTENT_TYPE_FORMATS.get(content_type)
+    if fmt not in FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Specify format ({', '.join(FORMATS)}) or a text/csv or application/x-ndjson body",
+        )
+
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_BYTES) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        stream = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        try:
+            return await asyncio.to_thread(
+                import_payments,
+                db,
+                stream,
+                fmt,
+                chunk_size=settings.PAYMENT_IMPORT_CHUNK_SIZE,
+                max_rejects=settings.PAYMENT_IMPORT_MAX_REJECTS,
+            )
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="File is not valid UTF-8")
+        finally:
+            stream.detach()
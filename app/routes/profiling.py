@@ -0,0 +1,55 @@
+import secrets
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from ..config import settings
+from ..profiling import collapsed_stacks, profile_store, top_functions
+
+
+def require_profiling_token(x_profiling_token: Optional[str] = Header(default=None)) -> None:
+    """Reject callers that do not present the configured profiling token."""
+    if not settings.PROFILING_TOKEN or not x_profiling_token or not secrets.compare_digest(
+        x_profiling_token, settings.PROFILING_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="Profiling access denied")
+
+
+router = APIRouter(
+    prefix="/debug/profiles",
+    tags=["profiling"],
+    dependencies=[Depends(require_profiling_token)],
+)
+
+
+def _get_profile(profile_id: int) -> Dict[str, Any]:
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@router.get("/")
+async def list_profiles() -> List[Dict[str, Any]]:
+    """List buffered request profiles, newest first."""
+    return profile_store.list()
+
+
+@router.get("/{profile_id}")
+async def get_profile(
+    profile_id: int,
+    top: int = Query(default=20, ge=1, le=500),
+    sort: str = Query(default="tottime", regex="^(tottime|cumulative)$"),
+) -> Dict[str, Any]:
+    """Return the top-N hot functions of a profile."""
+    profile = _get_profile(profile_id)
+    summary = {k: v for k, v in profile.items() if k not in ("functions", "stacks")}
+    summary["top_functions"] = top_functions(profile, limit=top, sort=sort)
+    return summary
+
+
+@router.get("/{profile_id}/collapsed", response_class=PlainTextResponse)
+async def get_profile_collapsed(profile_id: int) -> str:
+    """Return a profile's stack samples in collapsed format for flamegraph tools."""
+    return collapsed_stacks(_get_profile(profile_id))
@@ -1,23 +1,84 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy import select, func
-from typing import Dict, Any
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, Any, Optional
 
+from .. import queries
+from ..analytics import portfolio_summary
+from ..archive import get_loan_archive
+from ..config import settings
+from ..partitions import created_range_params
+from ..rollups import origination_series
+from ..sharding import ShardRouter, get_shard_router, reject_when_sharded
 from ..db import SessionContext, get_db
-from ..models import Loan
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
+# Range returned when no start is given
+DEFAULT_LOOKBACK = {
+    "day": timedelta(days=30),
+    "week": timedelta(weeks=12),
+    "month": timedelta(days=365),
+}
+
+def _loan_totals(db, window: Optional[Dict[str, datetime]]) -> Dict[str, Any]:
+    if window is None:
+        rows = queries.execute(db, "stats_totals").all()
+    else:
+        rows = queries.execute(db, "stats_totals_pruned", window).all()
+    return _merge_totals(
+        {
+            "total_count": count,
+            "total_amount": amount or 0,
+            "by_status": {getattr(status, "value", status): count},
+            "by_currency": {currency: count},
+        }
+        for status, currency, count, amount in rows
+    )
+
+def _merge_totals(parts) -> Dict[str, Any]:
+    """Combine per-group or per-shard totals; the average is recomputed from the sums."""
+    merged = {"total_count": 0, "total_amount": 0, "avg_amount": 0, "by_status": {}, "by_currency": {}}
+    for part in parts:
+        merged["total_count"] += part["total_count"]
+        merged["total_amount"] += part["total_amount"]
+        for key in ("by_status", "by_currency"):
+            for value, count in part[key].items():
+                merged[key][value] = merged[key].get(value, 0) + count
+    if merged["total_count"]:
+        merged["avg_amount"] = merged["total_amount"] / merged["total_count"]
+    return merged
+
 @router.get("/")
-async def get_stats(db: SessionContext = Depends(get_db)) -> Dict[str, Any]:
-    total_count = db.execute(select(func.count(Loan.id))).scalar_one()
-    total_amount = db.execute(select(func.coalesce(func.sum(Loan.amount), 0))).scalar_one()
-    avg_amount = db.execute(select(func.coalesce(func.avg(Loan.amount), 0))).scalar_one()
+async def get_stats(
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    include_archived: bool = True,
+    db: SessionContext = Depends(get_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+) -> Dict[str, Any]:
+    window = created_range_params(created_from, created_to)
+    if shards is None:
+        totals = _loan_totals(db, window)
+    else:
+        parts = await shards.gather(lambda session: _loan_totals(session, window))
+        totals = _merge_totals(parts.values())
 
-    by_status_rows = db.execute(select(Loan.status, func.count(Loan.id)).group_by(Loan.status)).all()
-    by_currency_rows = db.execute(select(Loan.currency, func.count(Loan.id)).group_by(Loan.currency)).all()
+    total_count = totals["total_count"]
+    total_amount = totals["total_amount"]
+    avg_amount = totals["avg_amount"]
+    by_status = totals["by_status"]
+    by_currency = totals["by_currency"]
 
-    by_status = {k: v for k, v in by_status_rows}
-    by_currency = {k: v for k, v in by_currency_rows}
+    if include_archived:
+        archived = get_loan_archive().aggregates(created_from, created_to)
+        if archived["total_loans"]:
+            total_count += archived["total_loans"]
+            total_amount += archived["total_amount"]
+            avg_amount = total_amount / total_count
+            for status, count in archived["by_status"].items():
+                by_status[status] = by_status.get(status, 0) + count
+            for currency, count in archived["by_currency"].items():
+                by_currency[currency] = by_currency.get(currency, 0) + count
 
     return {
         "total_loans": int(total_count),
@@ -26,3 +87,29 @@ async def get_stats(db: SessionContext = Depends(get_db)) -> Dict[str, Any]:
         "by_status": by_status,
         "by_currency": by_currency,
     }
+
+
+@router.get("/portfolio", dependencies=[Depends(reject_when_sharded)])
+async def get_portfolio(
+    as_of: Optional[datetime] = None, db: SessionContext = Depends(get_db)
+) -> Dict[str, Any]:
+    """Portfolio-at-risk and aging buckets grouped by currency and loan status."""
+    return portfolio_summary(db, as_of=as_of, chunk_size=settings.ANALYTICS_CHUNK_SIZE)
+
+
+@router.get("/originations", dependencies=[Depends(reject_when_sharded)])
+async def get_originations(
+    granularity: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: SessionContext = Depends(get_db),
+) -> Dict[str, Any]:
+    """Origination counts, sums and amount percentiles per day, week or month."""
+    end = end or datetime.now(timezone.utc)
+    start = start or end - DEFAULT_LOOKBACK.get(granularity, timedelta(days=30))
+    try:
+        return origination_series(
+            db, granularity, start, end, max_buckets=settings.ORIGINATION_MAX_BUCKETS
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,8 +1,12 @@
-from pydantic import BaseModel, Field, condecimal, validator
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, Field, condecimal, conlist, validator
+from typing import Optional, Dict, Any, List, Tuple
 from uuid import UUID
 from decimal import Decimal
 from datetime import datetime
+from enum import Enum
+
+from .config import settings
+from .models import Loan, LoanStatus
 
 class LoanOut(BaseModel):
     class Config:
@@ -19,9 +23,112 @@ class LoanOut(BaseModel):
     status: str
     term_months: Optional[int] = None
     interest_rate_apr: Optional[Decimal] = None
+    version: Optional[int] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+class BorrowerOut(BaseModel):
+    class Config:
+        orm_mode = True
+        from_attributes = True
+
+    id: UUID
+    name: str
+    email: str
+    phone: Optional[str] = None
+    credit_score: Optional[int] = None
+
+class PaymentOut(BaseModel):
+    class Config:
+        orm_mode = True
+        from_attributes = True
+        json_encoders = {
+            Decimal: lambda v: str(v)
+        }
+
+    id: UUID
+    amount: Decimal
+    status: str
+    due_date: datetime
+    paid_amount: Optional[Decimal] = None
+    paid_at: Optional[datetime] = None
+    transaction_reference: Optional[str] = None
+
+class BorrowerExposureOut(BaseModel):
+    class Config:
+        orm_mode = True
+        from_attributes = True
+        json_encoders = {
+            Decimal: lambda v: str(v)
+        }
+
+    borrower_id: UUID
+    outstanding_amount: Decimal = Decimal("0")
+    active_loan_count: int = 0
+    worst_payment_status: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+class LoanDetailOut(LoanOut):
+    borrower_id: UUID
+    purpose: Optional[str] = None
+    disbursement_date: Optional[datetime] = None
+    due_date: Optional[datetime] = None
+    borrower: Optional[BorrowerOut] = None
+    payments: List[PaymentOut] = []
+
+# Columns backing LoanOut, for reads that bypass ORM instances and pydantic
+LOAN_OUT_FIELDS = (
+    "id",
+    "borrower_id",
+    "amount",
+    "currency",
+    "status",
+    "term_months",
+    "interest_rate_apr",
+    "version",
+    "created_at",
+    "updated_at",
+)
+LOAN_OUT_COLUMNS = tuple(getattr(Loan, name) for name in LOAN_OUT_FIELDS)
+
+
+def parse_fields(value: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Parse a ``?fields=`` sparse fieldset into LoanOut field names.
+
+    ``id`` is always included. The result is in LOAN_OUT_FIELDS order, so
+    equivalent requests share one projected statement.
+
+    Raises:
+        ValueError: If a field is not a LoanOut field.
+    """
+    if value is None:
+        return None
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested.difference(LOAN_OUT_FIELDS)
+    if unknown:
+        raise ValueError(
+            f"Unknown fields: {', '.join(sorted(unknown))}; "
+            f"available fields: {', '.join(LOAN_OUT_FIELDS)}"
+        )
+    requested.add("id")
+    return tuple(name for name in LOAN_OUT_FIELDS if name in requested)
+
+
+def serialize_value(value: Any) -> Any:
+    """Convert a column value to the JSON representation used by LoanOut."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def loan_row_to_dict(row) -> Dict[str, Any]:
+    """Serialize a row selected with LOAN_OUT_COLUMNS without building models."""
+    return {key: serialize_value(value) for key, value in row._mapping.items()}
+
 class CreateLoanRequest(BaseModel):
     borrower_id: str = Field(..., min_length=1)
     amount: condecimal(gt=0, le=50000, max_digits=12, decimal_places=2)
@@ -32,3 +139,41 @@ class CreateLoanRequest(BaseModel):
     @validator("currency")
     def currency_upper(cls, v: str) -> str:
         return v.upper()
+
+
+class CreateJobRequest(BaseModel):
+    type: str = Field(..., min_length=1, max_length=64)
+    params: Dict[str, Any] = Field(default_factory=dict)
+    max_attempts: Optional[int] = Field(default=None, ge=1, le=10)
+
+class JobOut(BaseModel):
+    class Config:
+        orm_mode = True
+        from_attributes = True
+
+    id: UUID
+    type: str
+    status: str
+    params: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class BatchGetLoansRequest(BaseModel):
+    # The length is checked before any id is parsed
+    ids: conlist(UUID, min_items=1, max_items=settings.LOANS_BATCH_GET_MAX_IDS)
+
+
+class LoanTransitionRequest(BaseModel):
+    to_status: LoanStatus
+    expected_version: int = Field(..., ge=1)
+
+class BulkLoanTransitionItem(LoanTransitionRequest):
+    id: UUID
+
+class BulkLoanTransitionRequest(BaseModel):
+    items: List[BulkLoanTransitionItem]
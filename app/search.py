@@ -0,0 +1,172 @@
+"""Ranked text search over borrowers and loan purposes.
+
+Borrowers are matched by substring of ``name``, ``email`` or ``phone`` and
+loans by the words of ``purpose`` (each query word as a prefix).
+
+On PostgreSQL, borrower lookups use ``ILIKE`` served by ``pg_trgm`` GIN
+indexes and are ranked by trigram similarity; loan lookups match
+``to_tsvector('simple', purpose)`` through a GIN expression index and are
+ranked with ``ts_rank``. SQLite (local runs and tests) uses FTS5 tables kept
+in sync by triggers instead: a trigram-tokenized ``borrowers_fts`` and a
+word-tokenized ``loans_fts``, both ranked by ``bm25``.
+
+On PostgreSQL at most ``candidates`` matches, the most similar ones (or the
+best ``ts_rank`` ones for loans), are kept for the final ranking, so a very
+common query returns its best matches rather than whichever the index
+returned first.
+"""
+import re
+from typing import Any, Dict, List
+
+from sqlalchemy import DDL, event, func, literal_column, select, text
+from sqlalchemy.orm import Session
+
+from .db import Base
+from .models import Borrower, Loan
+from .schemas import serialize_value
+
+BORROWER_FIELDS = ("id", "name", "email", "phone")
+LOAN_FIELDS = ("id", "borrower_id", "amount", "currency", "status", "purpose", "created_at")
+
+# Trigrams need at least three characters to narrow anything down
+MIN_QUERY_LENGTH = 3
+
+_SQLITE_FTS = (
+    # External-content tables index the rows by their implicit rowid.
+    "CREATE VIRTUAL TABLE IF NOT EXISTS borrowers_fts USING fts5("
+    "name, email, phone, content='borrowers', content_rowid='rowid', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS borrowers_fts_insert AFTER INSERT ON borrowers BEGIN "
+    "INSERT INTO borrowers_fts (rowid, name, email, phone) VALUES (new.rowid, new.name, new.email, new.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS borrowers_fts_delete AFTER DELETE ON borrowers BEGIN "
+    "INSERT INTO borrowers_fts (borrowers_fts, rowid, name, email, phone) "
+    "VALUES ('delete', old.rowid, old.name, old.email, old.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS borrowers_fts_update AFTER UPDATE ON borrowers BEGIN "
+    "INSERT INTO borrowers_fts (borrowers_fts, rowid, name, email, phone) "
+    "VALUES ('delete', old.rowid, old.name, old.email, old.phone); "
+    "INSERT INTO borrowers_fts (rowid, name, email, phone) VALUES (new.rowid, new.name, new.email, new.phone); END",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS loans_fts USING fts5("
+    "purpose, content='loans', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS loans_fts_insert AFTER INSERT ON loans BEGIN "
+    "INSERT INTO loans_fts (rowid, purpose) VALUES (new.rowid, new.purpose); END",
+    "CREATE TRIGGER IF NOT EXISTS loans_fts_delete AFTER DELETE ON loans BEGIN "
+    "INSERT INTO loans_fts (loans_fts, rowid, purpose) VALUES ('delete', old.rowid, old.purpose); END",
+    "CREATE TRIGGER IF NOT EXISTS loans_fts_update AFTER UPDATE OF purpose ON loans BEGIN "
+    "INSERT INTO loans_fts (loans_fts, rowid, purpose) VALUES ('delete', old.rowid, old.purpose); "
+    "INSERT INTO loans_fts (rowid, purpose) VALUES (new.rowid, new.purpose); END",
+)
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+for _statement in _SQLITE_FTS:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+for _table in ("borrowers_fts", "loans_fts"):
+    event.listen(
+        Base.metadata, "before_drop", DDL(f"DROP TABLE IF EXISTS {_table}").execute_if(dialect="sqlite")
+    )
+
+# Must match the ix_loans_purpose_fts expression for the index to be used
+_PURPOSE_TSVECTOR = func.to_tsvector(literal_column("'simple'"), Loan.purpose)
+
+
+def _words(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _rows(rows, fields) -> List[Dict[str, Any]]:
+    return [
+        {**{field: serialize_value(getattr(row, field)) for field in fields}, "score": float(row.score)}
+        for row in rows
+    ]
+
+
+def search_borrowers(db: Session, query: str, limit: int = 20, candidates: int = 1000) -> List[Dict[str, Any]]:
+    """Borrowers whose name, email or phone contains ``query``, best matches first.
+
+    Returns:
+        List[dict]: ``BORROWER_FIELDS`` and a ``score`` (higher is better).
+    """
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+
+    if db.get_bind().dialect.name == "sqlite":
+        # A quoted string matches as a phrase of consecutive trigrams
+        rows = db.execute(
+            text(
+                "SELECT b.id, b.name, b.email, b.phone, -bm25(borrowers_fts) AS score "
+                "FROM borrowers_fts JOIN borrowers b ON b.rowid = borrowers_fts.rowid "
+                "WHERE borrowers_fts MATCH :match ORDER BY bm25(borrowers_fts) LIMIT :limit"
+            ).columns(id=Borrower.id.type),
+            {"match": '"' + query.replace('"', '""') + '"', "limit": limit},
+        )
+        return _rows(rows, BORROWER_FIELDS)
+
+    pattern = f"%{_escape_like(query)}%"
+    score = func.greatest(
+        func.similarity(Borrower.name, query),
+        func.similarity(Borrower.email, query),
+        func.similarity(func.coalesce(Borrower.phone, ""), query),
+    ).label("score")
+    matches = (
+        select(Borrower.id, Borrower.name, Borrower.email, Borrower.phone, score)
+        .where(
+            Borrower.name.ilike(pattern)
+            | Borrower.email.ilike(pattern)
+            | Borrower.phone.ilike(pattern)
+        )
+        # Keep the most similar candidates, not the first ones found
+        .order_by(score.desc())
+        .limit(candidates)
+        .subquery()
+    )
+    rows = db.execute(select(matches).order_by(matches.c.score.desc()).limit(limit))
+    return _rows(rows, BORROWER_FIELDS)
+
+
+def search_loans(db: Session, query: str, limit: int = 20, candidates: int = 1000) -> List[Dict[str, Any]]:
+    """Loans whose purpose contains every word of ``query`` (as prefixes), best matches first.
+
+    Returns:
+        List[dict]: ``LOAN_FIELDS`` and a ``score`` (higher is better).
+    """
+    words = _words(query)
+    if not words:
+        return []
+
+    if db.get_bind().dialect.name == "sqlite":
+        rows = db.execute(
+            text(
+                "SELECT l.id, l.borrower_id, l.amount, l.currency, l.status, l.purpose, l.created_at, "
+                "-bm25(loans_fts) AS score "
+                "FROM loans_fts JOIN loans l ON l.rowid = loans_fts.rowid "
+                "WHERE loans_fts MATCH :match ORDER BY bm25(loans_fts) LIMIT :limit"
+            ).columns(
+                id=Loan.id.type,
+                borrower_id=Loan.borrower_id.type,
+                amount=Loan.amount.type,
+                status=Loan.status.type,
+                created_at=Loan.created_at.type,
+            ),
+            {"match": " ".join(f'"{word}"*' for word in words), "limit": limit},
+        )
+        return _rows(rows, LOAN_FIELDS)
+
+    tsquery = func.to_tsquery(literal_column("'simple'"), " & ".join(f"{word}:*" for word in words))
+    score = func.ts_rank(_PURPOSE_TSVECTOR, tsquery).label("score")
+    matches = (
+        select(*(getattr(Loan, field) for field in LOAN_FIELDS), score)
+        .where(_PURPOSE_TSVECTOR.op("@@")(tsquery))
+        # Keep the best ranked candidates, not the first ones found
+        .order_by(score.desc())
+        .limit(candidates)
+        .subquery()
+    )
+    rows = db.execute(select(matches).order_by(matches.c.score.desc()).limit(limit))
+    return _rows(rows, LOAN_FIELDS)
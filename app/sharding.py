@@ -0,0 +1,169 @@
+"""Horizontal sharding of loans across several databases.
+
+``DATABASE_SHARDS`` maps shard numbers to database URLs. A new loan is placed
+on the shard ``SHARD_CURRENCIES`` assigns to its currency, or else on a shard
+chosen by a stable hash of its borrower id. The shard number is stored in the
+``rand_a`` bits of the loan's UUIDv7 id (:func:`app.partitions.uuid7`), so a
+request for one loan goes straight to its shard. Ids without a valid tag
+(loans created before sharding) are looked up on every shard in parallel.
+
+Queries spanning all loans (``list_loans``, ``get_stats``) are scattered to
+every shard concurrently, each in a worker thread with its own session, and
+the partial results are merged by the caller.
+
+Status transitions go to the loan's shard like reads, a borrower's exposure is
+summed over the shards, and decisioning and archiving run on each shard in
+turn. Endpoints that read loans and payments together or
+cache aggregates of them (payment import, portfolio analytics, origination
+rollups) only work against one database and answer 501 while sharding is
+enabled, see :func:`reject_when_sharded`.
+
+Borrowers are reference data: a borrower must exist on every shard holding
+one of their loans. Jobs and other tables stay on the default database.
+"""
+import asyncio
+import logging
+import zlib
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, TypeVar
+from uuid import UUID
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from .config import settings
+from .db import driver_connect_args
+from .partitions import uuid7, uuid_tag
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def create_shard_engine(url: str) -> Engine:
+    """Engine for one shard, pooled like the default engine in app.db."""
+    if make_url(url).get_backend_name() == "sqlite":
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        query_cache_size=settings.SQLALCHEMY_QUERY_CACHE_SIZE,
+        connect_args=driver_connect_args(url),
+    )
+
+
+class ShardRouter:
+    """Routes loan reads and writes to shards and runs scatter-gather queries.
+
+    Args:
+        session_factories: Shard number -> callable returning a new session.
+        currencies: Currency code -> shard number.
+    """
+
+    def __init__(
+        self,
+        session_factories: Mapping[int, Callable[[], Session]],
+        currencies: Optional[Mapping[str, int]] = None,
+    ) -> None:
+        if not session_factories:
+            raise ValueError("At least one shard is required")
+        self.session_factories = dict(session_factories)
+        self.shards: List[int] = sorted(self.session_factories)
+        self.currencies = {code.upper(): shard for code, shard in (currencies or {}).items()}
+        unknown = set(self.currencies.values()).difference(self.shards)
+        if unknown:
+            raise ValueError(f"SHARD_CURRENCIES refers to unknown shards: {sorted(unknown)}")
+
+    def shard_for(self, currency: str, borrower_id: Any) -> int:
+        """Shard a new loan of ``borrower_id`` in ``currency`` is placed on."""
+        shard = self.currencies.get(currency.upper())
+        if shard is not None:
+            return shard
+        return self.shards[zlib.crc32(str(borrower_id).encode()) % len(self.shards)]
+
+    def new_loan_id(self, shard: int) -> UUID:
+        return uuid7(tag=shard)
+
+    def shard_for_loan(self, loan_id: UUID) -> Optional[int]:
+        """Shard recorded in ``loan_id``, or None if it carries no known shard."""
+        tag = uuid_tag(loan_id)
+        return tag if tag in self.session_factories else None
+
+    def _call(self, shard: int, fn: Callable[[Session], T]) -> T:
+        session = self.session_factories[shard]()
+        try:
+            result = fn(session)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    async def run(self, shard: int, fn: Callable[[Session], T]) -> T:
+        """Run ``fn(session)`` in a transaction on ``shard`` in a worker thread."""
+        return await asyncio.to_thread(self._call, shard, fn)
+
+    async def gather(
+        self, fn: Callable[[Session], T], shards: Optional[Sequence[int]] = None
+    ) -> Dict[int, T]:
+        """Run ``fn`` on ``shards`` (default: all) concurrently.
+
+        Returns:
+            Dict[int, T]: Result per shard.
+        """
+        shards = self.shards if shards is None else list(shards)
+        results = await asyncio.gather(*(self.run(shard, fn) for shard in shards))
+        return dict(zip(shards, results))
+
+    async def find_loan(self, loan_id: UUID, fn: Callable[[Session], Optional[T]]) -> Optional[T]:
+        """Run the lookup ``fn`` on the loan's shard, or on all shards for untagged ids.
+
+        Returns:
+            The first non-None result, or None.
+        """
+        shard = self.shard_for_loan(loan_id)
+        if shard is not None:
+            found = await self.run(shard, fn)
+            if found is not None:
+                return found
+        others = [s for s in self.shards if s != shard]
+        for result in (await self.gather(fn, others)).values():
+            if result is not None:
+                return result
+        return None
+
+
+_router: Optional[ShardRouter] = None
+
+
+def get_shard_router() -> Optional[ShardRouter]:
+    """Return the process-wide shard router, or None when sharding is not configured.
+
+    Also used as a FastAPI dependency, so tests can override it.
+    """
+    global _router
+    if _router is None and settings.DATABASE_SHARDS:
+        _router = ShardRouter(
+            {
+                shard: sessionmaker(bind=create_shard_engine(url), expire_on_commit=False)
+                for shard, url in settings.DATABASE_SHARDS.items()
+            },
+            settings.SHARD_CURRENCIES,
+        )
+        logger.info(f"Sharding loans across {len(_router.shards)} databases")
+    return _router
+
+
+def reject_when_sharded(shards: Optional[ShardRouter] = Depends(get_shard_router)) -> None:
+    """FastAPI dependency for endpoints that only see the default database."""
+    if shards is not None:
+        raise HTTPException(status_code=501, detail="Not available while loans are sharded")
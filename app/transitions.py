@@ -0,0 +1,182 @@
+"""Loan status transitions with optimistic concurrency control.
+
+Every loan carries a ``version`` that is incremented on each update (it is
+the mapper's ``version_id_col``, so ORM flushes check it too). A transition
+names the version the caller last saw; it is applied only if the loan still
+has that version, and is reported as a conflict otherwise. No row locks are
+taken, so concurrent approval batches never wait on each other.
+
+:func:`transition_loans` reads the current state of all requested loans with
+one query, validates each item against :data:`LOAN_TRANSITIONS`, and applies
+the valid ones with a single conditional ``UPDATE ... WHERE (id, version,
+status) IN (...)`` per chunk. Items the ``UPDATE`` did not match were changed
+concurrently between the read and the write and are reported as conflicts.
+"""
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import case, func, literal, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from .audit import UPDATE, audit_entry, record_changes
+from .exposure import refresh_borrower_exposure
+from .metrics import LOAN_TRANSITIONS_TOTAL
+from .models import Loan, LoanStatus
+from .outbox import loan_status_changed_event, record_events
+from .rollups import invalidate_loan_buckets
+
+logger = logging.getLogger(__name__)
+
+# Legal next statuses of each status
+LOAN_TRANSITIONS: Dict[LoanStatus, Tuple[LoanStatus, ...]] = {
+    LoanStatus.PENDING: (LoanStatus.APPROVED, LoanStatus.REJECTED),
+    LoanStatus.APPROVED: (LoanStatus.DISBURSED, LoanStatus.REJECTED),
+    LoanStatus.DISBURSED: (LoanStatus.REPAID, LoanStatus.DEFAULTED),
+    LoanStatus.DEFAULTED: (LoanStatus.REPAID,),
+    LoanStatus.REPAID: (),
+    LoanStatus.REJECTED: (),
+}
+
+# Outcomes reported per item
+APPLIED = "applied"
+CONFLICT = "conflict"
+NOT_FOUND = "not_found"
+INVALID_TRANSITION = "invalid_transition"
+
+
+def is_allowed(from_status: LoanStatus, to_status: LoanStatus) -> bool:
+    return to_status in LOAN_TRANSITIONS[LoanStatus(from_status)]
+
+
+def _result(loan_id: UUID, outcome: str, **values: Any) -> Dict[str, Any]:
+    result = {"id": str(loan_id), "result": outcome}
+    for key, value in values.items():
+        result[key] = value.value if isinstance(value, LoanStatus) else value
+    return result
+
+
+def _apply(db: Session, items: Sequence[Tuple[Any, int, LoanStatus]]) -> Dict[UUID, Any]:
+    """Run the conditional UPDATE for ``(row, expected_version, to_status)`` items.
+
+    Returns:
+        dict: Loan id -> ``(borrower_id, new_version)`` of the rows updated.
+    """
+    status_type = Loan.__table__.c.status.type
+    new_status = case(
+        *((Loan.id == row.id, literal(to_status, status_type)) for row, _, to_status in items),
+        else_=Loan.status,
+    )
+    created = [row.created_at for row, _, _ in items]
+    stmt = (
+        update(Loan)
+        .where(
+            tuple_(Loan.id, Loan.version, Loan.status).in_(
+                [(row.id, version, row.status) for row, version, _ in items]
+            ),
+            # Lets PostgreSQL prune partitions
+            Loan.created_at.between(min(created), max(created)),
+        )
+        .values(status=new_status, version=Loan.version + 1, updated_at=func.now())
+        .returning(Loan.id, Loan.borrower_id, Loan.version)
+        .execution_options(synchronize_session=False)
+    )
+    return {row.id: (row.borrower_id, row.version) for row in db.execute(stmt)}
+
+
+def transition_loans(
+    db: Session,
+    items: Iterable[Tuple[UUID, int, LoanStatus]],
+    chunk_size: int = 500,
+) -> List[Dict[str, Any]]:
+    """Apply ``(loan_id, expected_version, to_status)`` transitions in bulk.
+
+    Applied transitions update borrower exposure, drop the cached origination
+    rollups of the loans, and record ``loan.status_changed`` outbox events and
+    audit entries in the same transaction. The caller commits.
+
+    Args:
+        db: SQLAlchemy session.
+        items: Transitions to apply; a loan may appear only once.
+        chunk_size: Maximum number of loans per ``UPDATE`` statement.
+
+    Returns:
+        List[Dict[str, Any]]: One result per item, in input order, with
+        ``result`` one of ``applied``, ``conflict``, ``not_found`` or
+        ``invalid_transition``, and the loan's current ``status`` and
+        ``version`` where known.
+    """
+    items = [(loan_id, version, LoanStatus(to_status)) for loan_id, version, to_status in items]
+    ids = list(dict.fromkeys(loan_id for loan_id, _, _ in items))
+    current = {}
+    for start in range(0, len(ids), chunk_size):
+        rows = db.execute(
+            select(Loan.id, Loan.status, Loan.version, Loan.created_at, Loan.borrower_id).where(
+                Loan.id.in_(ids[start : start + chunk_size])
+            )
+        )
+        current.update((row.id, row) for row in rows)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    pending: List[Tuple[int, Any, int, LoanStatus]] = []
+    seen = set()
+    for index, (loan_id, version, to_status) in enumerate(items):
+        row = current.get(loan_id)
+        if row is None:
+            results[index] = _result(loan_id, NOT_FOUND)
+        elif loan_id in seen:
+            results[index] = _result(
+                loan_id, CONFLICT, status=row.status, version=row.version,
+                detail="Loan appears more than once in the request",
+            )
+        elif row.version != version:
+            results[index] = _result(
+                loan_id, CONFLICT, status=row.status, version=row.version,
+                detail=f"Expected version {version}, loan is at version {row.version}",
+            )
+        elif not is_allowed(row.status, to_status):
+            results[index] = _result(
+                loan_id, INVALID_TRANSITION, status=row.status, version=row.version,
+                detail=f"Cannot move a {row.status.value} loan to {to_status.value}",
+            )
+        else:
+            pending.append((index, row, version, to_status))
+        seen.add(loan_id)
+
+    events = []
+    changes = []
+    borrower_ids = set()
+    created_ats = []
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start : start + chunk_size]
+        updated = _apply(db, [(row, version, to_status) for _, row, version, to_status in chunk])
+        for index, row, version, to_status in chunk:
+            if row.id in updated:
+                borrower_id, new_version = updated[row.id]
+                borrower_ids.add(borrower_id)
+                created_ats.append(row.created_at)
+                events.append(loan_status_changed_event(row.id, row.status, to_status))
+                changes.append(
+                    audit_entry(
+                        "loan", row.id, row.id, UPDATE,
+                        {"status": (row.status, to_status), "version": (version, new_version)},
+                    )
+                )
+                results[index] = _result(
+                    row.id, APPLIED, from_status=row.status, status=to_status, version=new_version
+                )
+            else:
+                results[index] = _result(
+                    row.id, CONFLICT, detail="Loan was modified concurrently"
+                )
+
+    if events:
+        connection = db.connection()
+        refresh_borrower_exposure(connection, borrower_ids)
+        invalidate_loan_buckets(connection, created_ats)
+        record_events(connection, events)
+        record_changes(db, changes)
+
+    for result in results:
+        LOAN_TRANSITIONS_TOTAL.labels(result=result["result"]).inc()
+    return results
@@ -0,0 +1,26 @@
+"""Move repaid and rejected loans into cold-storage archive segments.
+
+Usage:
+    python scripts/archive_loans.py --chunk-size 10000 --min-age-days 90
+"""
+import argparse
+import time
+from datetime import timedelta
+
+from app.archive import archive_loans
+from app.config import settings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunk-size", type=int, default=settings.ARCHIVE_CHUNK_SIZE)
+    parser.add_argument("--min-age-days", type=int, default=settings.ARCHIVE_MIN_AGE_DAYS)
+    parser.add_argument("--directory", default=settings.ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    archived = archive_loans(
+        directory=args.directory,
+        chunk_size=args.chunk_size,
+        min_age=timedelta(days=args.min_age_days),
+    )
+    print(f"Archived {archived} loans in {time.perf_counter() - start:.2f}s")
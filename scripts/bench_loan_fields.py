@@ -0,0 +1,59 @@
+"""Compare payload size and latency of full and sparse loan listings.
+
+Usage:
+    python scripts/bench_loan_fields.py --fields id,amount,status --iterations 50
+
+Runs the ``list_loans`` query against the configured database
+(``DATABASE_URL``/settings) in both shapes and serializes the rows the way the
+endpoint does: full ORM instances with every LoanOut field, and the
+column-level projection used for ``?fields=``.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from app import queries
+from app.db import SessionFactory
+from app.schemas import LOAN_OUT_FIELDS, loan_row_to_dict, parse_fields, serialize_value
+
+
+def full_shape(db) -> bytes:
+    loans = queries.execute(db, "list_loans").scalars().all()
+    body = [{field: serialize_value(getattr(loan, field)) for field in LOAN_OUT_FIELDS} for loan in loans]
+    return json.dumps(body, separators=(",", ":")).encode()
+
+
+def sparse_shape(db, fields) -> bytes:
+    rows = queries.execute(db, "list_loans", fields=fields)
+    return json.dumps([loan_row_to_dict(row) for row in rows], separators=(",", ":")).encode()
+
+
+def measure(render, iterations: int):
+    timings = []
+    size = 0
+    for _ in range(iterations):
+        db = SessionFactory()
+        try:
+            start = time.perf_counter()
+            size = len(render(db))
+            timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            db.close()
+    timings.sort()
+    return size, statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fields", default="id,amount,status")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    fields = parse_fields(args.fields)
+    results = {
+        "full": measure(full_shape, args.iterations),
+        f"fields={','.join(fields)}": measure(lambda db: sparse_shape(db, fields), args.iterations),
+    }
+    for shape, (size, p50, p95) in results.items():
+        print(f"{shape:40} {size / 1024:10.1f} KiB  p50 {p50:8.2f} ms  p95 {p95:8.2f} ms")
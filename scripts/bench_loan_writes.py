@@ -0,0 +1,93 @@
+"""Benchmark loan inserts: per-request commits vs. the write coalescer.
+
+Usage:
+    python scripts/bench_loan_writes.py --requests 2000 --concurrency 64
+
+Both modes issue the same number of concurrent create requests against the
+configured database (``DATABASE_URL``/settings) and report inserts per second.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from decimal import Decimal
+
+from app.batching import LoanWriteCoalescer
+from app.db import SessionFactory, init_db
+from app.models import Borrower, Loan
+
+
+def _ensure_borrower() -> uuid.UUID:
+    session = SessionFactory()
+    try:
+        borrower = Borrower(name="Bench Borrower", email=f"bench-{uuid.uuid4()}@example.com")
+        session.add(borrower)
+        session.commit()
+        return borrower.id
+    finally:
+        session.close()
+
+
+def _loan_values(borrower_id: uuid.UUID) -> dict:
+    return dict(
+        borrower_id=borrower_id,
+        amount=Decimal("1000.00"),
+        currency="KES",
+        term_months=6,
+        interest_rate_apr=Decimal("20.00"),
+        status="pending",
+    )
+
+
+def _insert_one(values: dict) -> Loan:
+    session = SessionFactory()
+    try:
+        loan = Loan(**values)
+        session.add(loan)
+        session.commit()
+        session.refresh(loan)
+        return loan
+    finally:
+        session.close()
+
+
+async def _run(submit, total: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            await submit()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(total: int, concurrency: int, batch_size: int, wait_ms: float) -> None:
+    init_db()
+    borrower_id = _ensure_borrower()
+    loop = asyncio.get_running_loop()
+
+    per_request = await _run(
+        lambda: loop.run_in_executor(None, _insert_one, _loan_values(borrower_id)),
+        total,
+        concurrency,
+    )
+    coalescer = LoanWriteCoalescer(max_batch_size=batch_size, max_wait_ms=wait_ms)
+    coalesced = await _run(
+        lambda: coalescer.submit(_loan_values(borrower_id)), total, concurrency
+    )
+
+    print(f"requests={total} concurrency={concurrency} batch_size={batch_size} wait_ms={wait_ms}")
+    print(f"per-request commit: {per_request:10.1f} inserts/s")
+    print(f"coalesced commit:   {coalesced:10.1f} inserts/s ({coalesced / per_request:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.batch_size, args.wait_ms))
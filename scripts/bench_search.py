@@ -0,0 +1,47 @@
+"""Measure borrower and loan purpose search latency.
+
+Usage:
+    python scripts/bench_search.py --borrower-query wanj --loan-query "school fees" --iterations 50
+
+Runs app.search against the configured database (``DATABASE_URL``/settings)
+with the same limits as the endpoints. On PostgreSQL, run ``EXPLAIN ANALYZE``
+on the logged statements to check the trigram and full-text indexes are used.
+"""
+import argparse
+import statistics
+import time
+
+from app.config import settings
+from app.db import SessionFactory
+from app.search import search_borrowers, search_loans
+
+
+def measure(search, query: str, limit: int, iterations: int):
+    timings = []
+    found = 0
+    for _ in range(iterations):
+        db = SessionFactory()
+        try:
+            start = time.perf_counter()
+            found = len(search(db, query, limit, settings.SEARCH_CANDIDATE_LIMIT))
+            timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            db.close()
+    timings.sort()
+    return found, statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--borrower-query", default="wanj")
+    parser.add_argument("--loan-query", default="school")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    results = {
+        f"borrowers q={args.borrower_query!r}": measure(search_borrowers, args.borrower_query, args.limit, args.iterations),
+        f"loans q={args.loan_query!r}": measure(search_loans, args.loan_query, args.limit, args.iterations),
+    }
+    for name, (found, p50, p95) in results.items():
+        print(f"{name:40} {found:5} results  p50 {p50:8.2f} ms  p95 {p95:8.2f} ms")
@@ -0,0 +1,19 @@
+"""Create the monthly loans, payments and audit_log partitions for the coming months.
+
+Run daily (e.g. from cron) so partitions always exist before rows arrive:
+    python scripts/create_partitions.py --months-ahead 3
+"""
+import argparse
+
+from app.config import settings
+from app.db import engine
+from app.partitions import ensure_partitions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--months-ahead", type=int, default=settings.PARTITION_MONTHS_AHEAD)
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        created = ensure_partitions(connection, months_ahead=args.months_ahead)
+    print(f"Created {len(created)} partitions" + (f": {', '.join(created)}" if created else ""))
@@ -0,0 +1,33 @@
+"""Approve or reject pending loans with the credit scorecard.
+
+Usage:
+    python scripts/decide_loans.py
+    python scripts/decide_loans.py --workers 4 --chunk-size 20000 --limit 100000
+
+Run it from cron for periodic decisioning, or submit the
+``decide_pending_loans`` job through ``POST /api/jobs``.
+"""
+import argparse
+import json
+
+from app.config import settings
+from app.decisioning import decide_all_pending_loans
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunk-size", type=int, default=settings.DECISIONING_CHUNK_SIZE)
+    parser.add_argument(
+        "--workers", type=int, default=settings.DECISIONING_WORKERS,
+        help="Scoring processes; 0 scores in this process",
+    )
+    parser.add_argument("--approve-score", type=int, default=settings.DECISIONING_APPROVE_SCORE)
+    parser.add_argument("--limit", type=int, help="Stop after this many loans")
+    args = parser.parse_args()
+
+    report = decide_all_pending_loans(
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        approve_score=args.approve_score,
+        limit=args.limit,
+    )
+    print(json.dumps(report, indent=2))
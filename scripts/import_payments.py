@@ -0,0 +1,33 @@
+"""Import a CSV or NDJSON bank repayment file into payments.
+
+Usage:
+    python scripts/import_payments.py repayments-2026-10-19.csv
+    python scripts/import_payments.py repayments.ndjson --chunk-size 10000
+"""
+import argparse
+import json
+
+from app.config import settings
+from app.db import SessionFactory
+from app.reconciliation import FORMATS, import_payments
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument(
+        "--format", choices=FORMATS, help="File format; defaults to the file extension"
+    )
+    parser.add_argument("--chunk-size", type=int, default=settings.PAYMENT_IMPORT_CHUNK_SIZE)
+    parser.add_argument("--max-rejects", type=int, default=settings.PAYMENT_IMPORT_MAX_REJECTS)
+    args = parser.parse_args()
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    session = SessionFactory()
+    try:
+        with open(args.path, encoding="utf-8-sig", newline="") as f:
+            report = import_payments(
+                session, f, fmt, chunk_size=args.chunk_size, max_rejects=args.max_rejects
+            )
+    finally:
+        session.close()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,19 @@
+"""Recompute the borrower_exposure table for all borrowers.
+
+Usage:
+    python scripts/rebuild_exposure.py --chunk-size 1000 --workers 4
+"""
+import argparse
+import time
+
+from app.exposure import rebuild_all
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    written = rebuild_all(chunk_size=args.chunk_size, workers=args.workers)
+    print(f"Rebuilt exposure for {written} borrowers in {time.perf_counter() - start:.2f}s")
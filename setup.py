@@ -17,6 +17,7 @@ setup(
         "test": [
             "pytest>=6.0.0",
             "pytest-cov>=2.0.0",
+            "pytest-xdist>=3.0.0",
             "httpx>=0.19.0",
         ],
     },
@@ -1,4 +1,23 @@
-"""Test configuration and fixtures."""
+"""Test configuration and fixtures.
+
+Database fixtures: every pytest(-xdist) worker process gets its own database
+whose schema is created once per session, and each test runs inside a
+transaction that is rolled back afterwards. Sessions from ``session_factory``
+join that transaction and their ``commit()`` only releases a SAVEPOINT, so
+tests see each other's data neither within a worker nor across workers.
+
+By default the database is an in-memory SQLite one. Set ``TEST_DATABASE_URL``
+to a PostgreSQL server URL to clone ``<database>_<worker>`` from the template
+database ``TEST_DATABASE_TEMPLATE`` (prepared once, e.g. with ``alembic
+upgrade head``), or to create the schema from the models if no template is
+given. Run in parallel with ``pytest -n auto``.
+
+Every request made through a ``TestClient`` may execute at most
+``DEFAULT_QUERY_BUDGET`` statements, so N+1 query regressions fail the test;
+a test with a larger need says so with ``@pytest.mark.query_budget(n)``.
+"""
+import os
+from decimal import Decimal
 from unittest.mock import MagicMock
 
 # Mock the prometheus_client for tests
@@ -8,9 +27,189 @@ from types import ModuleType
 # Create a mock module
 mock_prometheus = ModuleType('prometheus_client')
 mock_prometheus.Counter = MagicMock()
+mock_prometheus.Gauge = MagicMock()
 mock_prometheus.Histogram = MagicMock()
 mock_prometheus.generate_latest = MagicMock(return_value=b'')
 mock_prometheus.CONTENT_TYPE_LATEST = 'text/plain'
 
 # Add to sys.modules
 sys.modules['prometheus_client'] = mock_prometheus
+
+# The models use the PostgreSQL UUID type; render it as CHAR(32) so the
+# SQLite databases used by the tests can create the schema.
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
+
+
+@compiles(UUID, "sqlite")
+def compile_uuid_sqlite(type_, compiler, **kw):
+    return "CHAR(32)"
+
+
+# SQLite's CURRENT_TIMESTAMP has no fractional seconds, unlike the format
+# SQLAlchemy binds datetimes with, so server-generated created_at values (part
+# of the loans and payments primary keys) would not match in UPDATE/DELETE.
+from sqlalchemy.sql import functions
+
+
+@compiles(functions.now, "sqlite")
+def compile_now_sqlite(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base, get_db
+from app.models import Borrower, Loan, LoanStatus
+
+WORKER = os.getenv("PYTEST_XDIST_WORKER", "main")
+
+
+def _sqlite_engine():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+
+    # pysqlite's own transaction handling breaks SAVEPOINTs; let SQLAlchemy
+    # emit BEGIN itself.
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    """Engine of this worker's test database, with the schema created once."""
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        engine = _sqlite_engine()
+        yield engine
+        engine.dispose()
+        return
+
+    url = make_url(url)
+    name = f"{url.database}_{WORKER}"
+    template = os.getenv("TEST_DATABASE_TEMPLATE")
+    admin = create_engine(url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as connection:
+        connection.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+        if template:
+            connection.execute(text(f'CREATE DATABASE "{name}" TEMPLATE "{template}"'))
+        else:
+            connection.execute(text(f'CREATE DATABASE "{name}"'))
+    engine = create_engine(url.set(database=name))
+    if not template:
+        Base.metadata.create_all(engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+        admin.dispose()
+
+
+@pytest.fixture
+def db_connection(db_engine):
+    """Connection holding the test's transaction, rolled back at teardown."""
+    connection = db_engine.connect()
+    transaction = connection.begin()
+    try:
+        yield connection
+    finally:
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture
+def session_factory(db_connection):
+    """Session factory bound to the test's transaction."""
+    return sessionmaker(
+        bind=db_connection, join_transaction_mode="create_savepoint", expire_on_commit=False
+    )
+
+
+@pytest.fixture
+def db(session_factory):
+    """A session in the test's transaction."""
+    with session_factory() as session:
+        yield session
+
+
+@pytest.fixture
+def client(session_factory):
+    """Test client of the app with ``get_db`` using the test's transaction."""
+    from app import create_app
+
+    app = create_app()
+
+    def override_get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+@pytest.fixture
+def borrower(session_factory):
+    """A borrower committed in the test's transaction."""
+    with session_factory() as db:
+        borrower = Borrower(name="Amina", email="amina@example.com")
+        db.add(borrower)
+        db.commit()
+        return borrower
+
+
+@pytest.fixture
+def make_loan():
+    """Factory of unsaved loans of a borrower; keyword arguments override the column defaults."""
+
+    def make_loan(borrower, amount="1000.00", status=LoanStatus.PENDING, **values):
+        values = {
+            "currency": "KES",
+            "term_months": 12,
+            "interest_rate_apr": Decimal("12.00"),
+            **values,
+        }
+        return Loan(borrower_id=borrower.id, amount=Decimal(amount), status=status, **values)
+
+    return make_loan
+
+
+# Statements a single test-client request may execute; override per test with
+# ``@pytest.mark.query_budget(n)`` (``None`` disables the check).
+DEFAULT_QUERY_BUDGET = 10
+
+
+@pytest.fixture(autouse=True)
+def request_query_budget(request, monkeypatch):
+    """Fail any test whose test-client requests exceed their query budget, to catch N+1 queries."""
+    from app.db import assert_max_queries
+
+    marker = request.node.get_closest_marker("query_budget")
+    budget = marker.args[0] if marker is not None else DEFAULT_QUERY_BUDGET
+    if budget is None:
+        return
+    send = TestClient.request
+
+    def request_within_budget(self, method, url, *args, **kwargs):
+        with assert_max_queries(budget):
+            return send(self, method, url, *args, **kwargs)
+
+    monkeypatch.setattr(TestClient, "request", request_within_budget)
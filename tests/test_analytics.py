@@ -0,0 +1,84 @@
+"""Tests for the vectorized portfolio analytics."""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from app.analytics import portfolio_summary
+from app.models import LoanStatus, Payment, PaymentStatus
+
+AS_OF = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+def make_payment(loan, amount, days_overdue, status=PaymentStatus.PENDING):
+    paid = status == PaymentStatus.PAID
+    return Payment(
+        loan_id=loan.id,
+        amount=Decimal(amount),
+        due_date=AS_OF - timedelta(days=days_overdue),
+        status=status,
+        paid_amount=Decimal(amount) if paid else None,
+        paid_at=AS_OF if paid else None,
+    )
+
+
+def test_portfolio_summary_par_and_aging(db, borrower, make_loan):
+    current = make_loan(borrower, "1000.00", LoanStatus.DISBURSED)
+    late = make_loan(borrower, "2000.00", LoanStatus.DISBURSED)
+    defaulted = make_loan(borrower, "500.00", LoanStatus.DEFAULTED)
+    pending = make_loan(borrower, "700.00", LoanStatus.PENDING, currency="USD")
+    db.add_all([current, late, defaulted, pending])
+    db.commit()
+
+    db.add_all([
+        make_payment(current, "400.00", 10, PaymentStatus.PAID),
+        make_payment(current, "600.00", -20),
+        make_payment(late, "500.00", 45, PaymentStatus.PAID),
+        make_payment(late, "500.00", 45),
+        make_payment(late, "500.00", 15),
+        make_payment(defaulted, "500.00", 120, PaymentStatus.OVERDUE),
+    ])
+    db.commit()
+
+    # Small chunks exercise the streaming path
+    summary = portfolio_summary(db, as_of=AS_OF, chunk_size=2)
+    groups = {(g["currency"], g["status"]): g for g in summary["groups"]}
+
+    disbursed = groups[("KES", "disbursed")]
+    assert disbursed["loan_count"] == 2
+    assert disbursed["outstanding_principal"] == 2100.0
+    assert disbursed["par30"] == 1500.0
+    assert disbursed["par90"] == 0.0
+    assert disbursed["aging"]["current"] == 600.0
+    assert disbursed["aging"]["31-60"] == 1500.0
+
+    assert groups[("KES", "defaulted")]["aging"]["91-180"] == 500.0
+    assert groups[("KES", "defaulted")]["par90_ratio"] == 1.0
+
+    # Loans not yet disbursed carry no outstanding principal
+    assert groups[("USD", "pending")]["outstanding_principal"] == 0.0
+
+    kes = summary["currencies"]["KES"]
+    assert kes["loan_count"] == 3
+    assert kes["outstanding_principal"] == 2600.0
+    assert kes["par30_ratio"] == round(2000 / 2600, 4)
+
+
+def test_portfolio_summary_empty(db):
+    summary = portfolio_summary(db, as_of=AS_OF)
+    assert summary["groups"] == []
+    assert summary["currencies"] == {}
+
+
+def test_portfolio_endpoint(db, client, borrower, make_loan):
+    loan = make_loan(borrower, "800.00", LoanStatus.DISBURSED)
+    db.add(loan)
+    db.commit()
+    db.add(make_payment(loan, "800.00", 95))
+    db.commit()
+
+    response = client.get(
+        "/api/stats/portfolio", params={"as_of": AS_OF.isoformat()}
+    )
+    assert response.status_code == 200
+    (group,) = response.json()["groups"]
+    assert group["par90"] == 800.0
+    assert group["aging"]["91-180"] == 800.0
@@ -0,0 +1,131 @@
+"""Tests for cold-storage archival of terminal-state loans."""
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import select
+
+import app.archive as archive_module
+from app.archive import LoanArchive, archive_loans
+from app.audit import loan_history
+from app.models import Loan, LoanStatus
+
+OLD = datetime(2025, 1, 10, 8, 30, 15, 123456, tzinfo=timezone.utc)
+
+
+# Loan columns of loans old enough to be archived
+OLD_LOAN = {"created_at": OLD, "updated_at": OLD, "interest_rate_apr": Decimal("18.50")}
+
+
+def test_archive_moves_terminal_loans_out_of_the_database(
+    session_factory, client, borrower, make_loan, tmp_path, monkeypatch
+):
+    db = session_factory()
+    repaid = make_loan(borrower, "1200.50", LoanStatus.REPAID, purpose="Shop stock – Nairobi", **OLD_LOAN)
+    rejected = make_loan(borrower, "300.00", LoanStatus.REJECTED, currency="USD", **OLD_LOAN)
+    # Can still be repaid, and counts towards portfolio-at-risk
+    defaulted = make_loan(borrower, "200.00", LoanStatus.DEFAULTED, **OLD_LOAN)
+    rejected_recently = make_loan(borrower, "50.00", LoanStatus.REJECTED, **OLD_LOAN)
+    rejected_recently.updated_at = datetime.now(timezone.utc)
+    active = make_loan(borrower, "800.00", LoanStatus.DISBURSED, **OLD_LOAN)
+    db.add_all([repaid, rejected, defaulted, rejected_recently, active])
+    db.commit()
+
+    archived = archive_loans(
+        directory=str(tmp_path),
+        chunk_size=1,
+        min_age=timedelta(days=30),
+        session_factory=session_factory,
+    )
+    assert archived == 2
+    assert len(list(tmp_path.iterdir())) == 2
+
+    remaining = set(db.scalars(select(Loan.id)))
+    assert remaining == {defaulted.id, rejected_recently.id, active.id}
+    deleted = loan_history(db, repaid.id)[-1]
+    assert (deleted["action"], deleted["changes"]["status"]) == ("delete", ["repaid", None])
+    assert deleted["changes"]["amount"] == ["1200.50", None]
+
+    archive = LoanArchive(str(tmp_path))
+    record = archive.get(repaid.id)
+    assert record["amount"] == Decimal("1200.50")
+    assert record["interest_rate_apr"] == Decimal("18.50")
+    assert record["status"] == LoanStatus.REPAID
+    assert record["purpose"] == "Shop stock – Nairobi"
+    assert record["created_at"] == OLD
+    assert record["disbursement_date"] is None
+    assert archive.get(rejected.id)["currency"] == "USD"
+    assert archive.get(active.id) is None
+
+    totals = archive.aggregates()
+    assert totals["total_loans"] == 2
+    assert totals["total_amount"] == Decimal("1500.50")
+    assert totals["by_status"] == {"repaid": 1, "rejected": 1}
+    assert totals["by_currency"] == {"KES": 1, "USD": 1}
+    assert archive.aggregates(created_from=datetime(2025, 2, 1, tzinfo=timezone.utc))["total_loans"] == 0
+    # Ranges cutting a month read that month's rows
+    assert archive.aggregates(created_from=OLD - timedelta(hours=1))["total_loans"] == 2
+    assert archive.aggregates(created_from=OLD + timedelta(hours=1))["total_loans"] == 0
+    assert archive.aggregates(created_to=OLD + timedelta(hours=1))["total_amount"] == Decimal("1500.50")
+
+    monkeypatch.setattr(archive_module, "_archive", archive)
+
+    archived_loan = client.get(f"/api/loans/{repaid.id}")
+    assert archived_loan.status_code == 200
+    assert archived_loan.json()["status"] == "repaid"
+    assert archived_loan.json()["borrower_id"] == str(borrower.id)
+    assert client.get(f"/api/loans/{active.id}").json()["amount"] == "800.00"
+    listed = client.get("/api/loans/").json()
+    assert {loan["id"] for loan in listed} == {str(defaulted.id), str(rejected_recently.id), str(active.id)}
+
+    body = client.post(
+        "/api/loans/batch-get", json={"ids": [str(repaid.id), str(active.id)]}
+    ).json()
+    assert [loan["id"] for loan in body["loans"]] == [str(repaid.id), str(active.id)]
+    assert body["loans"][0]["status"] == "repaid"
+
+    stats = client.get("/api/stats/").json()
+    assert stats["total_loans"] == 5
+    assert stats["total_amount"] == 2550.5
+    assert stats["by_status"]["repaid"] == 1
+    assert client.get("/api/stats/", params={"include_archived": False}).json()["total_loans"] == 3
+
+
+def test_aggregates_over_whole_months_come_from_the_manifests(tmp_path):
+    class Row:
+        def __init__(self, amount, status, currency, created_at):
+            self.id = uuid.uuid4()
+            self.borrower_id = uuid.uuid4()
+            self.amount = Decimal(amount)
+            self.currency = currency
+            self.status = status
+            self.term_months = 6
+            self.interest_rate_apr = Decimal("10.00")
+            self.purpose = None
+            self.created_at = created_at
+            self.disbursement_date = self.due_date = None
+            self.updated_at = created_at
+
+    archive_module.write_segment(str(tmp_path), [
+        Row("100.00", LoanStatus.REPAID, "KES", OLD),
+        Row("200.00", LoanStatus.REPAID, "KES", OLD + timedelta(days=1)),
+        Row("50.00", LoanStatus.REJECTED, "USD", datetime(2025, 3, 5, tzinfo=timezone.utc)),
+    ])
+    archive = LoanArchive(str(tmp_path))
+    [segment] = archive.segments()
+    assert segment.manifest["totals"] == [
+        ["rejected", "USD", "2025-03", 1, 5000],
+        ["repaid", "KES", "2025-01", 2, 30000],
+    ]
+    # No column is read
+    segment.columns = {}
+    assert archive.aggregates() == {
+        "total_loans": 3,
+        "total_amount": Decimal("350.00"),
+        "by_status": {"rejected": 1, "repaid": 2},
+        "by_currency": {"USD": 1, "KES": 2},
+    }
+    march = archive.aggregates(
+        created_from=datetime(2025, 2, 1, tzinfo=timezone.utc), created_to=datetime(2025, 4, 1, tzinfo=timezone.utc)
+    )
+    assert (march["total_loans"], march["by_status"]) == (1, {"rejected": 1})
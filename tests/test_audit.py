@@ -0,0 +1,118 @@
+"""Tests for the loan and payment audit history."""
+import io
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import delete, update
+from sqlalchemy.exc import DBAPIError
+
+from app import audit
+from app.audit import AuditBuffer, loan_history
+from app.config import settings
+from app.models import AuditEntry, Loan, LoanStatus, Payment, PaymentStatus
+from app.partitions import uuid7
+from app.reconciliation import import_payments
+
+
+@pytest.fixture
+def loan(session_factory, borrower, make_loan):
+    with session_factory() as db:
+        loan = make_loan(borrower, "400.00", term_months=6)
+        db.add(loan)
+        db.commit()
+        return loan.id
+
+
+def test_orm_changes_are_recorded(db, loan):
+    row = db.get(Loan, loan)
+    row.amount = Decimal("450.00")
+    payment = Payment(loan_id=loan, amount=Decimal("75.00"), due_date=datetime(2026, 11, 1, tzinfo=timezone.utc))
+    db.add(payment)
+    db.commit()
+    db.delete(payment)
+    db.commit()
+
+    history = loan_history(db, loan)
+    assert [(e["entity_type"], e["action"]) for e in history] == [
+        ("loan", "insert"), ("payment", "insert"), ("loan", "update"), ("payment", "delete"),
+    ]
+    assert history[0]["changes"]["amount"] == [None, "400.00"]
+    assert history[2]["changes"]["amount"] == ["400.00", "450.00"]
+    assert history[2]["changes"]["version"] == [1, 2]
+    assert history[3]["changes"]["status"] == ["pending", None]
+
+
+def test_history_is_append_only(db, loan):
+    with pytest.raises(DBAPIError):
+        db.execute(update(AuditEntry).values(action="update"))
+    db.rollback()
+    with pytest.raises(DBAPIError):
+        db.execute(delete(AuditEntry))
+
+
+def test_buffered_mode_writes_committed_changes_after_flush(monkeypatch, session_factory, loan):
+    buffer = AuditBuffer(batch_size=2)
+    monkeypatch.setattr(settings, "AUDIT_MODE", "buffered")
+    monkeypatch.setattr(audit, "_buffer", buffer)
+
+    with session_factory() as db:
+        db.get(Loan, loan).purpose = "Seeds"
+        db.commit()
+
+        db.get(Loan, loan).purpose = "Rolled back"
+        db.flush()
+        db.rollback()
+
+        row = db.get(Loan, loan)
+        row.term_months = 9
+        savepoint = db.begin_nested()
+        row.purpose = "Savepoint rolled back"
+        db.flush()
+        savepoint.rollback()
+        db.commit()
+
+        assert len(buffer) == 2
+        assert [e["action"] for e in loan_history(db, loan)] == ["insert"]
+        assert buffer.flush() == 2
+        history = loan_history(db, loan)
+    assert [e["changes"] for e in history[1:]] == [
+        {"purpose": [None, "Seeds"], "version": [1, 2]},
+        {"term_months": [6, 9], "version": [2, 3]},
+    ]
+
+
+def test_history_endpoint(client, loan):
+    response = client.post(
+        f"/api/loans/{loan}/transition", json={"expected_version": 1, "to_status": LoanStatus.APPROVED.value}
+    )
+    assert response.status_code == 200
+
+    first = client.get(f"/api/loans/{loan}/history", params={"limit": 1}).json()
+    assert [e["action"] for e in first["entries"]] == ["insert"]
+    rest = client.get(f"/api/loans/{loan}/history", params={"after": first["next_after"]}).json()
+    assert [e["changes"] for e in rest["entries"]] == [{"status": ["pending", "approved"], "version": [1, 2]}]
+    assert rest["next_after"] is None
+
+    assert client.get(f"/api/loans/{uuid7()}/history").status_code == 404
+    assert client.get(f"/api/loans/{loan}/history", params={"limit": 10000}).status_code == 422
+
+
+def test_imported_repayments_are_recorded(db, loan):
+    scheduled = Payment(loan_id=loan, amount=Decimal("75.00"), due_date=datetime(2026, 11, 1, tzinfo=timezone.utc))
+    db.add(scheduled)
+    db.commit()
+    rows = (
+        "transaction_reference,loan_id,amount,paid_at,payment_id\n"
+        f"TX-1,{loan},75.00,2026-11-01T09:00:00,{scheduled.id}\n"
+        f"TX-2,{loan},20.00,2026-11-02T09:00:00,\n"
+    )
+    import_payments(db, io.StringIO(rows), "csv")
+
+    settled, inserted = loan_history(db, loan)[-2:]
+    assert settled["entity_id"] == str(scheduled.id)
+    assert settled["changes"]["status"] == ["pending", "paid"]
+    assert inserted["action"] == "insert"
+    assert inserted["changes"]["transaction_reference"] == [None, "TX-2"]
+    db.expire_all()
+    assert db.get(Payment, scheduled.id).status == PaymentStatus.PAID
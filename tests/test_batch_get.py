@@ -0,0 +1,37 @@
+"""Tests for POST /api/loans/batch-get."""
+import pytest
+
+from app.config import settings
+from app.db import assert_max_queries
+from app.partitions import uuid7
+
+
+@pytest.fixture
+def loan_ids(session_factory, borrower, make_loan):
+    with session_factory() as db:
+        loans = [make_loan(borrower, amount) for amount in ("10.00", "20.00", "30.00")]
+        db.add_all(loans)
+        db.commit()
+        return [str(loan.id) for loan in loans]
+
+
+def test_batch_get_preserves_order_and_reports_missing(client, loan_ids):
+    with assert_max_queries(1):
+        response = client.post("/api/loans/batch-get", json={"ids": loan_ids[::-1]})
+    assert [loan["id"] for loan in response.json()["loans"]] == loan_ids[::-1]
+
+    # Ids not found in their partitions are looked up once more without bounds
+    unknown = str(uuid7())
+    ids = [loan_ids[2], unknown, loan_ids[0], loan_ids[2]]
+    response = client.post("/api/loans/batch-get", json={"ids": ids})
+    assert response.status_code == 200
+    body = response.json()
+    assert [loan["id"] for loan in body["loans"]] == [loan_ids[2], loan_ids[0]]
+    assert [loan["amount"] for loan in body["loans"]] == ["30.00", "10.00"]
+    assert body["missing"] == [unknown]
+
+
+def test_batch_get_rejects_empty_and_oversized_requests(client):
+    assert client.post("/api/loans/batch-get", json={"ids": []}).status_code == 422
+    too_many = [str(uuid7()) for _ in range(settings.LOANS_BATCH_GET_MAX_IDS + 1)]
+    assert client.post("/api/loans/batch-get", json={"ids": too_many}).status_code == 422
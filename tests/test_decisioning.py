@@ -0,0 +1,91 @@
+"""Tests for automated credit decisions on pending loans."""
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from app.decisioning import decide_pending_loans, score_loans
+from app.models import Borrower, Loan, LoanStatus, OutboxEvent, Payment, PaymentStatus
+from app.outbox import LOAN_STATUS_CHANGED
+
+
+def _features(**values):
+    return {
+        "credit_score": np.array(values.get("credit_score", [700.0])),
+        "amount": np.array(values.get("amount", [500.0])),
+        "term_months": np.array(values.get("term_months", [12.0])),
+        "active_loan_count": np.array(values.get("active_loan_count", [0.0])),
+        "overdue": np.array(values.get("overdue", [False])),
+    }
+
+
+def test_scorecard_bands_and_knockouts():
+    scores, approve = score_loans(
+        _features(
+            credit_score=[750.0, 600.0, np.nan, 450.0, 750.0],
+            amount=[500.0, 30000.0, 500.0, 500.0, 500.0],
+            term_months=[12.0, 48.0, 12.0, 12.0, 12.0],
+            active_loan_count=[0.0, 3.0, 0.0, 0.0, 0.0],
+            overdue=[False, False, False, False, True],
+        ),
+        approve_score=70,
+    )
+    assert scores.tolist() == [120, 15, 55, 45, 120]
+    assert approve.tolist() == [True, False, False, False, False]
+
+
+@pytest.fixture
+def pending_loans(session_factory):
+    with session_factory() as db:
+        good = Borrower(name="Njeri", email="njeri@example.com", credit_score=760)
+        thin = Borrower(name="Kipchoge", email="kipchoge@example.com")
+        late = Borrower(name="Auma", email="auma@example.com", credit_score=720)
+        db.add_all([good, thin, late])
+        db.flush()
+        loans = [
+            Loan(borrower_id=borrower.id, amount=Decimal("800.00"), currency="KES", term_months=6, interest_rate_apr=15)
+            for borrower in (good, good, good, thin, late)
+        ]
+        decided = Loan(
+            borrower_id=late.id, amount=Decimal("900.00"), currency="KES", term_months=6,
+            interest_rate_apr=15, status=LoanStatus.DISBURSED,
+        )
+        db.add_all([*loans, decided])
+        db.flush()
+        db.add(
+            Payment(
+                loan_id=decided.id, amount=Decimal("150.00"), due_date=datetime(2026, 1, 1, tzinfo=timezone.utc),
+                status=PaymentStatus.OVERDUE,
+            )
+        )
+        db.commit()
+        return [loan.id for loan in loans], decided.id
+
+
+def test_decide_pending_loans(db, pending_loans):
+    loan_ids, decided_id = pending_loans
+
+    report = decide_pending_loans(db, chunk_size=2, workers=0, approve_score=70)
+    assert report["scored"] == 5
+    assert (report["approved"], report["rejected"], report["conflicts"]) == (3, 2, 0)
+    assert report["decisions_per_second"] > 0
+
+    statuses = dict(db.execute(select(Loan.id, Loan.status)).all())
+    assert [statuses[loan_id] for loan_id in loan_ids] == [
+        LoanStatus.APPROVED, LoanStatus.APPROVED, LoanStatus.APPROVED, LoanStatus.REJECTED, LoanStatus.REJECTED,
+    ]
+    assert statuses[decided_id] == LoanStatus.DISBURSED
+    changed = db.scalars(select(OutboxEvent.id).where(OutboxEvent.event_type == LOAN_STATUS_CHANGED))
+    assert len(changed.all()) == 5
+
+    # Nothing left to decide
+    assert decide_pending_loans(db, workers=0)["scored"] == 0
+
+
+def test_decide_pending_loans_in_worker_processes(db, pending_loans):
+    report = decide_pending_loans(db, chunk_size=1, workers=2, approve_score=70, limit=4)
+    assert report["scored"] == 4
+    assert report["approved"] + report["rejected"] == 4
+    assert len(db.scalars(select(Loan.id).where(Loan.status == LoanStatus.PENDING)).all()) == 1
@@ -0,0 +1,69 @@
+"""Tests for the incrementally maintained borrower exposure."""
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from app.exposure import exposure_select, get_exposure
+from app.models import Borrower, LoanStatus, Payment, PaymentStatus
+
+
+def test_exposure_follows_loan_and_payment_writes(db, borrower, make_loan):
+    active = make_loan(borrower, "1000.00", LoanStatus.DISBURSED)
+    db.add_all([active, make_loan(borrower, "500.00", LoanStatus.PENDING)])
+    db.commit()
+
+    exposure = get_exposure(db, borrower.id)
+    assert exposure.outstanding_amount == Decimal("1000.00")
+    assert exposure.active_loan_count == 1
+    assert exposure.worst_payment_status is None
+
+    due = datetime.now(timezone.utc) + timedelta(days=30)
+    paid = Payment(
+        loan_id=active.id,
+        amount=Decimal("400.00"),
+        due_date=due,
+        status=PaymentStatus.PAID,
+        paid_amount=Decimal("400.00"),
+        paid_at=datetime.now(timezone.utc),
+    )
+    late = Payment(loan_id=active.id, amount=Decimal("600.00"), due_date=due, status=PaymentStatus.OVERDUE)
+    db.add_all([paid, late])
+    db.commit()
+
+    db.expire_all()
+    exposure = get_exposure(db, borrower.id)
+    assert exposure.outstanding_amount == Decimal("600.00")
+    assert exposure.worst_payment_status == PaymentStatus.OVERDUE
+
+    active.status = LoanStatus.REPAID
+    db.commit()
+
+    db.expire_all()
+    exposure = get_exposure(db, borrower.id)
+    assert exposure.outstanding_amount == 0
+    assert exposure.active_loan_count == 0
+
+
+def test_refresh_only_reads_payments_of_the_given_borrowers():
+    sql = str(exposure_select([uuid.uuid4()]))
+    payments = sql[sql.index("FROM payments"):sql.index("GROUP BY payments.loan_id")]
+    assert "loans.borrower_id IN" in payments
+
+
+def test_exposure_endpoint(client, session_factory, borrower, make_loan):
+    with session_factory() as db:
+        newcomer = Borrower(name="Chebet", email="chebet@example.com")
+        db.add(newcomer)
+        db.add(make_loan(borrower, "250.00", LoanStatus.APPROVED))
+        db.commit()
+        borrower_id, newcomer_id = str(borrower.id), str(newcomer.id)
+
+    response = client.get(f"/api/borrowers/{borrower_id}/exposure")
+    assert response.status_code == 200
+    assert response.json()["borrower_id"] == borrower_id
+    assert Decimal(response.json()["outstanding_amount"]) == Decimal("250.00")
+    assert response.json()["active_loan_count"] == 1
+
+    empty = client.get(f"/api/borrowers/{newcomer_id}/exposure").json()
+    assert (empty["active_loan_count"], empty["worst_payment_status"]) == (0, None)
+    assert client.get(f"/api/borrowers/{uuid.uuid4()}/exposure").status_code == 404
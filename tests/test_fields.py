@@ -0,0 +1,52 @@
+"""Tests for sparse fieldsets on loan reads."""
+import pytest
+
+from app.db import count_queries
+from app.queries import projection
+from app.schemas import parse_fields
+
+
+@pytest.fixture
+def loans(session_factory, borrower, make_loan):
+    with session_factory() as db:
+        loans = [make_loan(borrower, amount) for amount in ("10.00", "20.00")]
+        db.add_all(loans)
+        db.commit()
+        return loans
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields("status, amount") == ("id", "amount", "status")
+    with pytest.raises(ValueError, match="Unknown fields: secret"):
+        parse_fields("amount,secret")
+
+
+def test_projection_selects_only_requested_columns():
+    sql = str(projection("list_loans", ("id", "amount", "status")))
+    select_list = sql.split("FROM")[0]
+    assert "loans.amount" in select_list and "loans.status" in select_list
+    assert "loans.currency" not in select_list
+    assert "ORDER BY loans.created_at DESC" in sql
+    assert projection("list_loans", ("id", "amount", "status")) is projection("list_loans", ("id", "amount", "status"))
+
+
+def test_loan_endpoints_return_sparse_fieldsets(client, loans):
+    with count_queries() as counter:
+        listed = client.get("/api/loans/", params={"fields": "amount,status"})
+    assert listed.status_code == 200
+    assert counter.count == 1
+    assert {tuple(sorted(loan)) for loan in listed.json()} == {("amount", "id", "status")}
+    assert {loan["amount"] for loan in listed.json()} == {"10.00", "20.00"}
+
+    one = client.get(f"/api/loans/{loans[0].id}", params={"fields": "status"})
+    assert one.json() == {"id": str(loans[0].id), "status": "pending"}
+
+    batch = client.post(
+        "/api/loans/batch-get", params={"fields": "currency"}, json={"ids": [str(loans[1].id)]}
+    ).json()
+    assert batch["loans"] == [{"id": str(loans[1].id), "currency": "KES"}]
+
+    invalid = client.get("/api/loans/", params={"fields": "amount,password"})
+    assert invalid.status_code == 400
+    assert "password" in invalid.json()["detail"]
@@ -0,0 +1,164 @@
+"""Tests for Idempotency-Key replay of loan creation."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from app.idempotency import IdempotencyKeyReused, IdempotencyStore, get_idempotency_store, purge_expired
+from app.models import IdempotencyKey, Loan
+
+
+@pytest.fixture
+def store(session_factory):
+    return IdempotencyStore(ttl=60, cache_size=2, lock_seconds=30, session_factory=session_factory)
+
+
+@pytest.fixture
+def client(client, store):
+    client.app.dependency_overrides[get_idempotency_store] = lambda: store
+    return client
+
+
+@pytest.fixture
+def borrower_id(borrower):
+    return borrower.id
+
+
+def _loan_count(session_factory) -> int:
+    with session_factory() as db:
+        return db.scalar(select(func.count(Loan.id)))
+
+
+def test_retried_create_is_replayed(client, session_factory, borrower_id):
+    body = {"borrower_id": str(borrower_id), "amount": 250, "currency": "KES", "term_months": 6, "interest_rate_apr": 10}
+    first = client.post("/api/loans/", json=body, headers={"Idempotency-Key": "retry-1"})
+    assert first.status_code == 201
+    assert "Idempotent-Replayed" not in first.headers
+
+    again = client.post("/api/loans/", json=body, headers={"Idempotency-Key": "retry-1"})
+    assert again.status_code == 201
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.json() == first.json()
+    assert _loan_count(session_factory) == 1
+
+    reused = client.post("/api/loans/", json={**body, "amount": 300}, headers={"Idempotency-Key": "retry-1"})
+    assert reused.status_code == 422
+    assert client.post("/api/loans/", json=body).status_code == 201
+    assert _loan_count(session_factory) == 2
+
+
+def test_concurrent_duplicates_wait_for_the_first_attempt(store, session_factory):
+    calls = []
+
+    async def handler(resource_id):
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 201, {"n": len(calls)}
+
+    async def run():
+        return await asyncio.gather(*(store.execute("k", "h", handler) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert calls == [1]
+    assert results == [(201, {"n": 1}, False), (201, {"n": 1}, True), (201, {"n": 1}, True)]
+
+    # A new store (another process) replays from the table
+    other = IdempotencyStore(session_factory=session_factory)
+    assert asyncio.run(other.execute("k", "h", handler)) == (201, {"n": 1}, True)
+    with pytest.raises(IdempotencyKeyReused):
+        asyncio.run(other.execute("k", "other", handler))
+    assert calls == [1]
+
+
+def test_failed_attempt_releases_the_key(store, session_factory):
+    seen = []
+
+    async def failing(resource_id):
+        seen.append(resource_id)
+        raise RuntimeError("database down")
+
+    async def succeeding(resource_id):
+        seen.append(resource_id)
+        return 201, {"ok": True}
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.execute("k", "h", failing, resource_id="r1"))
+    with session_factory() as db:
+        assert db.get(IdempotencyKey, "k").status_code is None
+    # Taken over at once, under the id the failed attempt may have used
+    assert asyncio.run(store.execute("k", "h", succeeding, resource_id="r2")) == (201, {"ok": True}, False)
+    assert seen == ["r1", "r1"]
+    # A different request may reuse a key whose attempt failed
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.execute("k2", "h", failing, resource_id="r3"))
+    assert asyncio.run(store.execute("k2", "other", succeeding, resource_id="r4"))[2] is False
+    assert seen[-1] == "r4"
+
+
+def test_takeover_of_a_slow_attempt_reuses_its_resource_id(session_factory):
+    slow_store = IdempotencyStore(lock_seconds=0.05, session_factory=session_factory)
+    other = IdempotencyStore(lock_seconds=0.05, session_factory=session_factory)
+    seen = []
+
+    async def slow(resource_id):
+        seen.append(resource_id)
+        await asyncio.sleep(0.2)
+        return 201, {"by": "slow"}
+
+    async def fast(resource_id):
+        seen.append(resource_id)
+        return 201, {"by": "takeover"}
+
+    async def run():
+        first = asyncio.create_task(slow_store.execute("k", "h", slow, resource_id="r1"))
+        await asyncio.sleep(0.1)
+        second = await other.execute("k", "h", fast, resource_id="r2")
+        return await first, second
+
+    first, second = asyncio.run(run())
+    assert seen == ["r1", "r1"]
+    assert (first, second) == ((201, {"by": "slow"}, False), (201, {"by": "takeover"}, False))
+    # The taken-over attempt does not overwrite the current holder's response
+    with session_factory() as db:
+        assert db.get(IdempotencyKey, "k").response == {"by": "takeover"}
+
+
+def test_create_that_crashed_before_saving_is_replayed_from_the_loan(client, store, session_factory, borrower_id):
+    body = {"borrower_id": str(borrower_id), "amount": 250, "currency": "KES", "term_months": 6, "interest_rate_apr": 10}
+    first = client.post("/api/loans/", json=body, headers={"Idempotency-Key": "crash-1"})
+    assert first.status_code == 201
+
+    # The loan was committed but the process died before saving the response
+    with session_factory() as db:
+        key = db.get(IdempotencyKey, "crash-1")
+        key.status_code, key.response = None, None
+        key.locked_at -= timedelta(minutes=5)
+        db.commit()
+    store._cache.clear()
+
+    again = client.post("/api/loans/", json=body, headers={"Idempotency-Key": "crash-1"})
+    assert again.status_code == 201
+    assert again.json()["id"] == first.json()["id"]
+    assert _loan_count(session_factory) == 1
+
+
+def test_purge_expired_deletes_in_batches(session_factory):
+    now = datetime.now(timezone.utc)
+    with session_factory() as db:
+        db.add_all(
+            IdempotencyKey(
+                key=f"k{i}",
+                request_hash="h",
+                status_code=201,
+                response={},
+                locked_at=now,
+                expires_at=now + timedelta(hours=1 if i < 2 else -1),
+            )
+            for i in range(7)
+        )
+        db.commit()
+
+    assert purge_expired(batch_size=2, session_factory=session_factory) == 5
+    with session_factory() as db:
+        assert sorted(db.scalars(select(IdempotencyKey.key))) == ["k0", "k1"]
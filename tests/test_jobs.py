@@ -0,0 +1,192 @@
+"""Tests for the background job runner."""
+import asyncio
+import time
+from datetime import timedelta
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+from app import jobs
+from app.db import Base
+from app.jobs import JobRunner, _utcnow, job_type
+from app.models import Job, JobStatus
+
+calls = {"flaky": 0}
+
+
+@job_type("test_square", kind="process")
+def square(params):
+    return {"value": params["n"] ** 2}
+
+
+@job_type("test_flaky", kind="io")
+async def flaky(params):
+    calls["flaky"] += 1
+    if calls["flaky"] < 2:
+        raise RuntimeError("transient failure")
+    return {"calls": calls["flaky"]}
+
+
+@job_type("test_broken", kind="io")
+async def broken(params):
+    raise RuntimeError("always fails")
+
+
+def make_runner(path, lease=60.0):
+    # Workers use separate threads, so each needs its own connection.
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+    return JobRunner(
+        concurrency=2, process_workers=1, retry_backoff=0.01, lease=lease, session_factory=session_factory
+    )
+
+
+async def wait_for_job(runner, job_id, timeout=10):
+    for _ in range(int(timeout / 0.02)):
+        job = runner.get(job_id)
+        if job.status in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def run_jobs(tmp_path, *submissions):
+    runner = make_runner(tmp_path / "jobs.db")
+
+    async def run():
+        try:
+            jobs = [await runner.submit(name, params, max_attempts) for name, params, max_attempts in submissions]
+            return [await wait_for_job(runner, job.id) for job in jobs]
+        finally:
+            await runner.stop()
+
+    return asyncio.run(run())
+
+
+def test_process_job_runs_in_pool(tmp_path):
+    [job] = run_jobs(tmp_path, ("test_square", {"n": 7}, None))
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.result == {"value": 49}
+    assert job.attempts == 1
+
+
+def test_failed_job_is_retried_until_it_succeeds_or_gives_up(tmp_path):
+    flaky_job, broken_job = run_jobs(tmp_path, ("test_flaky", {}, 3), ("test_broken", {}, 2))
+
+    assert flaky_job.status == JobStatus.SUCCEEDED
+    assert flaky_job.attempts == 2
+    assert broken_job.status == JobStatus.FAILED
+    assert broken_job.attempts == 2
+    assert "always fails" in broken_job.error
+
+
+@job_type("test_slow", kind="io")
+async def slow(params):
+    await asyncio.sleep(params["seconds"])
+    return {}
+
+
+def test_job_is_claimed_by_one_runner_only(tmp_path):
+    first = make_runner(tmp_path / "jobs.db")
+    second = make_runner(tmp_path / "jobs.db")
+    job = first._create("test_square", {"n": 2}, 3)
+
+    claimed = first._claim(job.id)
+    assert claimed.status == JobStatus.RUNNING
+    assert claimed.attempts == 1
+    assert claimed.runner_id == first.runner_id
+    assert second._claim(job.id) is None
+    # Only the holder can finish it
+    assert not second._update(job.id, status=JobStatus.SUCCEEDED)
+    assert first.get(job.id).status == JobStatus.RUNNING
+
+
+def test_recovery_skips_jobs_leased_by_live_runners(tmp_path):
+    live = make_runner(tmp_path / "jobs.db")
+    crashed = make_runner(tmp_path / "jobs.db")
+    restarted = make_runner(tmp_path / "jobs.db")
+    running = live._create("test_square", {"n": 2}, 3)
+    orphaned = crashed._create("test_square", {"n": 3}, 3)
+    live._claim(running.id)
+    crashed._claim(orphaned.id)
+    with crashed.session_factory() as session:
+        session.execute(
+            update(Job).where(Job.id == orphaned.id).values(lease_expires_at=_utcnow() - timedelta(seconds=1))
+        )
+        session.commit()
+
+    assert restarted._recover() == [orphaned.id]
+    assert restarted.get(running.id).status == JobStatus.RUNNING
+    assert restarted.get(orphaned.id).status == JobStatus.QUEUED
+
+
+def test_lease_is_renewed_while_a_job_runs(tmp_path):
+    runner = make_runner(tmp_path / "jobs.db", lease=0.15)
+
+    async def run():
+        try:
+            job = await runner.submit("test_slow", {"seconds": 0.4})
+            await asyncio.sleep(0.25)
+            # Past the initial lease, yet still held by the runner
+            assert runner._recover() == []
+            return await wait_for_job(runner, job.id)
+        finally:
+            await runner.stop()
+
+    job = asyncio.run(run())
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.attempts == 1
+
+
+def test_live_runner_picks_up_jobs_of_a_crashed_peer(tmp_path):
+    live = make_runner(tmp_path / "jobs.db", lease=0.1)
+    crashed = make_runner(tmp_path / "jobs.db", lease=0.1)
+
+    async def run():
+        await live.start()
+        try:
+            job = crashed._create("test_square", {"n": 5}, 3)
+            # Claimed by a runner that never renews its lease
+            crashed._claim(job.id)
+            return await wait_for_job(live, job.id)
+        finally:
+            await live.stop()
+
+    job = asyncio.run(run())
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.result == {"value": 25}
+    assert job.runner_id == live.runner_id
+
+
+def test_queued_jobs_run_on_application_startup(tmp_path, monkeypatch, client):
+    runner = make_runner(tmp_path / "jobs.db")
+    monkeypatch.setattr(jobs, "_runner", runner)
+    # Queued by a previous process
+    job = runner._create("test_square", {"n": 6}, 3)
+
+    with client:
+        for _ in range(500):
+            if runner.get(job.id).status == JobStatus.SUCCEEDED:
+                break
+            time.sleep(0.02)
+    assert runner.get(job.id).result == {"value": 36}
+
+
+def test_job_endpoints(tmp_path, monkeypatch, client):
+    runner = make_runner(tmp_path / "jobs.db")
+    monkeypatch.setattr(jobs, "_runner", runner)
+
+    with client:
+        response = client.post("/api/jobs/", json={"type": "test_square", "params": {"n": 4}})
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+        for _ in range(500):
+            body = client.get(f"/api/jobs/{job_id}").json()
+            if body["status"] == JobStatus.SUCCEEDED.value:
+                break
+            time.sleep(0.02)
+        assert body["result"] == {"value": 16}
+
+        assert client.post("/api/jobs/", json={"type": "nope"}).status_code == 422
+        assert client.get("/api/jobs/00000000-0000-0000-0000-000000000000").status_code == 404
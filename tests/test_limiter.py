@@ -0,0 +1,130 @@
+"""Tests for the adaptive concurrency limiter."""
+import asyncio
+
+import pytest
+
+from app.limiter import AdaptiveConcurrencyMiddleware, AdaptiveLimiter, LimitExceeded
+
+
+def test_sheds_when_queue_is_full():
+    limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_queue=1, queue_timeout=0.5)
+
+    async def run():
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queue_depth == 1
+        with pytest.raises(LimitExceeded):
+            await limiter.acquire()
+        limiter.release(0.01)
+        await waiter
+        assert limiter.in_flight == 1
+
+    asyncio.run(run())
+
+
+def test_queued_request_times_out():
+    limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_queue=5, queue_timeout=0.01)
+
+    async def run():
+        await limiter.acquire()
+        with pytest.raises(LimitExceeded):
+            await limiter.acquire()
+        assert limiter.queue_depth == 0
+
+    asyncio.run(run())
+
+
+def test_limit_backs_off_on_slow_responses_and_recovers():
+    limiter = AdaptiveLimiter(initial_limit=10, min_limit=2, max_limit=20)
+    limiter.in_flight = 10
+    limiter.release(0.01)
+    start = limiter.limit
+
+    limiter.in_flight = 10
+    limiter.release(1.0)
+    assert limiter.limit < start
+
+    reduced = limiter.limit
+    for _ in range(100):
+        limiter.in_flight = int(limiter.limit)
+        limiter.release(0.01)
+    assert limiter.limit > reduced
+
+
+def test_middleware_sheds_with_503_but_lets_health_probes_through():
+    limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_queue=0)
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = AdaptiveConcurrencyMiddleware(app, limiter=limiter)
+
+    async def run():
+        await limiter.acquire()
+        await middleware({'type': 'http', 'path': '/api/loans'}, None, send)
+        await middleware({'type': 'http', 'path': '/api/health/liveness'}, None, send)
+
+    asyncio.run(run())
+
+    statuses = [m['status'] for m in sent if m['type'] == 'http.response.start']
+    assert statuses == [503, 200]
+
+
+def test_cancelled_waiter_passes_on_a_handed_over_slot():
+    limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_queue=5, queue_timeout=1.0)
+
+    async def run():
+        await limiter.acquire()
+        cancelled = asyncio.ensure_future(limiter.acquire())
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        # The slot goes to the first waiter, which is cancelled before it resumes
+        limiter.release(0.01)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        await waiting
+        assert limiter.in_flight == 1
+        limiter.release(0.01)
+        assert limiter.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_mixed_route_latencies_keep_the_limit_stable():
+    limiter = AdaptiveLimiter(initial_limit=15, min_limit=1, max_limit=200)
+    # Healthy traffic: one route always takes 2 ms, another 15 ms
+    for i in range(2000):
+        limiter.in_flight = int(limiter.limit)
+        fast = i % 2 == 0
+        limiter.release(0.002 if fast else 0.015, route="fast" if fast else "slow")
+    assert limiter.limit >= 15
+    assert limiter.baselines == pytest.approx({"fast": 0.002, "slow": 0.015})
+
+
+def test_middleware_keys_baselines_by_route_and_ignores_client_errors():
+    from fastapi import FastAPI, HTTPException
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        if item_id == 0:
+            raise HTTPException(status_code=404)
+        return {"id": item_id}
+
+    limiter = AdaptiveLimiter()
+    client = TestClient(AdaptiveConcurrencyMiddleware(app, limiter=limiter))
+    assert client.get("/items/0").status_code == 404
+    assert client.get("/items/abc").status_code == 422
+    assert limiter.baselines == {}
+    assert client.get("/items/1").status_code == 200
+    assert list(limiter.baselines) == [get_item]
+    assert limiter.in_flight == 0
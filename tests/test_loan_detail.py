@@ -0,0 +1,46 @@
+"""Tests for the loan detail endpoint and the N+1 query guard."""
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.db import QueryBudgetExceeded, assert_max_queries
+from app.models import Loan, Payment
+
+
+@pytest.fixture
+def loans(session_factory, borrower, make_loan):
+    with session_factory() as db:
+        due = datetime.now(timezone.utc) + timedelta(days=30)
+        created = []
+        for _ in range(3):
+            loan = make_loan(borrower, "1200.00")
+            loan.payments = [Payment(amount=Decimal("400.00"), due_date=due) for _ in range(3)]
+            db.add(loan)
+            created.append(loan)
+        db.commit()
+        return [loan.id for loan in created]
+
+
+def test_loan_detail_embeds_borrower_and_payments_in_two_queries(client, loans):
+    with assert_max_queries(2):
+        response = client.get(f"/api/loans/{loans[0]}/detail")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["borrower"]["email"] == "amina@example.com"
+    assert len(body["payments"]) == 3
+
+
+def test_loan_detail_not_found(client, loans):
+    assert client.get(f"/api/loans/{uuid.uuid4()}/detail").status_code == 404
+
+
+def test_query_budget_catches_lazy_loading(session_factory, loans):
+    with session_factory() as db:
+        with pytest.raises(QueryBudgetExceeded):
+            with assert_max_queries(2):
+                for loan in db.scalars(select(Loan)):
+                    loan.payments
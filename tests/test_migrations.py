@@ -0,0 +1,111 @@
+"""Tests for the online migration helpers."""
+import pytest
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import create_engine, text
+
+from app import migrations
+from app.migrations import PROGRESS_TABLE, _constraint_validated, run_backfill
+from app.partitions import existing_partitions
+
+TABLE = "migration_items"
+PARTITIONS = ["migration_items_2026_01", "migration_items_2026_02"]
+
+
+def make_table(engine, rows):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, amount INTEGER, doubled INTEGER)"))
+        connection.execute(
+            text("INSERT INTO items (id, amount) VALUES (:id, :amount)"),
+            [{"id": i, "amount": i * 10} for i in range(1, rows + 1)],
+        )
+
+
+@pytest.fixture
+def partitioned_table(db_engine):
+    """A partitioned scratch table, with alembic's ``op`` bound to a connection of the test database.
+
+    The helpers commit outside of any transaction, so the table is dropped at
+    teardown rather than rolled back with a test transaction.
+    """
+    if db_engine.dialect.name != "postgresql":
+        pytest.skip("TEST_DATABASE_URL is not a PostgreSQL database")
+    with db_engine.connect() as connection:
+        connection.execute(
+            text(
+                f"CREATE TABLE {TABLE} (id INTEGER, month DATE, amount INTEGER, note VARCHAR) "
+                "PARTITION BY RANGE (month)"
+            )
+        )
+        for partition, start, end in zip(PARTITIONS, ("2026-01-01", "2026-02-01"), ("2026-02-01", "2026-03-01")):
+            connection.execute(
+                text(f"CREATE TABLE {partition} PARTITION OF {TABLE} FOR VALUES FROM ('{start}') TO ('{end}')")
+            )
+        connection.execute(text(f"INSERT INTO {TABLE} VALUES (1, '2026-01-15', 10, 'a'), (2, '2026-02-15', 20, 'b')"))
+        connection.commit()
+        try:
+            with Operations.context(MigrationContext.configure(connection)):
+                yield connection
+        finally:
+            connection.rollback()
+            connection.execute(text(f"DROP TABLE IF EXISTS {TABLE} CASCADE"))
+            connection.commit()
+
+
+def test_create_index_concurrently_on_a_partitioned_table(partitioned_table):
+    migrations.create_index_concurrently("ix_migration_items_amount", TABLE, ["amount"])
+    # A resumed migration finds the index already in place
+    migrations.create_index_concurrently("ix_migration_items_amount", TABLE, ["amount"])
+
+    children = [f"{partition}_ix_migration_items_amount" for partition in PARTITIONS]
+    assert existing_partitions(partitioned_table, "ix_migration_items_amount") == children
+    valid = partitioned_table.execute(
+        text(
+            "SELECT c.relname, i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = ANY(:names)"
+        ),
+        {"names": ["ix_migration_items_amount", *children]},
+    ).all()
+    assert dict(valid) == dict.fromkeys(["ix_migration_items_amount", *children], True)
+
+
+def test_check_constraint_is_validated_on_every_partition(partitioned_table):
+    migrations.add_check_constraint(TABLE, "chk_migration_items_amount", "amount >= 0")
+    migrations.add_check_constraint(TABLE, "chk_migration_items_amount", "amount >= 0")
+
+    for table in (TABLE, *PARTITIONS):
+        assert _constraint_validated(partitioned_table, table, "chk_migration_items_amount") is True
+    with pytest.raises(Exception, match="chk_migration_items_amount"):
+        partitioned_table.execute(text(f"INSERT INTO {TABLE} VALUES (3, '2026-01-20', -1, 'c')"))
+
+
+def test_set_not_null_on_a_partitioned_table(partitioned_table):
+    migrations.set_not_null(TABLE, "note")
+
+    not_null = partitioned_table.execute(
+        text(
+            "SELECT c.relname, a.attnotnull FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid "
+            "WHERE c.relname = ANY(:tables) AND a.attname = 'note'"
+        ),
+        {"tables": [TABLE, *PARTITIONS]},
+    ).all()
+    assert dict(not_null) == dict.fromkeys([TABLE, *PARTITIONS], True)
+    # The check backing SET NOT NULL is dropped from the partitions with the parent's
+    for table in (TABLE, *PARTITIONS):
+        assert _constraint_validated(partitioned_table, table, "chk_migration_items_note_not_null") is None
+
+
+def test_backfill_runs_in_batches_and_resumes():
+    engine = create_engine("sqlite://")
+    make_table(engine, 25)
+
+    with engine.connect() as connection:
+        kwargs = dict(where="doubled IS NULL", batch_size=10, pause=0)
+        assert run_backfill(connection, "double", "items", "doubled = amount * 2", max_batches=2, **kwargs) == 20
+        progress = connection.execute(text(f"SELECT last_key, rows_done, completed_at FROM {PROGRESS_TABLE}")).one()
+        assert (progress.last_key, progress.rows_done, progress.completed_at) == ("20", 20, None)
+
+        # Resumes after the last committed batch and marks the backfill complete
+        assert run_backfill(connection, "double", "items", "doubled = amount * 2", **kwargs) == 5
+        assert connection.execute(text("SELECT count(*) FROM items WHERE doubled = amount * 2")).scalar() == 25
+        assert run_backfill(connection, "double", "items", "doubled = amount * 2", **kwargs) == 0
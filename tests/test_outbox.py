@@ -0,0 +1,102 @@
+"""Tests for the transactional loan event outbox."""
+import asyncio
+import json
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app import jobs, outbox
+from app.models import Loan, LoanStatus, OutboxEvent
+from app.outbox import LOAN_CREATED, LOAN_STATUS_CHANGED, FileSink, OutboxDispatcher
+
+
+@pytest.fixture
+def loan(session_factory, borrower, make_loan):
+    db = session_factory()
+    loan = make_loan(borrower, "1500.00")
+    db.add(loan)
+    db.commit()
+    loan.status = LoanStatus.APPROVED
+    db.commit()
+    db.close()
+    return loan
+
+
+class FailingSink:
+    name = "failing"
+
+    async def send(self, events):
+        raise ConnectionError("sink unavailable")
+
+
+def test_orm_writes_record_events_in_the_same_transaction(session_factory, loan):
+    db = session_factory()
+    events = db.scalars(select(OutboxEvent).order_by(OutboxEvent.id)).all()
+
+    assert [e.event_type for e in events] == [LOAN_CREATED, LOAN_STATUS_CHANGED]
+    assert all(e.aggregate_id == loan.id for e in events)
+    assert events[0].payload["amount"] == "1500.00"
+    assert events[0].payload["status"] == "pending"
+    assert events[1].payload == {
+        "loan_id": str(loan.id),
+        "from_status": "pending",
+        "to_status": "approved",
+    }
+
+    # A rolled back change leaves no event behind
+    db.add(Loan(borrower_id=loan.borrower_id, amount=Decimal("10.00"), term_months=1, interest_rate_apr=0))
+    db.flush()
+    db.rollback()
+    assert db.scalar(select(OutboxEvent).where(OutboxEvent.id > events[-1].id)) is None
+
+
+def test_dispatch_delivers_batches_and_marks_events_dispatched(session_factory, loan, tmp_path):
+    path = tmp_path / "events.ndjson"
+    dispatcher = OutboxDispatcher(
+        [FileSink(str(path))], batch_size=1, session_factory=session_factory
+    )
+
+    assert asyncio.run(dispatcher.dispatch_once()) == 1
+    assert asyncio.run(dispatcher.dispatch_once()) == 1
+    assert asyncio.run(dispatcher.dispatch_once()) == 0
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["event_type"] for line in lines] == [LOAN_CREATED, LOAN_STATUS_CHANGED]
+    assert lines[0]["aggregate_id"] == str(loan.id)
+    db = session_factory()
+    assert all(e.dispatched_at is not None and e.attempts == 1 for e in db.scalars(select(OutboxEvent)))
+
+
+def test_failed_delivery_is_released_for_retry(session_factory, loan, tmp_path):
+    path = tmp_path / "events.ndjson"
+    dispatcher = OutboxDispatcher(
+        [FileSink(str(path)), FailingSink()], retry_backoff=0, session_factory=session_factory
+    )
+
+    assert asyncio.run(dispatcher.dispatch_once()) == 2
+
+    db = session_factory()
+    events = db.scalars(select(OutboxEvent)).all()
+    assert all(e.dispatched_at is None for e in events)
+    assert all(e.attempts == 1 for e in events)
+    assert all("sink unavailable" in e.last_error for e in events)
+
+    # Released with no backoff, so the next pass claims them again
+    dispatcher.sinks = [FileSink(str(path))]
+    assert asyncio.run(dispatcher.dispatch_once()) == 2
+    db.expire_all()
+    assert all(e.dispatched_at is not None and e.attempts == 2 for e in db.scalars(select(OutboxEvent)))
+
+
+def test_shutdown_does_not_create_dispatchers_or_a_job_runner(monkeypatch, client):
+    monkeypatch.setattr(outbox, "_shard_dispatchers", None)
+    monkeypatch.setattr(jobs, "_runner", None)
+
+    async def shutdown():
+        for handler in client.app.router.on_shutdown:
+            await handler()
+
+    asyncio.run(shutdown())
+    assert outbox._shard_dispatchers is None
+    assert jobs._runner is None
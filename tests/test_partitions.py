@@ -0,0 +1,71 @@
+"""Tests for created_at partitioning support and partition pruning."""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+
+from app.partitions import (
+    created_at_window,
+    ensure_partitions,
+    existing_partitions,
+    partition_name,
+    uuid7,
+    uuid_timestamp,
+)
+from app.queries import HOT_QUERIES
+
+
+def test_uuid7_is_time_ordered():
+    before = datetime.now(timezone.utc) - timedelta(milliseconds=1)
+    ids = [uuid7() for _ in range(100)]
+    assert all(value.version == 7 for value in ids)
+    assert before <= uuid_timestamp(ids[0]) <= datetime.now(timezone.utc)
+    assert [uuid_timestamp(v) for v in ids] == sorted(uuid_timestamp(v) for v in ids)
+
+    window = created_at_window(ids)
+    assert window["created_from"] < before < window["created_to"]
+    assert created_at_window([uuid.uuid4()]) is None
+
+
+def test_lookups_fall_back_for_rows_outside_the_id_window(client, db, borrower, make_loan):
+    recent = make_loan(borrower)
+    backdated = make_loan(borrower, created_at=datetime(2020, 1, 15, tzinfo=timezone.utc))
+    legacy = make_loan(borrower, id=uuid.uuid4())
+    db.add_all([recent, backdated, legacy])
+    db.commit()
+
+    for loan in (recent, backdated, legacy):
+        assert client.get(f"/api/loans/{loan.id}/detail").status_code == 200
+    assert client.get(f"/api/loans/{uuid7()}/detail").status_code == 404
+
+    ids = [str(loan.id) for loan in (recent, backdated, legacy)]
+    body = client.post("/api/loans/batch-get", json={"ids": ids}).json()
+    assert [loan["id"] for loan in body["loans"]] == ids
+    assert body["missing"] == []
+
+    stats = client.get("/api/stats/", params={"created_from": "2021-01-01T00:00:00Z"}).json()
+    assert stats["total_loans"] == 2
+
+
+def test_id_lookup_prunes_partitions_on_postgres(db_connection, db, borrower, make_loan):
+    if db_connection.dialect.name != "postgresql":
+        pytest.skip("TEST_DATABASE_URL is not a PostgreSQL database")
+    now = datetime.now(timezone.utc)
+    # Rolled back with the test's transaction
+    ensure_partitions(db_connection, months_ahead=1, start=now - timedelta(days=180))
+    assert partition_name("loans", now) in existing_partitions(db_connection, "loans")
+
+    loan = make_loan(borrower)
+    db.add(loan)
+    db.commit()
+
+    statement = HOT_QUERIES["loan_by_id_pruned"].params(
+        loan_id=loan.id, **created_at_window([loan.id])
+    )
+    sql = statement.compile(db_connection, compile_kwargs={"literal_binds": True})
+    plan = "\n".join(row[0] for row in db.execute(text(f"EXPLAIN {sql}")))
+    scanned = {line.split(" on ")[1].split()[0] for line in plan.splitlines() if " on loans_" in line}
+    # Only the current month, and at most the adjacent one within the id slack
+    assert partition_name("loans", now) in scanned
+    assert len(scanned) <= 2
@@ -0,0 +1,46 @@
+"""Tests for the request profiling middleware."""
+import asyncio
+import time
+
+from app.profiling import ProfileStore, ProfilingMiddleware, collapsed_stacks, top_functions
+
+
+async def slow_app(scope, receive, send):
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def noop_send(message):
+    pass
+
+
+def request(headers=()):
+    return {'type': 'http', 'method': 'GET', 'path': '/api/loans', 'headers': list(headers)}
+
+
+def test_profiles_only_requests_with_token_header():
+    store = ProfileStore(maxlen=5)
+    middleware = ProfilingMiddleware(slow_app, store=store, token="secret", sample_interval=0.001)
+
+    asyncio.run(middleware(request(), None, noop_send))
+    asyncio.run(middleware(request([(b'x-profile', b'wrong')]), None, noop_send))
+    assert store.list() == []
+
+    asyncio.run(middleware(request([(b'x-profile', b'secret')]), None, noop_send))
+    [summary] = store.list()
+    profile = store.get(summary["id"])
+
+    assert summary["status_code"] == 200
+    assert profile["samples"] > 0
+    assert "slow_app" in collapsed_stacks(profile)
+    assert len(top_functions(profile, limit=3)) == 3
+
+
+def test_ring_buffer_is_bounded():
+    store = ProfileStore(maxlen=2)
+    for i in range(5):
+        store.add({"path": str(i), "functions": [], "stacks": {}})
+    assert [p["path"] for p in store.list()] == ["4", "3"]
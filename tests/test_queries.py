@@ -0,0 +1,51 @@
+"""Tests for the hot-query registry."""
+import pytest
+
+from app import queries
+from app.db import QueryBudgetExceeded, assert_max_queries
+from app.metrics import HOT_QUERY_CACHE
+
+
+@pytest.fixture
+def loan(session_factory, borrower, make_loan):
+    with session_factory() as db:
+        loan = make_loan(borrower, "300.00")
+        db.add(loan)
+        db.commit()
+        return loan.id
+
+
+def _cache_results(name):
+    return [
+        call.kwargs["result"] for call in HOT_QUERY_CACHE.labels.call_args_list if call.kwargs["query"] == name
+    ]
+
+
+def test_hot_query_is_compiled_once(db, db_engine, loan):
+    db_engine._compiled_cache.clear()
+    HOT_QUERY_CACHE.reset_mock()
+
+    for _ in range(3):
+        assert queries.execute(db, "loan_by_id", {"loan_id": loan}).scalar_one().id == loan
+    assert _cache_results("loan_by_id") == ["miss", "hit", "hit"]
+
+    fields = ("id", "amount")
+    assert queries.projection("loan_by_id", fields) is queries.projection("loan_by_id", fields)
+
+
+def test_stats_runs_one_query(client, loan):
+    with assert_max_queries(1):
+        stats = client.get("/api/stats/", params={"include_archived": False}).json()
+    assert stats == {
+        "total_loans": 1,
+        "total_amount": 300.0,
+        "avg_amount": 300.0,
+        "by_status": {"pending": 1},
+        "by_currency": {"KES": 1},
+    }
+
+
+@pytest.mark.query_budget(0)
+def test_requests_over_their_query_budget_fail(client, loan):
+    with pytest.raises(QueryBudgetExceeded, match="at most 0 queries"):
+        client.get(f"/api/loans/{loan}")
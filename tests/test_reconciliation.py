@@ -0,0 +1,79 @@
+"""Tests for the streaming repayment file import."""
+import io
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models import BorrowerExposure, LoanStatus, Payment, PaymentStatus
+from app.reconciliation import import_payments
+
+
+@pytest.fixture
+def loan(session_factory, borrower, make_loan):
+    db = session_factory()
+    loan = make_loan(borrower, "1000.00", LoanStatus.DISBURSED, term_months=2)
+    db.add(loan)
+    db.flush()
+    loan.payments = [
+        Payment(loan_id=loan.id, amount=Decimal("500.00"), due_date=datetime(2026, 9, 1, tzinfo=timezone.utc)),
+        Payment(loan_id=loan.id, amount=Decimal("500.00"), due_date=datetime(2026, 10, 1, tzinfo=timezone.utc)),
+    ]
+    db.commit()
+    db.close()
+    return loan
+
+
+def test_import_settles_inserts_dedupes_and_rejects(session_factory, loan):
+    scheduled = loan.payments[0]
+    csv_file = io.StringIO(
+        "transaction_reference,loan_id,amount,paid_at,payment_id\n"
+        f"TX-1,{loan.id},500.00,2026-09-01T10:00:00+03:00,{scheduled.id}\n"
+        f"TX-2,{loan.id},120.50,2026-09-15T09:00:00,\n"
+        f"TX-2,{loan.id},120.50,2026-09-15T09:00:00,\n"
+        f"TX-3,{loan.id},-5,2026-09-15T09:00:00,\n"
+        f"TX-4,00000000-0000-0000-0000-000000000000,10,2026-09-15T09:00:00,\n"
+        f"TX-5,{loan.id},10,2026-09-15T09:00:00,{scheduled.id}\n"
+    )
+    db = session_factory()
+    report = import_payments(db, csv_file, "csv", chunk_size=2)
+
+    assert report["rows"] == 6
+    assert (report["settled"], report["inserted"], report["duplicates"], report["rejected"]) == (1, 1, 1, 3)
+    assert [r["line"] for r in report["rejects"]] == [5, 6, 7]
+    assert "already paid" in report["rejects"][2]["reason"]
+    assert report["rows_per_second"] > 0
+
+    db.expire_all()
+    settled = db.get(Payment, scheduled.id)
+    assert settled.status == PaymentStatus.PAID
+    assert settled.paid_amount == Decimal("500.00")
+    assert settled.transaction_reference == "TX-1"
+    inserted = db.scalar(select(Payment).where(Payment.transaction_reference == "TX-2"))
+    assert (inserted.status, inserted.paid_amount) == (PaymentStatus.PAID, Decimal("120.50"))
+    assert db.get(BorrowerExposure, loan.borrower_id).outstanding_amount == Decimal("379.50")
+
+    # Re-importing the same file changes nothing
+    csv_file.seek(0)
+    again = import_payments(db, csv_file, "csv")
+    assert (again["settled"], again["inserted"], again["duplicates"]) == (0, 0, 2)
+    assert db.scalar(select(func.count()).select_from(Payment)) == 3
+
+
+def test_import_endpoint_streams_ndjson(client, loan):
+    lines = [
+        {"transaction_reference": f"NB-{i}", "loan_id": str(loan.id), "amount": "1.00", "paid_at": "2026-10-02T00:00:00Z"}
+        for i in range(3)
+    ]
+    body = "\n".join(json.dumps(line) for line in lines) + "\n{not json\n"
+    response = client.post(
+        "/api/payments/import", content=body, headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["rejected"]) == (3, 1)
+    assert report["rejects"][0]["line"] == 4
+
+    assert client.post("/api/payments/import", content="x").status_code == 400
@@ -0,0 +1,148 @@
+"""Tests for the cached origination rollups."""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from app.models import Borrower, Loan, LoanStatus, OriginationRollup
+from app.rollups import invalidate_rollups, origination_series
+from app.transitions import transition_loans
+
+NOW = datetime(2026, 3, 3, 12, tzinfo=timezone.utc)
+
+
+def add_loans(db, borrower, *loans):
+    for created_at, amount, status, currency in loans:
+        db.add(
+            Loan(
+                borrower_id=borrower.id,
+                amount=Decimal(amount),
+                currency=currency,
+                term_months=6,
+                interest_rate_apr=Decimal("12.00"),
+                status=status,
+                created_at=created_at,
+            )
+        )
+    db.commit()
+
+
+def test_origination_series_buckets_and_slices(db):
+    borrower = Borrower(name="Njeri", email="njeri@example.com")
+    db.add(borrower)
+    db.commit()
+    add_loans(
+        db,
+        borrower,
+        (datetime(2026, 3, 1, 9, tzinfo=timezone.utc), "100.00", LoanStatus.PENDING, "KES"),
+        (datetime(2026, 3, 1, 17, tzinfo=timezone.utc), "300.00", LoanStatus.APPROVED, "KES"),
+        (datetime(2026, 3, 1, 23, tzinfo=timezone.utc), "200.00", LoanStatus.APPROVED, "USD"),
+        (datetime(2026, 3, 3, 8, tzinfo=timezone.utc), "50.00", LoanStatus.PENDING, "KES"),
+    )
+
+    series = origination_series(
+        db, "day", datetime(2026, 3, 1, tzinfo=timezone.utc), NOW, now=NOW
+    )
+    first, empty, today = series["buckets"]
+
+    assert first["closed"] and empty["closed"] and not today["closed"]
+    assert first["loan_count"] == 3
+    assert first["total_amount"] == 600.0
+    assert first["p50_amount"] == 200.0
+    assert first["by_status"]["approved"]["loan_count"] == 2
+    assert first["by_status"]["approved"]["total_amount"] == 500.0
+    assert first["by_currency"]["USD"]["p90_amount"] == 200.0
+    assert empty["loan_count"] == 0 and empty["by_status"] == {}
+    assert today["loan_count"] == 1
+
+    # Only the two closed days are cached; the open day is always recomputed.
+    periods = db.scalars(select(func.count(func.distinct(OriginationRollup.period_start))))
+    assert periods.one() == 2
+
+    add_loans(db, borrower, (datetime(2026, 3, 3, 9, tzinfo=timezone.utc), "70.00", LoanStatus.PENDING, "KES"))
+    again = origination_series(
+        db, "day", datetime(2026, 3, 1, tzinfo=timezone.utc), NOW, now=NOW
+    )
+    assert again["buckets"][:2] == series["buckets"][:2]
+    assert again["buckets"][2]["loan_count"] == 2
+
+    # A loan inserted into a cached period drops it
+    add_loans(db, borrower, (datetime(2026, 3, 1, 10, tzinfo=timezone.utc), "10.00", LoanStatus.PENDING, "KES"))
+    fresh = origination_series(
+        db, "day", datetime(2026, 3, 1, tzinfo=timezone.utc), NOW, now=NOW
+    )
+    assert fresh["buckets"][0]["loan_count"] == 4
+    assert invalidate_rollups(db, "day") > 0
+
+
+def test_buckets_are_cached_only_after_the_settle_delay(db):
+    borrower = Borrower(name="Kamau", email="kamau@example.com")
+    db.add(borrower)
+    db.commit()
+    start = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    just_ended = datetime(2026, 3, 2, 0, 1, tzinfo=timezone.utc)
+
+    series = origination_series(db, "day", start, just_ended, now=just_ended, settle=timedelta(minutes=5))
+    assert series["buckets"][0]["closed"]
+    assert db.scalar(select(func.count()).select_from(OriginationRollup)) == 0
+
+    # Committed after the day ended, created (from its id) before
+    add_loans(db, borrower, (datetime(2026, 3, 1, 23, 59, 59, tzinfo=timezone.utc), "10.00", LoanStatus.PENDING, "KES"))
+    later = just_ended + timedelta(minutes=10)
+    assert origination_series(db, "day", start, later, now=later, settle=timedelta(minutes=5))["buckets"][0]["loan_count"] == 1
+    assert db.scalar(select(func.count()).select_from(OriginationRollup)) > 0
+
+
+def test_status_changes_drop_cached_buckets(db):
+    borrower = Borrower(name="Achieng", email="achieng@example.com")
+    db.add(borrower)
+    db.commit()
+    created_at = datetime(2026, 3, 1, 9, tzinfo=timezone.utc)
+    add_loans(
+        db,
+        borrower,
+        (created_at, "100.00", LoanStatus.PENDING, "KES"),
+        (created_at, "200.00", LoanStatus.PENDING, "KES"),
+    )
+    first, second = db.scalars(select(Loan).order_by(Loan.amount)).all()
+
+    def by_status():
+        series = origination_series(db, "day", created_at, NOW, now=NOW)
+        return {status: slice_["loan_count"] for status, slice_ in series["buckets"][0]["by_status"].items()}
+
+    assert by_status() == {"pending": 2}
+    [result] = transition_loans(db, [(first.id, first.version, LoanStatus.APPROVED)])
+    assert result["result"] == "applied"
+    db.commit()
+    assert by_status() == {"pending": 1, "approved": 1}
+
+    def month_by_status():
+        series = origination_series(db, "month", created_at, NOW, now=datetime(2026, 4, 2, tzinfo=timezone.utc))
+        return {status: slice_["loan_count"] for status, slice_ in series["buckets"][0]["by_status"].items()}
+
+    assert month_by_status() == {"pending": 1, "approved": 1}
+    second.status = LoanStatus.REJECTED
+    db.commit()
+    # Dropped at every granularity
+    assert by_status() == month_by_status() == {"approved": 1, "rejected": 1}
+
+
+def test_origination_series_month_and_week_buckets(db):
+    series = origination_series(
+        db, "month", datetime(2025, 11, 15, tzinfo=timezone.utc), NOW, now=NOW
+    )
+    assert [b["period_start"][:10] for b in series["buckets"]] == [
+        "2025-11-01", "2025-12-01", "2026-01-01", "2026-02-01", "2026-03-01",
+    ]
+    week = origination_series(
+        db, "week", datetime(2026, 3, 1, tzinfo=timezone.utc), NOW, now=NOW
+    )
+    # 2026-03-01 is a Sunday, so the range starts on the Monday before it.
+    assert week["buckets"][0]["period_start"][:10] == "2026-02-23"
+
+
+def test_originations_endpoint_rejects_bad_ranges(client):
+    assert client.get("/api/stats/originations", params={"granularity": "month"}).status_code == 200
+    assert client.get("/api/stats/originations", params={"granularity": "hour"}).status_code == 400
+    too_long = {"granularity": "day", "start": "2000-01-01T00:00:00Z"}
+    assert client.get("/api/stats/originations", params=too_long).status_code == 400
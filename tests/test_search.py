@@ -0,0 +1,73 @@
+"""Tests for borrower and loan purpose search."""
+from decimal import Decimal
+
+import pytest
+
+from app.models import Borrower, Loan
+from app.search import search_borrowers, search_loans
+
+
+@pytest.fixture
+def borrowers(db):
+    borrowers = [
+        Borrower(name="Grace Wanjiku", email="grace.w@example.com", phone="+254700111222"),
+        Borrower(name="Wanjiku Mwangi", email="wmwangi@example.org", phone="+254711999000"),
+        Borrower(name="Peter Otieno", email="potieno@example.com"),
+    ]
+    db.add_all(borrowers)
+    db.flush()
+    db.add_all(
+        Loan(borrower_id=borrowers[0].id, amount=Decimal(amount), currency="KES", term_months=6, interest_rate_apr=12, purpose=purpose)
+        for amount, purpose in (
+            ("500.00", "School fees for two children"),
+            ("800.00", "Schooling supplies and uniforms"),
+            ("900.00", "Dairy cow"),
+        )
+    )
+    db.commit()
+    return borrowers
+
+
+def test_search_borrowers_by_substring(db, borrowers):
+    assert {r["name"] for r in search_borrowers(db, "anjik")} == {"Grace Wanjiku", "Wanjiku Mwangi"}
+    assert [r["name"] for r in search_borrowers(db, "example.org")] == ["Wanjiku Mwangi"]
+    assert [r["name"] for r in search_borrowers(db, "711999")] == ["Wanjiku Mwangi"]
+    assert search_borrowers(db, "wa") == []
+    assert len(search_borrowers(db, "example", limit=2)) == 2
+
+    # The index follows updates
+    borrowers[2].name = "Peter Kamau"
+    db.commit()
+    assert [r["name"] for r in search_borrowers(db, "kamau")] == ["Peter Kamau"]
+
+
+def test_postgres_keeps_the_most_similar_candidates(db_connection, db, borrowers):
+    if db_connection.dialect.name != "postgresql":
+        pytest.skip("TEST_DATABASE_URL is not a PostgreSQL database")
+    # Inserted last, so a sequential scan finds the other matches first
+    db.add(Borrower(name="Wanjiku", email="wanjiku@example.net"))
+    db.commit()
+
+    assert [r["name"] for r in search_borrowers(db, "wanjiku", limit=1, candidates=1)] == ["Wanjiku"]
+
+
+def test_search_loans_by_purpose_words(db, borrowers):
+    results = search_loans(db, "school")
+    assert {r["purpose"] for r in results} == {"School fees for two children", "Schooling supplies and uniforms"}
+    assert [r["purpose"] for r in search_loans(db, "fees SCHOOL")] == ["School fees for two children"]
+    assert search_loans(db, "tractor") == []
+    assert search_loans(db, "'*") == []
+
+
+def test_search_endpoints(client, borrowers):
+    response = client.get("/api/borrowers/search", params={"q": "otieno"})
+    assert response.status_code == 200
+    (result,) = response.json()["results"]
+    assert result["email"] == "potieno@example.com"
+    assert result["score"] > 0
+
+    response = client.get("/api/loans/search", params={"q": "dairy"})
+    assert [r["amount"] for r in response.json()["results"]] == ["900.00"]
+
+    assert client.get("/api/borrowers/search", params={"q": "ab"}).status_code == 422
+    assert client.get("/api/loans/search", params={"q": "dairy", "limit": 1000}).status_code == 422
@@ -0,0 +1,233 @@
+"""Tests for routing loans across database shards."""
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import archive, create_app, decisioning
+from app.db import Base, get_db
+from app.models import Borrower, Loan, LoanStatus, OutboxEvent, Payment, PaymentStatus
+from app.partitions import uuid7, uuid_tag
+from app.sharding import ShardRouter, get_shard_router
+
+
+def _sqlite_session_factory():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def shard_factories():
+    return {0: _sqlite_session_factory(), 1: _sqlite_session_factory()}
+
+
+@pytest.fixture
+def router(shard_factories):
+    return ShardRouter(shard_factories, {"KES": 0, "INR": 1})
+
+
+@pytest.fixture
+def borrower_id(shard_factories):
+    # Borrowers are reference data present on every shard
+    borrower_id = uuid.uuid4()
+    for factory in shard_factories.values():
+        with factory() as db:
+            db.add(Borrower(id=borrower_id, name="Asha", email="asha@example.com"))
+            db.commit()
+    return borrower_id
+
+
+@pytest.fixture
+def client(router):
+    app = create_app()
+    default = _sqlite_session_factory()
+
+    def override_get_db():
+        db = default()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_shard_router] = lambda: router
+    return TestClient(app)
+
+
+def _create(client, borrower_id, amount, currency):
+    response = client.post(
+        "/api/loans/",
+        json={"borrower_id": str(borrower_id), "amount": amount, "currency": currency, "term_months": 6, "interest_rate_apr": 12},
+    )
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def test_shard_for_uses_currency_map_then_borrower_hash(router):
+    assert router.shard_for("kes", "b1") == 0
+    assert router.shard_for("INR", "b1") == 1
+    assert router.shard_for("USD", "b1") == router.shard_for("EUR", "b1")
+    assert router.shard_for_loan(uuid7(tag=1)) == 1
+    assert router.shard_for_loan(uuid.uuid4()) is None
+    assert uuid_tag(uuid7(tag=5)) == 5
+    with pytest.raises(ValueError, match="unknown shards"):
+        ShardRouter({0: sessionmaker()}, {"KES": 3})
+
+
+def test_loans_are_written_to_and_read_from_their_shard(client, shard_factories, borrower_id):
+    kes = _create(client, borrower_id, 100, "KES")
+    inr = _create(client, borrower_id, 300, "INR")
+    assert uuid_tag(uuid.UUID(kes["id"])) == 0
+    assert uuid_tag(uuid.UUID(inr["id"])) == 1
+
+    with shard_factories[1]() as db:
+        assert db.scalars(select(Loan.id)).all() == [uuid.UUID(inr["id"])]
+        assert db.scalars(select(OutboxEvent.aggregate_id)).all() == [uuid.UUID(inr["id"])]
+
+    response = client.get(f"/api/loans/{inr['id']}")
+    assert response.status_code == 200
+    assert response.json()["currency"] == "INR"
+    assert client.get(f"/api/loans/{inr['id']}?fields=amount").json() == {"id": inr["id"], "amount": "300.00"}
+    assert client.get(f"/api/loans/{kes['id']}/detail").json()["borrower"]["name"] == "Asha"
+    assert client.get(f"/api/loans/{uuid7(tag=0)}").status_code == 404
+
+
+def test_list_and_stats_scatter_gather(client, borrower_id):
+    created = [
+        _create(client, borrower_id, amount, currency)
+        for amount, currency in ((100, "KES"), (300, "INR"), (200, "KES"))
+    ]
+
+    listed = client.get("/api/loans/?fields=amount,created_at").json()
+    assert {loan["id"] for loan in listed} == {loan["id"] for loan in created}
+    assert [loan["created_at"] for loan in listed] == sorted((loan["created_at"] for loan in listed), reverse=True)
+    assert set(client.get("/api/loans/?fields=currency").json()[0]) == {"id", "currency"}
+
+    stats = client.get("/api/stats/?include_archived=false").json()
+    assert stats["total_loans"] == 3
+    assert stats["total_amount"] == 600.0
+    assert stats["avg_amount"] == 200.0
+    assert stats["by_currency"] == {"KES": 2, "INR": 1}
+    assert stats["by_status"] == {"pending": 3}
+
+
+def test_batch_get_across_shards_and_untagged_ids(client, shard_factories, borrower_id):
+    kes = _create(client, borrower_id, 100, "KES")
+    inr = _create(client, borrower_id, 300, "INR")
+    # Created before sharding: no shard in the id
+    legacy_id = uuid.uuid4()
+    with shard_factories[1]() as db:
+        db.add(Loan(id=legacy_id, borrower_id=borrower_id, amount=Decimal("50.00"), currency="USD", term_months=1, interest_rate_apr=0))
+        db.commit()
+    missing = uuid7(tag=1)
+
+    response = client.post(
+        "/api/loans/batch-get?fields=amount",
+        json={"ids": [inr["id"], str(legacy_id), kes["id"], str(missing)]},
+    )
+    assert response.json() == {
+        "loans": [
+            {"id": inr["id"], "amount": "300.00"},
+            {"id": str(legacy_id), "amount": "50.00"},
+            {"id": kes["id"], "amount": "100.00"},
+        ],
+        "missing": [str(missing)],
+    }
+    assert client.get(f"/api/loans/{legacy_id}").json()["currency"] == "USD"
+
+
+# Untagged and missing ids are tried on every shard
+@pytest.mark.query_budget(20)
+def test_transitions_are_applied_on_the_loans_shard(client, shard_factories, borrower_id):
+    kes = _create(client, borrower_id, 100, "KES")
+    inr = _create(client, borrower_id, 300, "INR")
+    legacy_id = uuid.uuid4()
+    with shard_factories[1]() as db:
+        db.add(Loan(id=legacy_id, borrower_id=borrower_id, amount=Decimal("50.00"), currency="USD", term_months=1, interest_rate_apr=0))
+        db.commit()
+
+    response = client.post(
+        f"/api/loans/{inr['id']}/transition", json={"to_status": "approved", "expected_version": 1}
+    )
+    assert response.status_code == 200, response.text
+    assert (response.json()["result"], response.json()["version"]) == ("applied", 2)
+    assert client.post(
+        f"/api/loans/{uuid7(tag=0)}/transition", json={"to_status": "approved", "expected_version": 1}
+    ).status_code == 404
+
+    missing = uuid.uuid4()
+    response = client.post("/api/loans/transitions", json={"items": [
+        {"id": kes["id"], "to_status": "rejected", "expected_version": 1},
+        {"id": str(legacy_id), "to_status": "approved", "expected_version": 1},
+        {"id": inr["id"], "to_status": "disbursed", "expected_version": 1},
+        {"id": str(missing), "to_status": "approved", "expected_version": 1},
+    ]})
+    assert [result["result"] for result in response.json()["results"]] == [
+        "applied", "applied", "conflict", "not_found",
+    ]
+
+    with shard_factories[0]() as db:
+        assert db.get(Loan, uuid.UUID(kes["id"])).status == LoanStatus.REJECTED
+    with shard_factories[1]() as db:
+        assert db.get(Loan, uuid.UUID(inr["id"])).status == LoanStatus.APPROVED
+        assert db.get(Loan, legacy_id).status == LoanStatus.APPROVED
+
+
+def test_decisioning_runs_on_every_shard(client, router, shard_factories, borrower_id, monkeypatch):
+    for amount, currency in ((100, "KES"), (300, "INR"), (200, "INR")):
+        _create(client, borrower_id, amount, currency)
+    monkeypatch.setattr(decisioning, "get_shard_router", lambda: router)
+
+    assert decisioning.decide_all_pending_loans(workers=0, limit=2)["scored"] == 2
+    report = decisioning.decide_all_pending_loans(workers=0)
+    assert report["scored"] == 1
+    assert report["approved"] + report["rejected"] == 1
+    for factory in shard_factories.values():
+        with factory() as db:
+            assert db.scalars(select(Loan.id).where(Loan.status == LoanStatus.PENDING)).all() == []
+
+
+def test_single_database_endpoints_are_rejected(client):
+    assert client.get("/api/stats/portfolio").status_code == 501
+    assert client.get("/api/stats/originations").status_code == 501
+    response = client.post("/api/payments/import?format=csv", content=b"loan_id,amount\n")
+    assert response.status_code == 501
+
+
+def test_exposure_is_merged_across_shards(client, shard_factories, borrower_id):
+    kes = _create(client, borrower_id, 100, "KES")
+    inr = _create(client, borrower_id, 300, "INR")
+    for loan in (kes, inr):
+        client.post(f"/api/loans/{loan['id']}/transition", json={"to_status": "approved", "expected_version": 1})
+    with shard_factories[1]() as db:
+        db.add(Payment(loan_id=uuid.UUID(inr["id"]), amount=Decimal("100.00"), due_date=datetime.now(timezone.utc), status=PaymentStatus.OVERDUE))
+        db.commit()
+
+    exposure = client.get(f"/api/borrowers/{borrower_id}/exposure").json()
+    assert Decimal(exposure["outstanding_amount"]) == Decimal("400.00")
+    assert exposure["active_loan_count"] == 2
+    assert exposure["worst_payment_status"] == "overdue"
+    assert client.get(f"/api/borrowers/{uuid.uuid4()}/exposure").status_code == 404
+
+
+def test_archive_loans_covers_every_shard(client, router, shard_factories, borrower_id, tmp_path, monkeypatch):
+    ids = []
+    for currency in ("KES", "INR"):
+        loan = _create(client, borrower_id, 100, currency)
+        client.post(f"/api/loans/{loan['id']}/transition", json={"to_status": "rejected", "expected_version": 1})
+        ids.append(loan["id"])
+    monkeypatch.setattr(archive, "get_shard_router", lambda: router)
+
+    assert archive.archive_loans(directory=str(tmp_path), min_age=timedelta(0)) == 2
+    for factory in shard_factories.values():
+        with factory() as db:
+            assert db.scalars(select(Loan.id)).all() == []
+    assert set(archive.LoanArchive(str(tmp_path)).get_many([uuid.UUID(i) for i in ids])) == {uuid.UUID(i) for i in ids}
@@ -0,0 +1,109 @@
+"""Tests for optimistic-concurrency loan status transitions."""
+import uuid
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models import BorrowerExposure, Loan, LoanStatus, OutboxEvent
+from app.outbox import LOAN_STATUS_CHANGED
+from app.transitions import is_allowed
+
+
+@pytest.fixture
+def loans(session_factory, borrower, make_loan):
+    db = session_factory()
+    loans = [make_loan(borrower, amount) for amount in ("100.00", "200.00", "300.00")]
+    db.add_all(loans)
+    db.commit()
+    db.close()
+    return loans
+
+
+def test_state_machine():
+    assert is_allowed(LoanStatus.PENDING, LoanStatus.APPROVED)
+    assert is_allowed(LoanStatus.APPROVED, LoanStatus.DISBURSED)
+    assert is_allowed(LoanStatus.DISBURSED, LoanStatus.REPAID)
+    assert not is_allowed(LoanStatus.PENDING, LoanStatus.DISBURSED)
+    assert not is_allowed(LoanStatus.REPAID, LoanStatus.PENDING)
+
+
+def test_single_transition_checks_version_and_state_machine(client, loans):
+    loan = loans[0]
+    response = client.post(
+        f"/api/loans/{loan.id}/transition", json={"to_status": "approved", "expected_version": 1}
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "id": str(loan.id),
+        "result": "applied",
+        "from_status": "pending",
+        "status": "approved",
+        "version": 2,
+    }
+
+    stale = client.post(
+        f"/api/loans/{loan.id}/transition", json={"to_status": "disbursed", "expected_version": 1}
+    )
+    assert stale.status_code == 409
+    assert stale.json()["detail"]["version"] == 2
+
+    illegal = client.post(
+        f"/api/loans/{loan.id}/transition", json={"to_status": "pending", "expected_version": 2}
+    )
+    assert illegal.status_code == 422
+    assert illegal.json()["detail"]["result"] == "invalid_transition"
+
+    missing = client.post(
+        f"/api/loans/{uuid.uuid4()}/transition", json={"to_status": "approved", "expected_version": 1}
+    )
+    assert missing.status_code == 404
+
+
+def test_bulk_transition_reports_per_item_results(client, loans, session_factory):
+    first, second, third = loans
+    unknown = uuid.uuid4()
+    response = client.post(
+        "/api/loans/transitions",
+        json={
+            "items": [
+                {"id": str(first.id), "to_status": "approved", "expected_version": 1},
+                {"id": str(second.id), "to_status": "approved", "expected_version": 3},
+                {"id": str(third.id), "to_status": "repaid", "expected_version": 1},
+                {"id": str(unknown), "to_status": "approved", "expected_version": 1},
+                {"id": str(first.id), "to_status": "rejected", "expected_version": 1},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["applied"], body["failed"]) == (1, 4)
+    assert [r["result"] for r in body["results"]] == [
+        "applied", "conflict", "invalid_transition", "not_found", "conflict",
+    ]
+
+    db = session_factory()
+    rows = {row.id: row for row in db.execute(select(Loan.id, Loan.status, Loan.version))}
+    assert (rows[first.id].status, rows[first.id].version) == (LoanStatus.APPROVED, 2)
+    assert (rows[second.id].status, rows[second.id].version) == (LoanStatus.PENDING, 1)
+
+    # Exposure and outbox are maintained although the ORM flush was bypassed
+    exposure = db.get(BorrowerExposure, first.borrower_id)
+    assert exposure.active_loan_count == 1
+    assert exposure.outstanding_amount == Decimal("100.00")
+    event = db.scalar(select(OutboxEvent).where(OutboxEvent.event_type == LOAN_STATUS_CHANGED))
+    assert event.payload["to_status"] == "approved"
+
+
+def test_orm_updates_are_version_checked(session_factory, loans):
+    first, second = session_factory(), session_factory()
+    mine = first.get(Loan, loans[0].id)
+    theirs = second.get(Loan, loans[0].id)
+    theirs.status = LoanStatus.APPROVED
+    second.commit()
+    assert theirs.version == 2
+
+    mine.status = LoanStatus.REJECTED
+    with pytest.raises(StaleDataError):
+        first.commit()